@@ -1,20 +1,89 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+import re
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from util.batch_sizer import AdaptiveBatchSizer
+from util.metrics import metrics
+
+
+class BatchRequestError(Exception):
+    def __init__(self, endpoint, ids, cause):
+        """
+        Raised when a batched by-id request fails.
+        
+        :param endpoint: API endpoint the batch was sent to
+        :param ids: The ids contained in the failed batch
+        :param cause: The underlying exception
+        """
+        super().__init__(f"Request to {endpoint} failed for ids {ids}: {cause}")
+        self.endpoint = endpoint
+        self.ids = ids
+        self.cause = cause
+
 
 class StackOverflow:
-    def __init__(self, api_url, api_token, from_date=None, cert_path=None):
+    # statuses that mean the key was rejected, usually because it was rotated
+    AUTH_FAILURE_STATUSES = (401, 403)
+    # all id discovery reads from a listing: the id, what the tag filter matches on and what watermarks compare
+    STUB_FIELDS = {"question": ("question_id", "tags", "last_activity_date"),
+                   "article": ("article_id", "tags", "last_activity_date")}
+    # what the answer merge compares against stored records: edits and scores, without any bodies
+    CHANGE_FIELDS = {"question": ("question_id", "tags", "score", "last_activity_date", "last_edit_date"),
+                     "answer": ("answer_id", "question_id", "score", "is_accepted", "creation_date",
+                                "last_activity_date", "last_edit_date")}
+    # wrapper fields pagination and quota tracking read; a "none" base filter drops them too
+    WRAPPER_FIELDS = (".items", ".has_more", ".quota_remaining", ".backoff")
+
+    def __init__(self, api_url, api_token, cert_path=None, max_workers=4, token_provider=None, http_cache=None,
+                 batch_sizer_factory=AdaptiveBatchSizer, scheduler=None):
         """
         Initialize the StackOverflow API client.
         
         :param api_url: Base URL for the StackOverflow API
         :param api_token: API token for authentication
+        :param max_workers: Maximum number of batch requests in flight at once
+        :param token_provider: Optional callable taking the rejected token and returning a fresh one;
+            a request rejected with 401/403 is retried once with the new token
+        :param http_cache: Optional HttpCache every GET goes through
+        :param batch_sizer_factory: Callable returning a new AdaptiveBatchSizer, one per by-id endpoint
+        :param scheduler: Optional RequestScheduler every request waits on; it also enables retries of
+            throttled, rate-limited and failed requests
         """
         self.api_url = api_url
         self.api_token = api_token
+        self.token_provider = token_provider
+        self.http_cache = http_cache
+        self.scheduler = scheduler
         # self.headers = {"Authorization": f"Bearer {self.api_token}"}
         self.articles_with_body_filter = "!nNPvSNW(gA" # from sample API requests
-        self.from_date_filter = f"fromdate={from_date}" if from_date else None
         self.questions_with_answers_and_body_filter = "!6WPIomnMNcVD9" # from sample api requests
         self.cert_path = cert_path
+        self.max_workers = max(1, int(max_workers))
+        self.batch_sizer_factory = batch_sizer_factory
+        # by endpoint template: answers run many to a question, so each endpoint learns its own batch size
+        self.batch_sizers = {}
+        # stub filters by item type, created on first use; filters never change so warm invocations reuse them
+        self.stub_filters = {}
+        # one keep-alive session for every call, pool sized to the worker count
+        self.session = requests.Session()
+        self.session.verify = self.cert_path
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def set_api_token(self, api_token):
+        self.api_token = api_token
+
+    def _send(self, url, params, method=None):
+        # replayed responses never reach the API, so they don't wait on the rate limit
+        if self._scheduled():
+            self.scheduler.acquire(method)
+        if self.http_cache is not None:
+            return self.http_cache.get(self.session, url, params=params, timeout=30)
+        return self.session.get(url, params=params, timeout=30)
 
     def build_query_params(self, params):
         """
@@ -24,9 +93,6 @@ class StackOverflow:
         :return: A dictionary of query parameters
         """
         query_params = {"key": self.api_token}
-        # Automatically add the date filter if provided
-        if self.from_date_filter:
-            query_params["fromdate"] = self.from_date_filter.split("=")[1]
 
         # Add other parameters
         if params is not None:
@@ -34,12 +100,13 @@ class StackOverflow:
 
         return query_params
 
-    def _make_request(self, endpoint, params=None):
+    def _make_request(self, endpoint, params=None, stats=None):
         """
         Helper method to make a GET request to the API.
         
         :param endpoint: API endpoint to call
         :param params: Query parameters for the request
+        :param stats: Optional dict the response size in bytes is stored in, under "bytes"
         :return: JSON response from the API
         """
         url = f"{self.api_url}/{endpoint}"
@@ -51,32 +118,297 @@ class StackOverflow:
         #     query_params = self.build_query_params(params)
         else:
             query_params = self.build_query_params(params)
-        response = requests.get(url, params=query_params, verify=self.cert_path, timeout=30)
+        method = self._method(endpoint)
+        refreshed = False
+        attempt = 0
+        while True:
+            try:
+                with metrics.timer("so.request_ms"):
+                    response = self._send(url, query_params, method)
+            except (requests.ConnectionError, requests.Timeout):
+                if not self._scheduled() or attempt >= self.scheduler.max_retries:
+                    raise
+                metrics.incr("so.retries")
+                self.scheduler.sleep(self.scheduler.retry_delay(attempt))
+                attempt += 1
+                continue
+            metrics.incr("so.requests")
+            if (response.status_code in self.AUTH_FAILURE_STATUSES and self.token_provider is not None
+                    and query_params is not None and not refreshed):
+                metrics.incr("so.auth_refreshes")
+                self.api_token = self.token_provider(query_params["key"])
+                query_params["key"] = self.api_token
+                refreshed = True
+                continue
+            if not self._scheduled() or attempt >= self.scheduler.max_retries or not self._retry(response, attempt):
+                break
+            attempt += 1
+        metrics.incr("so.response_bytes", len(response.content), unit="Bytes")
+        if stats is not None:
+            stats["bytes"] = len(response.content)
+        if not response.ok:
+            metrics.incr("so.request_errors")
         response.raise_for_status()
-        return response.json()
+        data = response.json()
+        if "quota_remaining" in data:
+            metrics.gauge("so.quota_remaining", data["quota_remaining"], unit="Count")
+        if self.scheduler is not None:
+            self.scheduler.observe(method, data)
+        return data
+
+    def _scheduled(self):
+        return self.scheduler is not None and (self.http_cache is None or self.http_cache.mode != "replay")
 
-    def get_questions(self, page_size=100):
+    @staticmethod
+    def _method(endpoint):
+        # backoff applies per method, whatever ids a call carries
+        return "/".join("{ids}" if part[:1].isdigit() else part for part in endpoint.split("/"))
+
+    def _retry(self, response, attempt):
         """
-        Get all questions from the API, handling pagination.
+        Wait before retrying a request the API turned away.
+        
+        A throttle violation or 429 pauses every request, not just this one, for
+        at least as long as the API asked; a 5xx only delays this request.
         
+        :param response: The response
+        :param attempt: Retries made so far
+        :return: True if the request should be sent again
+        """
+        if response.status_code >= 500:
+            metrics.incr("so.retries")
+            self.scheduler.sleep(self.scheduler.retry_delay(attempt))
+            return True
+        if response.status_code == 429:
+            try:
+                minimum = float(response.headers.get("Retry-After") or 0)
+            except ValueError:
+                minimum = 0.0
+        elif response.status_code == 400:
+            try:
+                error = response.json()
+            except ValueError:
+                return False
+            if error.get("error_name") != "throttle_violation":
+                return False
+            match = re.search(r"(\d+) seconds", error.get("error_message") or "")
+            minimum = float(match.group(1)) if match else 0.0
+        else:
+            return False
+        metrics.incr("so.retries")
+        metrics.incr("so.throttle_violations")
+        self.scheduler.pause(self.scheduler.retry_delay(attempt, minimum))
+        return True
+
+    def stub_filter(self, item_type):
+        """
+        Get the minimal listing filter carrying only the STUB_FIELDS of an item type.
+        
+        :param item_type: "question" or "article"
+        :return: The filter string, created through filters/create on first use
+        """
+        return self._fields_filter(item_type, item_type, self.STUB_FIELDS[item_type])
+
+    def change_filter(self, item_type):
+        """
+        Get the listing filter carrying only the CHANGE_FIELDS of an item type.
+        
+        :param item_type: "question" or "answer"
+        :return: The filter string, created through filters/create on first use
+        """
+        return self._fields_filter(f"{item_type}:changes", item_type, self.CHANGE_FIELDS[item_type])
+
+    def _fields_filter(self, name, item_type, fields):
+        stub_filter = self.stub_filters.get(name)
+        if stub_filter is None:
+            include = self.WRAPPER_FIELDS + tuple(f"{item_type}.{field}" for field in fields)
+            data = self._make_request("filters/create", {"include": ";".join(include), "base": "none",
+                                                         "unsafe": "false"})
+            stub_filter = self.stub_filters[name] = data["items"][0]["filter"]
+        return stub_filter
+
+    def _count(self, endpoint, params=None):
+        query = dict(params or {})
+        query["filter"] = "total"
+        return self._make_request(endpoint, query)["total"]
+
+    def count_questions(self, params=None):
+        """
+        Count the questions a listing would return, in one request that carries no items.
+        
+        :param params: Listing query parameters, e.g. {"tagged": "terraform"} and an activity window
+        :return: Number of matching questions
+        """
+        return self._count("questions", params)
+
+    def count_articles(self, params=None):
+        """
+        Count the articles a listing would return, in one request that carries no items.
+        
+        :param params: Listing query parameters, e.g. {"tagged": "terraform"} and an activity window
+        :return: Number of matching articles
+        """
+        return self._count("articles", params)
+
+    @staticmethod
+    def activity_params(since, until=None):
+        """
+        Listing parameters selecting items active since a timestamp.
+        
+        min/max follow the sort field, so with sort=activity this matches on
+        last_activity_date and picks up edits and new answers, not just new posts.
+        
+        :param since: Epoch seconds, inclusive
+        :param until: Optional epoch seconds, exclusive
+        :return: A dictionary of query parameters
+        """
+        params = {"sort": "activity", "order": "asc", "min": since}
+        if until is not None:
+            # max is inclusive
+            params["max"] = until - 1
+        return params
+
+    def _iter_pages(self, endpoint, page_size, params, listing_filter=None, cursor=None):
+        """
+        Yield items from a paginated listing endpoint one page at a time.
+        
+        :param endpoint: API endpoint to list
         :param page_size: Number of items per page
-        :return: List of questions
+        :param params: Extra query parameters
+        :param listing_filter: API filter for the listing, defaults to articles_with_body_filter
+        :param cursor: Optional ListingCursor; listing starts at its page, keeps it pointing at the
+            next unfetched page and stops before a fetch once it says so
+        :return: Generator of items
         """
-        questions = []
-        page = 0
+        page = cursor.page if cursor is not None else 1
         has_more = True
 
-        while has_more:  # limit to first 10 pages for testing
-            params = {"pagesize": page_size}
-            if page > 0:
-                params["page"] = page
-            params["filter"] = self.articles_with_body_filter
-            data = self._make_request("questions", params)
-            questions.extend(data.get("items", []))
+        while has_more:
+            if cursor is not None:
+                cursor.page = page
+                if cursor.should_stop():
+                    return
+            query = dict(params or {})
+            query["pagesize"] = page_size
+            query["page"] = page
+            query["filter"] = listing_filter or self.articles_with_body_filter
+            data = self._make_request(endpoint, query)
+            yield from data.get("items", [])
             has_more = data.get("has_more", False)
             page += 1
 
-        return questions
+    def _batch_sizer(self, endpoint_template):
+        sizer = self.batch_sizers.get(endpoint_template)
+        if sizer is None:
+            sizer = self.batch_sizers[endpoint_template] = self.batch_sizer_factory()
+        return sizer
+
+    def _iter_batches(self, endpoint_template, ids, params):
+        """
+        Fetch items by id in batches, running up to max_workers batches concurrently.
+        
+        Ids are consumed lazily, so a batch is sent as soon as it is full. Batch
+        sizes come from the endpoint's AdaptiveBatchSizer, which learns from each
+        batch's items, bytes, time and quota_remaining. A batch whose items
+        overflow a page is followed through has_more, so nothing is truncated.
+        Items are yielded in the same batch order as ids.
+        
+        :param endpoint_template: Endpoint with an ``{ids}`` placeholder for the joined ids
+        :param ids: Iterable of ids to fetch
+        :param params: Query parameters sent with every batch
+        :return: Generator of items
+        :raises BatchRequestError: If a batch fails; carries the ids of that batch
+        """
+        sizer = self._batch_sizer(endpoint_template)
+        params = dict(params, pagesize=sizer.page_size)
+
+        def fetch(batch):
+            endpoint = endpoint_template.format(ids=";".join(map(str, batch)))
+            items = []
+            response_bytes = 0
+            quota_remaining = None
+            started = time.perf_counter()
+            page = 1
+            try:
+                while True:
+                    stats = {}
+                    data = self._make_request(endpoint, params=dict(params, page=page), stats=stats)
+                    items.extend(data.get("items", []))
+                    response_bytes += stats["bytes"]
+                    quota_remaining = data.get("quota_remaining", quota_remaining)
+                    if not data.get("has_more"):
+                        break
+                    metrics.incr("so.batch_overflow_pages")
+                    page += 1
+            except requests.RequestException as e:
+                raise BatchRequestError(endpoint_template, batch, e) from e
+            sizer.observe(len(batch), len(items), response_bytes, time.perf_counter() - started, quota_remaining)
+            metrics.observe("so.batch_ids", len(batch), unit="Count")
+            return items
+
+        # the URL without ids, with room for a multi-digit page number
+        base_url_chars = len(f"{self.api_url}/{endpoint_template.format(ids='')}?") + len(
+            urlencode(self.build_query_params(dict(params, page=100))))
+        batches = sizer.batches(ids, base_url_chars)
+        if self.max_workers == 1:
+            for batch in batches:
+                yield from fetch(batch)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = deque()
+            for batch in batches:
+                pending.append(executor.submit(fetch, batch))
+                # hand back finished batches without waiting on the rest of the ids
+                while pending and (pending[0].done() or len(pending) >= self.max_workers):
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+
+    def iter_questions(self, page_size=100, params=None, listing_filter=None, cursor=None):
+        """
+        Stream all questions from the API, handling pagination.
+        
+        :param page_size: Number of items per page
+        :param params: Extra query parameters, e.g. {"tagged": "terraform"}
+        :param listing_filter: API filter for the listing, defaults to articles_with_body_filter
+        :param cursor: Optional ListingCursor to resume from and advance
+        :return: Generator of questions
+        """
+        return self._iter_pages("questions", page_size, params, listing_filter, cursor)
+
+    def iter_question_stubs(self, page_size=100, params=None, cursor=None):
+        """
+        Stream questions carrying only their id, tags and last_activity_date, for id discovery.
+        
+        :param page_size: Number of items per page
+        :param params: Extra query parameters, e.g. {"tagged": "terraform"}
+        :param cursor: Optional ListingCursor to resume from and advance
+        :return: Generator of question stubs
+        """
+        return self.iter_questions(page_size, params, self.stub_filter("question"), cursor)
+
+    def iter_question_changes(self, page_size=100, params=None, cursor=None):
+        """
+        Stream questions carrying only the fields the answer merge compares, see CHANGE_FIELDS.
+        
+        :param page_size: Number of items per page
+        :param params: Extra query parameters, e.g. {"tagged": "terraform"} and an activity window
+        :param cursor: Optional ListingCursor to resume from and advance
+        :return: Generator of question change stubs
+        """
+        return self.iter_questions(page_size, params, self.change_filter("question"), cursor)
+
+    def get_questions(self, page_size=100, params=None, listing_filter=None):
+        """
+        Get all questions from the API, handling pagination.
+        
+        :param page_size: Number of items per page
+        :param params: Extra query parameters, e.g. {"tagged": "terraform"}
+        :param listing_filter: API filter for the listing, defaults to articles_with_body_filter
+        :return: List of questions
+        """
+        return list(self.iter_questions(page_size, params, listing_filter))
     
     def get_questions_answers(self, question_ids, page_size=100):
         """
@@ -85,72 +417,115 @@ class StackOverflow:
         :param page_size: Number of items per page
         :return: List of questions
         """
-        answers = []
-        batch_size = 25
+        ## uses a diff filter for body
+        return list(self._iter_batches("questions/{ids}/answers", question_ids, {'filter': 'withbody'}))
+
+    def iter_answer_changes(self, question_ids):
+        """
+        Stream every answer of the given questions, carrying only the CHANGE_FIELDS and no bodies.
+        
+        :param question_ids: Iterable of question IDs, consumed lazily
+        :return: Generator of answer change stubs
+        :raises BatchRequestError: If a batch fails; carries the ids of that batch
+        """
+        return self._iter_batches("questions/{ids}/answers", question_ids, {"filter": self.change_filter("answer")})
+
+    def iter_answers_by_ids(self, answer_ids):
+        """
+        Stream answers with their bodies by their IDs, in adaptively sized batches.
+        
+        :param answer_ids: Iterable of answer IDs, consumed lazily
+        :return: Generator of answers
+        :raises BatchRequestError: If a batch fails; carries the ids of that batch
+        """
+        return self._iter_batches("answers/{ids}", answer_ids, {"filter": "withbody"})
 
-        for i in range(0, len(question_ids), batch_size):
-            batch = question_ids[i:i + batch_size]
-            ids_param = ";".join(map(str, batch))
-            ## uses a diff filter for body
-            data = self._make_request(f"questions/{ids_param}/answers", params={'filter': 'withbody'})
-            answers.extend(data.get("items", []))
-        return answers
+    def iter_articles(self, page_size=100, params=None, listing_filter=None, cursor=None):
+        """
+        Stream all articles from the API, handling pagination.
+        
+        :param page_size: Number of items per page
+        :param params: Extra query parameters, e.g. {"tagged": "terraform"}
+        :param listing_filter: API filter for the listing, defaults to articles_with_body_filter
+        :param cursor: Optional ListingCursor to resume from and advance
+        :return: Generator of articles
+        """
+        return self._iter_pages("articles", page_size, params, listing_filter, cursor)
+
+    def iter_article_stubs(self, page_size=100, params=None, cursor=None):
+        """
+        Stream articles carrying only their id, tags and last_activity_date, for id discovery.
+        
+        :param page_size: Number of items per page
+        :param params: Extra query parameters, e.g. {"tagged": "terraform"}
+        :param cursor: Optional ListingCursor to resume from and advance
+        :return: Generator of article stubs
+        """
+        return self.iter_articles(page_size, params, self.stub_filter("article"), cursor)
 
-    def get_articles(self, page_size=100):
+    def get_articles(self, page_size=100, params=None, listing_filter=None):
         """
         Get all articles from the API, handling pagination.
         
         :param page_size: Number of items per page
+        :param params: Extra query parameters, e.g. {"tagged": "terraform"}
+        :param listing_filter: API filter for the listing, defaults to articles_with_body_filter
         :return: List of articles
         """
-        articles = []
-        page = 0
-        has_more = True
+        return list(self.iter_articles(page_size, params, listing_filter))
 
-        while has_more:
-            params = {"pagesize": page_size}
-            if page > 0:
-                params["page"] = page
-            params["filter"] = self.articles_with_body_filter
-            data = self._make_request("articles", params)
-            articles.extend(data.get("items", []))
-            has_more = data.get("has_more", False)
-            page += 1
+    def iter_questions_with_answers(self, page_size=100, params=None, cursor=None):
+        """
+        Stream questions with bodies and answers straight from the listing.
+        
+        Uses the same filter as get_questions_by_ids, so items can go to
+        QuestionParser without a second by-id fetch.
+        
+        :param page_size: Number of items per page
+        :param params: Extra query parameters, e.g. {"tagged": "terraform"}
+        :param cursor: Optional ListingCursor to resume from and advance
+        :return: Generator of question details
+        """
+        return self.iter_questions(page_size, params, self.questions_with_answers_and_body_filter, cursor)
 
-        return articles
+    def iter_questions_by_ids(self, question_ids):
+        """
+        Stream questions by their IDs, in adaptively sized batches.
+        
+        :param question_ids: Iterable of question IDs, consumed lazily
+        :return: Generator of question details
+        :raises BatchRequestError: If a batch fails; carries the ids of that batch
+        """
+        params = {"filter": self.questions_with_answers_and_body_filter}
+        return self._iter_batches("questions/{ids}", question_ids, params)
 
     def get_questions_by_ids(self, question_ids):
         """
-        Get questions by their IDs, batching requests in sizes of 25.
+        Get questions by their IDs, in adaptively sized batches.
         
         :param question_ids: List of question IDs
         :return: List of question details
+        :raises BatchRequestError: If a batch fails; carries the ids of that batch
         """
-        questions = []
-        batch_size = 25
+        return list(self.iter_questions_by_ids(question_ids))
 
-        for i in range(0, len(question_ids), batch_size):
-            batch = question_ids[i:i + batch_size]
-            ids_param = ";".join(map(str, batch))
-            params = {"filter": self.questions_with_answers_and_body_filter}
-            data = self._make_request(f"questions/{ids_param}", params=params)
-            questions.extend(data.get("items", []))
-        return questions
+    def iter_articles_by_ids(self, article_ids):
+        """
+        Stream articles by their IDs, in adaptively sized batches.
+        
+        :param article_ids: Iterable of article IDs, consumed lazily
+        :return: Generator of article details
+        :raises BatchRequestError: If a batch fails; carries the ids of that batch
+        """
+        params = {"filter": self.articles_with_body_filter}
+        return self._iter_batches("articles/{ids}", article_ids, params)
 
     def get_articles_by_ids(self, article_ids):
         """
-        Get articles by their IDs, batching requests in sizes of 25.
+        Get articles by their IDs, in adaptively sized batches.
         
         :param article_ids: List of article IDs
         :return: List of article details
+        :raises BatchRequestError: If a batch fails; carries the ids of that batch
         """
-        articles = []
-        batch_size = 25
-
-        for i in range(0, len(article_ids), batch_size):
-            batch = article_ids[i:i + batch_size]
-            ids_param = ";".join(map(str, batch))
-            data = self._make_request(f"articles/{ids_param}", params={"filter": self.articles_with_body_filter})
-            articles.extend(data.get("items", []))
-
-        return articles
\ No newline at end of file
+        return list(self.iter_articles_by_ids(article_ids))
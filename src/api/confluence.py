@@ -1,148 +1,492 @@
 # This code sample uses the 'requests' library:
 # http://docs.python-requests.org
 from typing import List
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
-import os
-from bs4 import BeautifulSoup, NavigableString
+from datetime import datetime, timezone
+from util.Parser.html_markdown import confluence_to_markdown
+from util.sink import FileSink
+from util.page_manifest import PageManifest
+from util.metrics import metrics, log_item
 
 class ConfluenceAPI:
+    # statuses that mean the token was rejected, usually because it was rotated
+    AUTH_FAILURE_STATUSES = (401, 403)
 
-    def __init__(self, api_url, api_token, cert_path: str = None, output_dir = "tmp/confluence"):
+    def __init__(self, api_url, api_token, cert_path: str = None, output_dir = "tmp/confluence", sink=None,
+                 max_workers=4, page_limit=100, manifest: PageManifest = None, token_provider=None, http_cache=None):
         """
         Initialize the StackOverflow API client.
         
         :param api_url: Base URL for the StackOverflow API
         :param api_token: API token for authentication
+        :param sink: OutputSink pages are written to, one stream per classifier; defaults to files under output_dir
+        :param max_workers: Maximum number of requests in flight at once while crawling
+        :param page_limit: Children requested per page of a child listing
+        :param manifest: Optional PageManifest; unchanged pages are skipped and vanished ones pruned
+        :param token_provider: Optional callable taking the rejected token and returning a fresh one;
+            a request rejected with 401/403 is retried once with the new token
+        :param http_cache: Optional HttpCache every GET goes through
         """
         self.api_url = api_url
         self.api_token = api_token
+        self.token_provider = token_provider
+        self.http_cache = http_cache
         self.headers = {"Accept": "application/json", 
                         "Authorization": f"Bearer {self.api_token}"}
         self.cert_path = cert_path
         self.output_dir = output_dir
+        self.sink = sink if sink is not None else FileSink(output_dir)
+        self.max_workers = max(1, int(max_workers))
+        self.page_limit = page_limit
+        self.manifest = manifest
+        # listings that failed this run; pruning is unsafe when a subtree was only partly listed
+        self.failed_listings = set()
+        # optional Deduplicator; pages that near-duplicate already written content are not saved
+        self.dedupe = None
+        # optional callable checked between pages; fetch_subtrees stops early once it returns True
+        self.should_stop = None
+        self.stopped = False
+        # one keep-alive session shared by the crawler threads, pool sized to the worker count
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.verify = self.cert_path
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
 
+    def begin_run(self, sink=None, manifest: PageManifest = None, should_stop=None, dedupe=None):
+        """
+        Reset per-run state so a client kept across warm invocations starts clean.
+        
+        :param sink: OutputSink for this run, None keeps the current one
+        :param manifest: PageManifest for this run
+        :param should_stop: Optional callable; fetch_subtrees stops before the next page once it returns True
+        :param dedupe: Optional Deduplicator checked before each page is written
+        """
+        if sink is not None:
+            self.sink = sink
+        self.manifest = manifest
+        self.failed_listings = set()
+        self.should_stop = should_stop
+        self.stopped = False
+        self.dedupe = dedupe
 
-    def get_page_content(self, page_id):
-        url = f"{self.api_url}/rest/api/content/{page_id}?expand=body.storage"
-        response = requests.get(url, headers=self.headers, verify=self.cert_path)
+    def set_api_token(self, api_token):
+        self.api_token = api_token
+        self.headers["Authorization"] = f"Bearer {api_token}"
+        self.session.headers["Authorization"] = self.headers["Authorization"]
+
+    def _send(self, url, params=None, headers=None):
+        if self.http_cache is not None:
+            return self.http_cache.get(self.session, url, params=params, headers=headers, timeout=30)
+        return self.session.get(url, params=params, headers=headers, timeout=30)
+
+    def _get(self, url, params=None, headers=None):
+        api_token = self.api_token
+        with metrics.timer("confluence.request_ms"):
+            response = self._send(url, params, headers)
+        if response.status_code in self.AUTH_FAILURE_STATUSES and self.token_provider is not None:
+            metrics.incr("confluence.auth_refreshes")
+            self.set_api_token(self.token_provider(api_token))
+            with metrics.timer("confluence.request_ms"):
+                response = self._send(url, params, headers)
+        metrics.incr("confluence.requests")
+        metrics.incr("confluence.response_bytes", len(response.content), unit="Bytes")
+        if response.status_code >= 400:
+            metrics.incr("confluence.request_errors")
+        return response
+
+    def get_page(self, page_id, expand="body.storage"):
+        return self.get_page_if_changed(page_id, expand)[0]
+
+    def get_page_if_changed(self, page_id, expand="body.storage", etag=None):
+        """
+        Fetch a page, sending If-None-Match when an ETag from an earlier run is known.
+        
+        :param page_id: ID of the page
+        :param expand: Properties to expand
+        :param etag: Optional ETag of the saved copy
+        :return: Tuple of (page dict, or None if the server answered 304; the response ETag)
+        """
+        url = f"{self.api_url}/rest/api/content/{page_id}?expand={expand}"
+        headers = {"If-None-Match": etag} if etag else None
+        response = self._get(url, headers=headers)
+        if response.status_code == 304:
+            metrics.incr("confluence.not_modified")
+            return None, etag
         if response.status_code == 200:
-            return response.json().get("body", {}).get("storage", {}).get("value", "")
+            return response.json(), response.headers.get("ETag")
         else:
             print(f"Failed to fetch content for page {page_id}: {response.status_code}")
-            return ""
-
-    def convert_list_to_markdown(self, tag, indent_level=0):
-        markdown = ""
-        indent = "  " * indent_level
-        if tag.name == "ul":
-            for li in tag.find_all("li", recursive=False):
-                item = self.convert_children_to_markdown(li, indent_level + 1).strip()
-                markdown += f"{indent}- {item}\n"
-        elif tag.name == "ol":
-            for i, li in enumerate(tag.find_all("li", recursive=False), start=1):
-                item = self.convert_children_to_markdown(li, indent_level + 1).strip()
-                markdown += f"{indent}{i}. {item}\n"
-        return markdown
-
-    def convert_table_to_markdown(self, table):
-        rows = table.find_all("tr")
-        markdown = ""
-        for i, row in enumerate(rows):
-            cols = row.find_all(["td", "th"])
-            line = "| " + " | ".join(col.get_text(strip=True) for col in cols) + " |\n"
-            markdown += line
-            if i == 0:
-                markdown += "| " + " | ".join("---" for _ in cols) + " |\n"
-        return markdown
-
-    def convert_children_to_markdown(self, tag, indent_level=0):
-        markdown = ""
-        for child in tag.children:
-            if isinstance(child, NavigableString):
-                markdown += str(child)
-            elif child.name in ["ul", "ol"]:
-                markdown += "\n" + self.convert_list_to_markdown(child, indent_level)
-            elif child.name == "a":
-                href = child.get("href", "")
-                text = child.get_text()
-                markdown += f"{text}"
-            elif child.name == "strong":
-                markdown += f"**{self.convert_children_to_markdown(child, indent_level)}**"
-            elif child.name == "em":
-                markdown += f"*{self.convert_children_to_markdown(child, indent_level)}*"
-            elif child.name == "br":
-                markdown += "\n"
-            elif child.name == "table":
-                markdown += "\n" + self.convert_table_to_markdown(child) + "\n"
-            else:
-                markdown += self.convert_children_to_markdown(child, indent_level)
-        return markdown
+            return {}, None
+
+    def get_page_content(self, page_id):
+        return self.get_page(page_id).get("body", {}).get("storage", {}).get("value", "")
+
+    @staticmethod
+    def version_time(page):
+        """
+        Last-modified time of a page from its expanded version.
+        
+        :param page: Page content dict with ``version`` expanded
+        :return: Epoch seconds, or None if the page carries no version
+        """
+        when = page.get("version", {}).get("when")
+        if not when:
+            return None
+        return int(datetime.fromisoformat(when.replace("Z", "+00:00")).timestamp())
 
     def html_to_markdown(self, html_content):
-        soup = BeautifulSoup(html_content, "html.parser")
-        markdown = ""
-
-        for element in soup.find_all(["h1", "h2", "h3", "h4", "h5", "h6", "p", "ul", "ol", "table"], recursive=False):
-            if element.name.startswith("h"):
-                level = int(element.name[1])
-                markdown += "#" * level + " " + element.get_text(strip=True) + "\n\n"
-            elif element.name == "p":
-                markdown += self.convert_children_to_markdown(element).strip() + "\n\n"
-            elif element.name in ["ul", "ol"]:
-                markdown += self.convert_list_to_markdown(element) + "\n"
-            elif element.name == "table":
-                markdown += self.convert_table_to_markdown(element) + "\n"
-
-        return markdown
+        return confluence_to_markdown(html_content)
 
-    def get_child_pages(self, page_id):
+    def _iter_results(self, url, params, description):
+        """
+        Yield the results of a paginated content listing or search.
+        
+        :param url: First page URL
+        :param params: Query parameters of the first page, including ``limit``
+        :param description: What is listed, for the failure log line
+        :return: Generator of result dicts
+        """
+        while url:
+            response = self._get(url, params=params)
+            if response.status_code != 200:
+                print(f"Failed to fetch {description}: {response.status_code}")
+                self.failed_listings.add(description)
+                return
+            data = response.json()
+            results = data.get("results", [])
+            yield from results
+            links = data.get("_links", {})
+            if links.get("next"):
+                # next is relative to the base link and already carries start/limit/expand
+                url = f"{links.get('base', self.api_url)}{links['next']}"
+                params = None
+            elif not links and results and len(results) >= data.get("limit", self.page_limit):
+                # servers that omit _links: keep paging until a short page
+                params = dict(params or {}, start=data.get("start", 0) + len(results))
+            else:
+                url = None
+
+    def iter_child_pages(self, page_id):
+        """
+        List the direct children of a page, following the listing's pagination.
+        
+        :param page_id: ID of the parent page
+        :return: Generator of child page dicts with ``version`` expanded
+        """
         url = f"{self.api_url}/rest/api/content/{page_id}/child/page"
-        response = requests.get(url, headers=self.headers, verify=self.cert_path)
-        if response.status_code == 200:
-            return response.json().get("results", [])
+        params = {"expand": "version", "start": 0, "limit": self.page_limit}
+        return self._iter_results(url, params, f"children for page {page_id}")
+
+    def iter_descendants(self, page_id, modified_since=None, with_body=True):
+        """
+        List every page under a page with body, version and ancestors inlined.
+        
+        Without modified_since this pages through ``descendant/page``; with it a CQL
+        ``ancestor=`` search only returns pages modified since that day, so an
+        incremental run downloads just the changed bodies.
+        
+        :param page_id: ID of the root page
+        :param modified_since: Optional epoch seconds; pages last modified before that day are left out
+        :param with_body: Inline ``body.storage``; without it only the metadata is listed
+        :return: Generator of page dicts
+        """
+        expand = "body.storage,version,ancestors" if with_body else "version,ancestors"
+        params = {"expand": expand, "start": 0, "limit": self.page_limit}
+        if modified_since is None:
+            url = f"{self.api_url}/rest/api/content/{page_id}/descendant/page"
         else:
-            print(f"Failed to fetch children for page {page_id}: {response.status_code}")
-            return []
-
-    def save_all_descendants(self, page_id, classifier):
-        children = self.get_child_pages(page_id)
-        for child in children:
-            title = child.get("title", "Untitled")
-            child_id = child.get("id")
-            content_html = self.get_page_content(child_id)
+            # CQL dates are day-granular in the server's time zone, so back off a day and let the watermark sort it out
+            day = datetime.fromtimestamp(modified_since - 86400, timezone.utc).strftime("%Y-%m-%d")
+            url = f"{self.api_url}/rest/api/content/search"
+            params["cql"] = f'ancestor={page_id} and type=page and lastmodified >= "{day}"'
+        return self._iter_results(url, params, f"descendants of page {page_id}")
+
+    def get_child_pages(self, page_id):
+        return list(self.iter_child_pages(page_id))
+
+    def crawl(self, roots, watermarks=None):
+        """
+        Save every descendant of the starting pages, breadth-first.
+        
+        Child listings and page bodies are fetched concurrently over the shared
+        session, while conversion and writing stay on the calling thread. A page
+        reachable from several roots is saved once; a root found under another
+        root is saved there, but its subtree is left to its own root.
+        
+        :param roots: List of (page_id, classifier) starting pages
+        :param watermarks: Optional dict of root page_id to Watermark; covered pages are skipped
+            and each watermark is advanced past the pages saved under its root
+        :return: Number of pages saved
+        """
+        watermarks = watermarks or {}
+        root_ids = {page_id for page_id, _ in roots}
+        seen = set()
+        saved = 0
+        self.failed_listings = set()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            listings = {}
+            fetches = {}
+            for page_id, classifier in roots:
+                print(f"Processing starting page: {page_id} with classification: {classifier}")
+                listings[executor.submit(self.get_child_pages, page_id)] = (classifier, page_id)
+
+            while listings or fetches:
+                done, _ = wait(list(listings) + list(fetches), return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in listings:
+                        classifier, root = listings.pop(future)
+                        watermark = watermarks.get(root)
+                        for child in future.result():
+                            child_id = child.get("id")
+                            if child_id in seen:
+                                continue
+                            seen.add(child_id)
+                            if child_id not in root_ids:
+                                # unchanged pages are still listed, only their children may have moved
+                                listings[executor.submit(self.get_child_pages, child_id)] = (classifier, root)
+                            if self._is_unchanged(child, classifier, watermark):
+                                continue
+                            fetches[executor.submit(self.get_page_if_changed, child_id, "body.storage",
+                                                    self._etag(child_id))] = (child, classifier, root)
+                    else:
+                        child, classifier, root = fetches.pop(future)
+                        page, etag = future.result()
+                        if not page:
+                            # unchanged (304) or failed; either way the saved copy stays as it is
+                            continue
+                        self._save_page(child, page, classifier, root, watermarks.get(root), etag=etag)
+                        saved += 1
+        self._prune(root_ids)
+        return saved
+
+    def fetch_subtrees(self, roots, watermarks=None, root_ids=None):
+        """
+        Save every descendant of the starting pages using bulk descendant listings.
+        
+        Each root costs one paginated listing with bodies inlined instead of two
+        requests per page. The hierarchy is rebuilt from each page's ancestors: a
+        page under a nested root is left to that root, like crawl() does.
+        
+        When should_stop fires, the run ends before the next page, ``stopped`` is
+        set and nothing is pruned; what was saved is in the manifest, so running
+        the same roots again picks up the rest.
+        
+        :param roots: List of (page_id, classifier) starting pages
+        :param watermarks: Optional dict of root page_id to Watermark; covered pages are skipped
+            and each watermark is advanced past the pages saved under its root
+        :param root_ids: Ids of every starting page when roots is only some of them, so pages
+            under the others are still left to them
+        :return: Number of pages saved
+        """
+        watermarks = watermarks or {}
+        listed_roots = {page_id for page_id, _ in roots}
+        root_ids = set(root_ids or ()) | listed_roots
+        seen = set()
+        saved = 0
+        self.failed_listings = set()
+        self.stopped = False
+        for root, classifier in roots:
+            print(f"Processing starting page: {root} with classification: {classifier}")
+            watermark = watermarks.get(root)
+            # with a manifest every page is listed (bodies only when changed), so vanished pages can be found
+            metadata_only = self.manifest is not None and self.manifest.has_root(root)
+            since = watermark.value if watermark is not None and self.manifest is None else None
+
+            def changed_pages():
+                for page in self.iter_descendants(root, since, with_body=not metadata_only):
+                    page_id = page.get("id")
+                    if page_id in seen or self.nearest_root(page, root_ids, root) != root:
+                        continue
+                    seen.add(page_id)
+                    if not self._is_unchanged(page, classifier, watermark):
+                        yield page
+
+            if metadata_only:
+                pages = self._fetch_bodies(changed_pages())
+            else:
+                pages = ((page, page, None) for page in changed_pages())
+            for listed, page, etag in pages:
+                if self.should_stop is not None and self.should_stop():
+                    self.stopped = True
+                    self.failed_listings.add("stopped before the deadline")
+                    break
+                if not page:
+                    continue
+                self._save_page(listed, page, classifier, root, watermark, etag=etag)
+                saved += 1
+            if self.stopped:
+                break
+        self._prune(listed_roots)
+        return saved
+
+    def _fetch_bodies(self, pages):
+        """
+        Fetch the bodies of listed pages, up to max_workers at a time, in listing order.
+        
+        :param pages: Iterable of listed page dicts
+        :return: Generator of (listed page, fetched page or None if unchanged, ETag)
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = deque()
+            for listed in pages:
+                page_id = listed.get("id")
+                pending.append((listed, executor.submit(self.get_page_if_changed, page_id, "body.storage",
+                                                        self._etag(page_id))))
+                while pending and (pending[0][1].done() or len(pending) >= self.max_workers):
+                    listed, future = pending.popleft()
+                    yield (listed,) + future.result()
+            while pending:
+                listed, future = pending.popleft()
+                yield (listed,) + future.result()
+
+    @staticmethod
+    def nearest_root(page, root_ids, default=None):
+        """
+        Find the closest starting page above a page, from its expanded ancestors.
+        
+        :param page: Page dict with ``ancestors`` expanded, ordered from the space root down
+        :param root_ids: Ids of the starting pages
+        :param default: Returned when no ancestor is a starting page
+        :return: Id of the nearest ancestor that is a starting page
+        """
+        for ancestor in reversed(page.get("ancestors", [])):
+            if ancestor.get("id") in root_ids:
+                return ancestor.get("id")
+        return default
+
+    @staticmethod
+    def version_number(page):
+        return page.get("version", {}).get("number")
+
+    def _etag(self, page_id):
+        return self.manifest.etag(page_id) if self.manifest is not None else None
+
+    def _is_unchanged(self, page, classifier, watermark=None):
+        """
+        Decide from a listing whether a page's saved output is still current.
+        
+        The manifest, when there is one, is authoritative: it also catches pages that
+        moved to another classifier without a new version. Otherwise the watermark decides.
+        """
+        page_id = page.get("id")
+        if self.manifest is not None:
+            self.manifest.mark_seen(page_id)
+            return self.manifest.is_current(page_id, self.version_number(page), classifier)
+        return watermark is not None and watermark.covers(page_id, self.version_time(page))
+
+    def _save_page(self, listed, page, classifier, root, watermark=None, title=None, etag=None):
+        """
+        Convert and write a page, then record it in the watermark and manifest.
+        
+        :param listed: Page dict from the listing, carrying id, title and version
+        :param page: Page dict carrying ``body.storage``
+        :param classifier: Classifier (sink stream) the page is saved under
+        :param root: Starting page the page was found under
+        :param watermark: Optional Watermark advanced past the page
+        :param title: Title override, defaults to the page title
+        :param etag: ETag of the fetched body, if the server sent one
+        """
+        page_id = listed.get("id")
+        modified = self.version_time(listed)
+        title = title or listed.get("title", "Untitled")
+        content_html = page.get("body", {}).get("storage", {}).get("value", "")
+        with metrics.timer("confluence.convert_ms"):
             content_md = self.html_to_markdown(content_html)
+        metrics.incr("confluence.html_bytes", len(content_html), unit="Bytes")
+        candidate = None
+        if self.dedupe is not None:
+            candidate = self.dedupe.check(classifier, page_id, content_md, modified=modified)
+            if candidate is None:
+                log_item(f"Skipped {page_id}, a near-duplicate of content already saved")
+                if watermark is not None:
+                    watermark.observe(page_id, modified)
+                # recorded without output, so the version isn't downloaded and checked again on every run
+                self._record(listed, modified, root, classifier, None, etag)
+                return
+        with metrics.timer("write_ms"):
+            location = self.sink.write_document(classifier, page_id, title, content_md)
+        metrics.incr("confluence.pages_saved")
+        log_item(f"✅ Saved: {location}")
+        if candidate is not None:
+            self.dedupe.add(candidate, location)
+        if watermark is not None:
+            watermark.observe(page_id, modified)
+        self._record(listed, modified, root, classifier, location, etag)
+
+    def _record(self, listed, modified, root, classifier, location, etag):
+        """
+        Record a page in the manifest and remove output it left behind elsewhere.
+        
+        :param location: Where the page was written, None when it was dropped as a near-duplicate
+        """
+        if self.manifest is None:
+            return
+        page_id = listed.get("id")
+        previous = self.manifest.record(page_id, self.version_number(listed), modified, root, classifier,
+                                        location, etag)
+        if previous is None or previous.get("location") is None:
+            return
+        # dropped as a duplicate, moved to another classifier, or renamed under a sink that keeps the old
+        # location: the old output is stale. A duplicate's old output may already be gone through
+        # Deduplicator.on_superseded; deleting it again is harmless
+        stale = (location is None or previous["classifier"] != classifier
+                 or not self.sink.rewrites_supersede)
+        if stale and not self.manifest.is_referenced(previous["location"]):
+            self.sink.delete(previous["classifier"], page_id, previous["location"])
 
-            filename = title.replace(" ", "_").replace("/", "and") + ".md"
-            abs_path = f"{self.output_dir}/{classifier}"
-            os.makedirs(abs_path, exist_ok=True)
-            with open(f"{abs_path}/{filename}", "w", encoding="utf-8") as f:
-                f.write(f"# {title}\n\n")
-                f.write(content_md)
+    def _prune(self, roots):
+        """
+        Remove the output of manifest pages under roots that were not seen this run.
+        
+        :param roots: Ids of the starting pages that were listed
+        """
+        if self.manifest is None:
+            return
+        if self.failed_listings:
+            print(f"Skipping prune, {len(self.failed_listings)} listings failed")
+            return
+        for page_id, entry in self.manifest.stale(roots):
+            self.manifest.forget(page_id)
+            # pages dropped as near-duplicates were never written
+            if entry.get("location") is not None and not self.manifest.is_referenced(entry["location"]):
+                self.sink.delete(entry["classifier"], page_id, entry["location"])
+            metrics.incr("confluence.pages_pruned")
+            log_item(f"🗑️ Pruned: {entry['location']}")
 
-            print(f"✅ Saved: {filename}")
-            self.save_all_descendants(child_id, classifier)
+    def save_all_descendants(self, page_id, classifier, watermark=None):
+        return self.crawl([(page_id, classifier)], {page_id: watermark})
+
+    def do_process(self, page, classifier, watermark=None):
+        """
+        Save every descendant of a starting page.
+        
+        :param page: ID of the starting page
+        :param classifier: Classifier for the output directory
+        :param watermark: Optional Watermark; pages it covers are skipped and it is advanced past saved ones
+        """
+        self.save_all_descendants(page, classifier, watermark)
 
-    def do_process(self, page, classifier):
-        print(f"Processing starting page: {page} with classification: {classifier}")
-        self.save_all_descendants(page, classifier)
-    
-    def process_single_page(self, page_id, classifier):
+    def process_single_page(self, page_id, classifier, watermark=None):
         """
         Process a single Confluence page and save its content.
         
         :param page_id: ID of the Confluence page to process
         :param classifier: Classifier for the output directory
+        :param watermark: Optional Watermark; the page is skipped if it covers it
         """
-        content_html = self.get_page_content(page_id)
-        content_md = self.html_to_markdown(content_html)
-
-        title = classifier
-        filename = title.replace(" ", "_").replace("/", "and") + ".md"
-        abs_path = f"{self.output_dir}/{classifier}"
-        os.makedirs(abs_path, exist_ok=True)
-        with open(f"{abs_path}/{filename}", "w", encoding="utf-8") as f:
-            f.write(f"# {title}\n\n")
-            f.write(content_md)
-
-        print(f"✅ Saved: {filename}")
+        page, etag = self.get_page_if_changed(page_id, "body.storage,version", self._etag(page_id))
+        if page is None:
+            self.manifest.mark_seen(page_id)
+            return
+        if not page:
+            return
+        page.setdefault("id", page_id)
+        if self._is_unchanged(page, classifier, watermark):
+            return
+        self._save_page(page, page, classifier, page_id, watermark, title=classifier, etag=etag)
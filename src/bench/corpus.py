@@ -0,0 +1,114 @@
+"""
+Seedable synthetic HTML bodies shaped like StackOverflow posts and
+Confluence storage-format pages.
+"""
+import random
+
+WORDS = (
+    "terraform module pipeline gitlab runner deploy state backend provider variable output "
+    "workspace plan apply token secret vault policy cluster node image registry artifact cache "
+    "stage job trigger branch merge release tag build test lint scan certificate venafi aws "
+    "bucket role account region subnet network gateway endpoint timeout retry error log"
+).split()
+CODE_LINES = [
+    'resource "aws_s3_bucket" "logs" {',
+    '  bucket = var.bucket_name',
+    '}',
+    'terraform init -backend-config=backend.hcl',
+    'stages: [build, test, deploy]',
+    'if [ -z "$CI_COMMIT_TAG" ]; then exit 1; fi',
+    'x = a < b && c > d',
+]
+
+
+def sentence(rng: random.Random, words: int = 12) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, words)))
+
+
+def inline(rng: random.Random) -> str:
+    parts = []
+    for _ in range(rng.randint(1, 4)):
+        kind = rng.random()
+        if kind < 0.55:
+            parts.append(sentence(rng))
+        elif kind < 0.65:
+            parts.append(f"<strong>{sentence(rng, 4)}</strong>")
+        elif kind < 0.75:
+            parts.append(f"<em>{sentence(rng, 4)}</em>")
+        elif kind < 0.88:
+            parts.append(f"<code>{rng.choice(CODE_LINES).replace('<', '&lt;')}</code>")
+        else:
+            parts.append(f'<a href="https://example.com/{rng.choice(WORDS)}">{sentence(rng, 3)}</a>')
+    return " ".join(parts)
+
+
+def html_list(rng: random.Random, depth: int = 0) -> str:
+    tag = rng.choice(["ul", "ol"])
+    items = []
+    for _ in range(rng.randint(2, 5)):
+        nested = html_list(rng, depth + 1) if depth < 2 and rng.random() < 0.25 else ""
+        items.append(f"<li>{inline(rng)}{nested}</li>")
+    return f"<{tag}>\n" + "\n".join(items) + f"\n</{tag}>"
+
+
+def html_table(rng: random.Random) -> str:
+    cols = rng.randint(2, 4)
+    rows = ["<tr>" + "".join(f"<th>{rng.choice(WORDS)}</th>" for _ in range(cols)) + "</tr>"]
+    for _ in range(rng.randint(1, 6)):
+        rows.append("<tr>" + "".join(f"<td>{sentence(rng, 3)}</td>" for _ in range(cols)) + "</tr>")
+    return "<table><tbody>" + "".join(rows) + "</tbody></table>"
+
+
+def stackoverflow_body(rng: random.Random, blocks: int = 8) -> str:
+    """
+    A question, answer or article body as returned by the API (entity-escaped).
+    """
+    out = []
+    for _ in range(rng.randint(max(1, blocks // 2), blocks)):
+        kind = rng.random()
+        if kind < 0.45:
+            out.append(f"<p>{inline(rng)}</p>")
+        elif kind < 0.6:
+            code = "\n".join(rng.choice(CODE_LINES) for _ in range(rng.randint(1, 8)))
+            code = code.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+            out.append(f'<pre class="lang-hcl"><code>{code}\n</code></pre>')
+        elif kind < 0.75:
+            out.append(html_list(rng))
+        elif kind < 0.85:
+            out.append(f"<h{rng.randint(1, 3)}>{sentence(rng, 5)}</h{rng.randint(1, 3)}>")
+        elif kind < 0.93:
+            out.append(f"<blockquote><p>{inline(rng)}</p></blockquote>")
+        else:
+            out.append("<hr>")
+    return "\n\n".join(out)
+
+
+def confluence_body(rng: random.Random, blocks: int = 20) -> str:
+    """
+    A page body in Confluence storage format, with macros.
+    """
+    out = []
+    for _ in range(rng.randint(max(1, blocks // 2), blocks)):
+        kind = rng.random()
+        if kind < 0.4:
+            out.append(f"<p>{inline(rng)}<br/>{sentence(rng)}</p>")
+        elif kind < 0.55:
+            out.append(html_list(rng))
+        elif kind < 0.65:
+            out.append(html_table(rng))
+        elif kind < 0.75:
+            out.append(f"<h{rng.randint(1, 6)}>{sentence(rng, 5)}</h{rng.randint(1, 6)}>")
+        elif kind < 0.87:
+            code = "\n".join(rng.choice(CODE_LINES) for _ in range(rng.randint(1, 8)))
+            out.append(
+                '<ac:structured-macro ac:name="code" ac:schema-version="1">'
+                '<ac:parameter ac:name="language">bash</ac:parameter>'
+                f"<ac:plain-text-body><![CDATA[{code}]]></ac:plain-text-body></ac:structured-macro>"
+            )
+        else:
+            out.append(
+                f'<p><ac:link><ri:page ri:content-title="{rng.choice(WORDS)}" />'
+                f"<ac:plain-text-link-body><![CDATA[{sentence(rng, 3)}]]></ac:plain-text-link-body>"
+                f"</ac:link> {sentence(rng)}&nbsp;&mdash; {sentence(rng, 4)}</p>"
+            )
+    return "".join(out)
@@ -0,0 +1,507 @@
+"""
+Local stand-in for the StackOverflow for Teams and Confluence REST APIs.
+
+Serves a seedable synthetic corpus so ingestion can be profiled without
+touching production instances:
+
+    StackOverflow:  {url}/so/questions, /so/articles, /so/questions/{ids},
+                    /so/articles/{ids}, /so/questions/{ids}/answers, /so/answers/{ids}
+    Confluence:     {url}/confluence/rest/api/content/{id},
+                    .../{id}/child/page, .../{id}/descendant/page, .../search?cql=
+    Control:        {url}/_stats (request counts), {url}/_reset
+
+Run from src/:  python -m bench.fake_server [--port 8080] [--questions 5000] [--latency 0.02]
+"""
+import argparse
+import json
+import random
+import re
+import socket
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from bench import corpus
+
+# tags handler.py filters on, mixed into the noise vocabulary
+MATCHING_TAGS = ["terraform", "tfe", "terraform-enterprise", "gitlab", "gitlab-ci", "cicd", "venafi", "modules",
+                 "devsecops", "devops", "udp"]
+# the listing filters the client sends; anything else gets the default field set without bodies
+FILTER_FIELDS = {
+    "!6WPIomnMNcVD9": {"body", "answers"},
+    "!nNPvSNW(gA": {"body"},
+    "withbody": {"body"},
+}
+DEFAULT_STARTING_PAGES = ["892986628", "1521043813", "1235260306", "1524995199", "605591958", "1503249254"]
+SPACE_HOME = "1000"
+EPOCH = 1_600_000_000
+
+
+class FakeCorpus:
+    def __init__(self, seed=1, questions=2000, articles=200, match_ratio=0.3, body_blocks=8,
+                 roots=None, pages_per_root=200, fanout=6, body_blocks_confluence=20):
+        """
+        Synthetic StackOverflow items and Confluence trees, generated on demand from a seed.
+
+        Only the listing index (ids, tags, activity dates) and the page tree are kept
+        in memory; bodies are regenerated deterministically whenever an item is served.
+
+        :param seed: Seed for everything generated
+        :param questions: Number of questions
+        :param articles: Number of articles
+        :param match_ratio: Share of items carrying at least one of MATCHING_TAGS
+        :param body_blocks: Upper bound of HTML blocks per StackOverflow body
+        :param roots: Confluence starting page ids, defaults to the ones handler.py uses
+        :param pages_per_root: Pages generated under each root
+        :param fanout: Maximum children per Confluence page
+        :param body_blocks_confluence: Upper bound of HTML blocks per Confluence body
+        """
+        self.seed = seed
+        self.match_ratio = match_ratio
+        self.body_blocks = body_blocks
+        self.body_blocks_confluence = body_blocks_confluence
+        self.noise_tags = [f"{word}-{i}" for i, word in enumerate(corpus.WORDS * 4)]
+        self.index = {
+            "questions": self._build_index("q", questions, first_id=1),
+            "articles": self._build_index("a", articles, first_id=500_000),
+        }
+        self.pages = {}
+        self.children = {SPACE_HOME: []}
+        self._build_tree(roots or DEFAULT_STARTING_PAGES, pages_per_root, fanout)
+
+    def _rng(self, *parts):
+        return random.Random(":".join(map(str, (self.seed,) + parts)))
+
+    def _build_index(self, kind, count, first_id):
+        rng = self._rng(kind, "index")
+        entries = {}
+        for item_id in range(first_id, first_id + count):
+            tags = rng.sample(self.noise_tags, rng.randint(1, 4))
+            if rng.random() < self.match_ratio:
+                tags[0] = rng.choice(MATCHING_TAGS)
+            created = EPOCH + rng.randint(0, 3 * 365 * 86400)
+            activity = created + rng.randint(0, 180 * 86400)
+            answer_count = rng.randint(0, 4) if kind == "q" else 0
+            entries[item_id] = {"tags": tags, "creation_date": created, "last_activity_date": activity,
+                                "answer_count": answer_count, "accepted": answer_count > 0 and rng.random() < 0.5}
+        return entries
+
+    def _build_tree(self, roots, pages_per_root, fanout):
+        next_id = 10_000_000
+        for root in roots:
+            self._add_page(root, SPACE_HOME, f"Root {root}")
+            rng = self._rng("tree", root)
+            frontier = [root]
+            created = 0
+            while frontier and created < pages_per_root:
+                parent = frontier.pop(0)
+                for _ in range(rng.randint(1, fanout)):
+                    if created >= pages_per_root:
+                        break
+                    page_id = str(next_id)
+                    next_id += 1
+                    created += 1
+                    self._add_page(page_id, parent, f"{corpus.sentence(rng, 4).title()} {page_id}")
+                    frontier.append(page_id)
+
+    def _add_page(self, page_id, parent, title):
+        rng = self._rng("page", page_id)
+        self.pages[page_id] = {"id": page_id, "title": title, "parent": parent,
+                               "version": rng.randint(1, 5), "when": EPOCH + rng.randint(0, 3 * 365 * 86400)}
+        self.children.setdefault(parent, []).append(page_id)
+        self.children.setdefault(page_id, [])
+
+    # --- StackOverflow -------------------------------------------------
+
+    def item(self, kind, item_id, fields):
+        entry = self.index[kind][item_id]
+        rng = self._rng(kind, item_id)
+        id_field = "question_id" if kind == "questions" else "article_id"
+        item = {
+            id_field: item_id,
+            "title": corpus.sentence(rng, 8).capitalize(),
+            "tags": list(entry["tags"]),
+            "score": rng.randint(-2, 40),
+            "creation_date": entry["creation_date"],
+            "last_activity_date": entry["last_activity_date"],
+            "link": f"https://stackoverflow.example/{kind}/{item_id}",
+        }
+        answer_count = entry["answer_count"]
+        if kind == "questions":
+            item["is_answered"] = answer_count > 0
+            item["answer_count"] = answer_count
+            if entry["accepted"]:
+                item["accepted_answer_id"] = item_id * 10
+        if "body" in fields:
+            item["body"] = corpus.stackoverflow_body(rng, self.body_blocks)
+        if "answers" in fields and answer_count:
+            item["answers"] = self.answers(item_id)
+        return item
+
+    def answers(self, question_id):
+        entry = self.index["questions"][question_id]
+        rng = self._rng("answers", question_id)
+        answers = []
+        for n in range(entry["answer_count"]):
+            answers.append({
+                "answer_id": question_id * 10 + n,
+                "question_id": question_id,
+                "score": rng.randint(-1, 25),
+                "is_accepted": n == 0 and entry["accepted"],
+                "creation_date": entry["creation_date"] + rng.randint(60, 86400 * 30),
+                "last_activity_date": entry["last_activity_date"],
+                "body": corpus.stackoverflow_body(rng, self.body_blocks),
+            })
+        return answers
+
+    def listing(self, kind, tagged=None, sort="activity", order="desc", minimum=None, maximum=None):
+        field = "creation_date" if sort == "creation" else "last_activity_date"
+        wanted = [tag.lower() for tag in tagged.split(";")] if tagged else []
+        ids = []
+        for item_id, entry in self.index[kind].items():
+            if wanted and not all(tag in entry["tags"] for tag in wanted):
+                continue
+            if minimum is not None and entry[field] < minimum:
+                continue
+            if maximum is not None and entry[field] > maximum:
+                continue
+            ids.append(item_id)
+        ids.sort(key=lambda item_id: (self.index[kind][item_id][field], item_id), reverse=(order == "desc"))
+        return ids
+
+    # --- Confluence ----------------------------------------------------
+
+    def ancestors(self, page_id):
+        chain = []
+        parent = self.pages[page_id]["parent"]
+        while parent in self.pages:
+            chain.append(parent)
+            parent = self.pages[parent]["parent"]
+        chain.append(SPACE_HOME)
+        return [{"id": ancestor, "type": "page"} for ancestor in reversed(chain)]
+
+    def page(self, page_id, expand):
+        meta = self.pages[page_id]
+        page = {"id": page_id, "type": "page", "status": "current", "title": meta["title"]}
+        if "version" in expand:
+            when = datetime.fromtimestamp(meta["when"], timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+            page["version"] = {"number": meta["version"], "when": when}
+        if "ancestors" in expand:
+            page["ancestors"] = self.ancestors(page_id)
+        if "body.storage" in expand:
+            rng = self._rng("body", page_id, meta["version"])
+            page["body"] = {"storage": {"value": corpus.confluence_body(rng, self.body_blocks_confluence),
+                                        "representation": "storage"}}
+        return page
+
+    def descendants(self, page_id):
+        order = []
+        frontier = list(self.children.get(page_id, []))
+        while frontier:
+            child = frontier.pop(0)
+            order.append(child)
+            frontier.extend(self.children.get(child, []))
+        return order
+
+    def etag(self, page_id):
+        return f'"{page_id}-{self.pages[page_id]["version"]}"'
+
+
+class FakeApiServer:
+    def __init__(self, fake_corpus, host="127.0.0.1", port=0, latency=0.0, backoff_every=0, backoff_seconds=1,
+                 throttle_every=0, fail_every=0, max_page_size=100, confluence_limit=50, quota=10000, rate_limit=0):
+        """
+        Threaded HTTP server answering like the StackOverflow and Confluence APIs.
+
+        :param fake_corpus: FakeCorpus to serve
+        :param latency: Seconds slept before answering each request
+        :param backoff_every: Add a ``backoff`` field to every Nth StackOverflow response, 0 never
+        :param backoff_seconds: Value of the injected backoff field
+        :param throttle_every: Answer every Nth StackOverflow request with a throttle_violation, 0 never
+        :param fail_every: Answer every Nth request with a 503, 0 never
+        :param max_page_size: Largest StackOverflow pagesize honoured
+        :param confluence_limit: Largest Confluence limit honoured
+        :param quota: Starting quota_remaining
+        :param rate_limit: StackOverflow requests allowed in any one second, 0 for no limit; like the real
+            API, going over it, or calling a method before its injected backoff passed, is a throttle
+            violation that bans every request for backoff_seconds
+        """
+        self.corpus = fake_corpus
+        self.latency = latency
+        self.backoff_every = backoff_every
+        self.backoff_seconds = backoff_seconds
+        self.throttle_every = throttle_every
+        self.fail_every = fail_every
+        self.max_page_size = max_page_size
+        self.confluence_limit = confluence_limit
+        self.quota = quota
+        self.rate_limit = rate_limit
+        # filters made through filters/create, mapped to the item fields they keep
+        self.filters = {}
+        self.lock = threading.Lock()
+        self.reset()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset(self):
+        with self.lock:
+            self.requests = {}
+            self.total = 0
+            self.bytes_sent = 0
+            self.quota_remaining = self.quota
+            self.violations = 0
+            self.recent = deque()
+            self.banned_until = 0.0
+            self.backoff_until = {}
+
+    def stats(self):
+        with self.lock:
+            return {"requests": self.total, "by_route": dict(self.requests), "bytes_sent": self.bytes_sent,
+                    "quota_remaining": self.quota_remaining, "violations": self.violations}
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _count(self, route):
+        with self.lock:
+            self.total += 1
+            self.requests[route] = self.requests.get(route, 0) + 1
+            self.quota_remaining = max(0, self.quota_remaining - 1)
+            return self.total, self.quota_remaining
+
+    def _violates(self, route):
+        # True when this request breaks the rate limit or an injected backoff; each violation extends the ban
+        with self.lock:
+            now = time.monotonic()
+            while self.recent and self.recent[0] <= now - 1:
+                self.recent.popleft()
+            self.recent.append(now)
+            violated = (now < self.banned_until or now < self.backoff_until.get(route, 0.0)
+                        or (self.rate_limit and len(self.recent) > self.rate_limit))
+            if violated:
+                self.violations += 1
+                self.banned_until = now + self.backoff_seconds
+            return violated
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # headers and body go out as separate writes; don't let Nagle hold the body back
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                split = urlsplit(self.path)
+                query = {key: values[-1] for key, values in parse_qs(split.query).items()}
+                parts = [part for part in split.path.split("/") if part]
+                try:
+                    if parts[:1] == ["_stats"]:
+                        return self._send(200, server.stats())
+                    if parts[:1] == ["_reset"]:
+                        server.reset()
+                        return self._send(200, {"reset": True})
+                    if parts[:1] == ["so"]:
+                        return server._stackoverflow(self, parts[1:], query)
+                    if parts[:4] == ["confluence", "rest", "api", "content"]:
+                        return server._confluence(self, parts[4:], query)
+                    self._send(404, {"error": "not found"})
+                except (KeyError, ValueError) as e:
+                    self._send(400, {"error_id": 400, "error_name": "bad_parameter", "error_message": str(e)})
+
+            def _send(self, status, body, headers=None):
+                data = json.dumps(body).encode("utf-8") if body is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+                with server.lock:
+                    server.bytes_sent += len(data)
+
+        return Handler
+
+    def _stackoverflow(self, handler, parts, query):
+        kind = parts[0]
+        route = "so:" + "/".join(["{ids}" if i == 1 else part for i, part in enumerate(parts)])
+        number, quota_remaining = self._count(route)
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail_every and number % self.fail_every == 0:
+            return handler._send(503, {"error_id": 503, "error_name": "temporarily_unavailable"})
+        if (self.throttle_every and number % self.throttle_every == 0) or self._violates(route):
+            return handler._send(400, {"error_id": 502, "error_name": "throttle_violation",
+                                       "error_message": "too many requests from this IP, more requests "
+                                                        f"available in {self.backoff_seconds} seconds"})
+        if parts == ["filters", "create"]:
+            return self._create_filter(handler, query)
+        if kind == "answers" and len(parts) == 2:
+            return self._answers_by_ids(handler, parts[1], query, quota_remaining)
+        if kind not in ("questions", "articles"):
+            return handler._send(404, {"error_id": 404, "error_name": "no_method"})
+
+        fields = FILTER_FIELDS.get(query.get("filter"), set())
+        if len(parts) == 1:
+            ids = self.corpus.listing(kind, query.get("tagged"), query.get("sort", "activity"),
+                                      query.get("order", "desc"),
+                                      int(query["min"]) if "min" in query else None,
+                                      int(query["max"]) if "max" in query else None)
+            if query.get("filter") == "total":
+                return handler._send(200, {"total": len(ids)})
+            page = int(query.get("page", 1))
+            size = min(int(query.get("pagesize", 30)), self.max_page_size)
+            window = ids[(page - 1) * size:page * size]
+            has_more = page * size < len(ids)
+            items = [self.corpus.item(kind, item_id, fields) for item_id in window]
+        else:
+            ids = [int(item_id) for item_id in parts[1].split(";") if item_id]
+            if len(ids) > 100:
+                return handler._send(400, {"error_id": 400, "error_name": "bad_parameter",
+                                           "error_message": "ids: too many values"})
+            known = [item_id for item_id in ids if item_id in self.corpus.index[kind]]
+            if parts[2:] == ["answers"]:
+                items = [answer for item_id in known for answer in self.corpus.answers(item_id)]
+                if "body" not in fields:
+                    items = [{k: v for k, v in answer.items() if k != "body"} for answer in items]
+            else:
+                items = [self.corpus.item(kind, item_id, fields) for item_id in known]
+            # vector requests page like listings do
+            page = int(query.get("page", 1))
+            size = min(int(query.get("pagesize", 30)), self.max_page_size)
+            has_more = page * size < len(items)
+            items = items[(page - 1) * size:page * size]
+        kept = self.filters.get(query.get("filter"))
+        if kept is not None:
+            items = [{key: value for key, value in item.items() if key in kept} for item in items]
+        body = {"items": items, "has_more": has_more, "quota_max": self.quota, "quota_remaining": quota_remaining}
+        if self.backoff_every and number % self.backoff_every == 0:
+            body["backoff"] = self.backoff_seconds
+            with self.lock:
+                self.backoff_until[route] = time.monotonic() + self.backoff_seconds
+        handler._send(200, body)
+
+    def _answers_by_ids(self, handler, ids, query, quota_remaining):
+        answers = []
+        for answer_id in (int(answer_id) for answer_id in ids.split(";") if answer_id):
+            # answer ids are question_id * 10 + n
+            if answer_id // 10 in self.corpus.index["questions"]:
+                answers.extend(answer for answer in self.corpus.answers(answer_id // 10)
+                               if answer["answer_id"] == answer_id)
+        if "body" not in FILTER_FIELDS.get(query.get("filter"), set()):
+            answers = [{k: v for k, v in answer.items() if k != "body"} for answer in answers]
+        page = int(query.get("page", 1))
+        size = min(int(query.get("pagesize", 30)), self.max_page_size)
+        handler._send(200, {"items": answers[(page - 1) * size:page * size], "has_more": page * size < len(answers),
+                            "quota_max": self.quota, "quota_remaining": quota_remaining})
+
+    def _create_filter(self, handler, query):
+        # only base=none filters are modelled: the item keeps exactly the included fields
+        kept = {field.split(".", 1)[1] for field in query.get("include", "").split(";") if not field.startswith(".")}
+        with self.lock:
+            name = f"!stub{len(self.filters)}"
+            self.filters[name] = kept
+        handler._send(200, {"items": [{"filter": name, "filter_type": "safe", "included_fields": sorted(kept)}],
+                            "has_more": False})
+
+    def _confluence(self, handler, parts, query):
+        route = "confluence:" + ("/".join(parts[1:]) if len(parts) > 1 and parts[0] != "search" else
+                                 ("search" if parts[0] == "search" else "content"))
+        number, _ = self._count(route)
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail_every and number % self.fail_every == 0:
+            return handler._send(503, {"statusCode": 503, "message": "Service Unavailable"})
+
+        expand = query.get("expand", "")
+        start = int(query.get("start", 0))
+        limit = min(int(query.get("limit", 25)), self.confluence_limit)
+        if parts[0] == "search":
+            cql = query.get("cql", "")
+            root = re.search(r"ancestor\s*=\s*(\w+)", cql).group(1)
+            since = re.search(r'lastmodified\s*>=\s*"([0-9-]+)"', cql)
+            ids = self.corpus.descendants(root)
+            if since:
+                cutoff = datetime.strptime(since.group(1), "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+                ids = [page_id for page_id in ids if self.corpus.pages[page_id]["when"] >= cutoff]
+            path = "/rest/api/content/search"
+        else:
+            page_id = parts[0]
+            if page_id not in self.corpus.pages:
+                return handler._send(404, {"statusCode": 404, "message": f"No content found with id: {page_id}"})
+            if len(parts) == 1:
+                etag = self.corpus.etag(page_id)
+                if handler.headers.get("If-None-Match") == etag:
+                    return handler._send(304, None, {"ETag": etag})
+                return handler._send(200, self.corpus.page(page_id, expand), {"ETag": etag})
+            if parts[1:] == ["child", "page"]:
+                ids = self.corpus.children.get(page_id, [])
+            elif parts[1:] == ["descendant", "page"]:
+                ids = self.corpus.descendants(page_id)
+            else:
+                return handler._send(404, {"statusCode": 404, "message": "Not found"})
+            path = "/rest/api/content/" + "/".join(parts)
+
+        window = ids[start:start + limit]
+        links = {"base": f"{self.url}/confluence", "context": "/confluence"}
+        if start + limit < len(ids):
+            params = dict(query, start=start + limit, limit=limit)
+            links["next"] = path + "?" + "&".join(f"{key}={value}" for key, value in params.items())
+        handler._send(200, {"results": [self.corpus.page(page_id, expand) for page_id in window],
+                            "start": start, "limit": limit, "size": len(window), "_links": links})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--questions", type=int, default=2000)
+    parser.add_argument("--articles", type=int, default=200)
+    parser.add_argument("--pages-per-root", type=int, default=200)
+    parser.add_argument("--fanout", type=int, default=6)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--backoff-every", type=int, default=0)
+    parser.add_argument("--throttle-every", type=int, default=0)
+    parser.add_argument("--fail-every", type=int, default=0)
+    parser.add_argument("--rate-limit", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    fake_corpus = FakeCorpus(seed=args.seed, questions=args.questions, articles=args.articles,
+                             pages_per_root=args.pages_per_root, fanout=args.fanout)
+    server = FakeApiServer(fake_corpus, host=args.host, port=args.port, latency=args.latency,
+                           backoff_every=args.backoff_every, throttle_every=args.throttle_every,
+                           fail_every=args.fail_every, rate_limit=args.rate_limit)
+    # the first line is read by bench.pipeline when it starts the server itself
+    print(server.url, flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Micro-benchmark for the compiled Filter against the list-based matching it replaced.
+
+Run from src/:  python -m bench.filter_bench [--items 1000000] [--seed 1]
+Exits non-zero if the two disagree on any item.
+"""
+import argparse
+import random
+import sys
+import time
+from util.filter import Filter
+
+# the tag list handler.py filters on
+FILTER_TAGS = ["terraform", "tfe", "terraform-enterprise", "tfe-enterprise", "UDP", "gitlab", "gitlab-ci",
+               "gitlab-ci-cd", "cicd", "venafi", "modules", "module", "gitlab-ci-pipelines", "gitlab-pipelines",
+               "gitlab-pipeline", "devsecops", "devops"]
+
+
+def listing(count, seed, vocabulary=5000):
+    rng = random.Random(seed)
+    # mostly noise tags, with the filter tags showing up now and then
+    tags = [f"tag-{i}" for i in range(vocabulary)] + [tag.lower() for tag in FILTER_TAGS]
+    now = 1_700_000_000
+    items = []
+    for i in range(count):
+        item = {
+            "question_id": i,
+            "tags": rng.sample(tags, rng.randint(1, 5)),
+            "score": rng.randint(-3, 50),
+            "creation_date": now - rng.randint(0, 365 * 86400),
+            "is_answered": rng.random() < 0.6,
+        }
+        if item["is_answered"] and rng.random() < 0.5:
+            item["accepted_answer_id"] = i + count
+        items.append(item)
+    return items
+
+
+def legacy_matches(item, key, values):
+    # the pre-compilation Filter.matches: list membership per tag
+    if isinstance(item, dict) and key in item:
+        return isinstance(item[key], list) and any(value in values for value in item[key])
+    return False
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    items = listing(args.items, args.seed)
+    compiled = Filter(key="tags", values=FILTER_TAGS, id_field="question_id")
+    legacy_ids, legacy_time = timed(
+        lambda: [item["question_id"] for item in items if legacy_matches(item, "tags", FILTER_TAGS)])
+    new_ids, new_time = timed(lambda: compiled.do_filter(items))
+    print(f"any-of       items={len(items):<8} matched={len(new_ids):<7} list={legacy_time:7.3f}s  "
+          f"compiled={new_time:7.3f}s  speedup={legacy_time / new_time:5.2f}x")
+    failures = 0 if legacy_ids == new_ids else 1
+
+    # composed rules, evaluated in the same single pass that builds the tag index
+    composed = Filter(key="tags", values=["gitlab*", "terraform*", "tfe*"], id_field="question_id",
+                      none_of=["module?"], ignore_case=True, min_score=5, since=1_690_000_000,
+                      is_answered=True, has_accepted_answer=True)
+    index = {}
+    composed_ids, composed_time = timed(lambda: list(composed.iter_filter(items, index=index)))
+    print(f"composed     items={len(items):<8} matched={len(composed_ids):<7} "
+          f"compiled={composed_time:7.3f}s  indexed_tags={len(index)}")
+
+    if failures:
+        print("compiled filter disagrees with the list-based filter")
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(main())
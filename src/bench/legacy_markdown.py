@@ -0,0 +1,178 @@
+"""
+BeautifulSoup reference converters, kept verbatim from before the
+streaming engine in util/Parser/html_markdown.py replaced them. Used only
+by bench/markdown_engine.py to check output compatibility and compare
+speed; requires beautifulsoup4.
+"""
+from bs4 import BeautifulSoup, NavigableString
+
+
+def format_inline(el) -> str:
+    if isinstance(el, NavigableString):
+        return el.strip()
+    elif el.name == 'strong':
+        return f"**{''.join(format_inline(c) for c in el.contents)}**"
+    elif el.name == 'em':
+        return f"_{''.join(format_inline(c) for c in el.contents)}_"
+    elif el.name == 'code':
+        return f"`{''.join(format_inline(c) for c in el.contents)}`"
+    elif el.name == 'a':
+        href = el.get('href', '').strip()
+        text = ''.join(format_inline(c) for c in el.contents).strip()
+        return f"{text} [{href}]" if href else text
+    else:
+        return ''.join(format_inline(c) for c in el.contents)
+
+
+def question_markdown(raw_html: str) -> str:
+    """QuestionParser.parse_body_to_markdown, input already unescaped."""
+    soup = BeautifulSoup(raw_html, 'html.parser')
+
+    def process_element(el, indent=0):
+        if isinstance(el, NavigableString):
+            return el.strip()
+
+        if el.name == 'h1':
+            return f"# {format_inline(el)}"
+        elif el.name == 'h2':
+            return f"## {format_inline(el)}"
+        elif el.name == 'h3':
+            return f"### {format_inline(el)}"
+        elif el.name == 'p':
+            return format_inline(el)
+        elif el.name == 'li':
+            content = [process_element(child, indent + 1) for child in el.contents]
+            return f"{'  ' * indent}- {' '.join(filter(None, content)).strip()}"
+        elif el.name in ['ul', 'ol']:
+            items = [process_element(li, indent) for li in el.find_all('li', recursive=False)]
+            return '\n'.join(items)
+        elif el.name == 'pre':
+            code_block = el.find('code')
+            if code_block:
+                return f"```\n{code_block.get_text()}\n```"
+            else:
+                return f"```\n{el.get_text()}\n```"
+        elif el.name == 'code':
+            return f"`{format_inline(el)}`"
+        elif el.name == 'blockquote':
+            return '> ' + format_inline(el)
+        return ''
+
+    markdown_lines = []
+    for child in soup.contents:
+        if hasattr(child, 'name'):
+            line = process_element(child)
+            if line:
+                markdown_lines.append(line)
+
+    return '\n\n'.join(markdown_lines)
+
+
+def article_markdown(raw_html: str) -> str:
+    """ArticleParser.parse_body_to_markdown, input already unescaped."""
+    soup = BeautifulSoup(raw_html, 'html.parser')
+
+    def process_element(el, indent=0):
+        if isinstance(el, NavigableString):
+            return el.strip()
+
+        if el.name == 'h1':
+            return f"# {format_inline(el)}"
+        elif el.name == 'h2':
+            return f"## {format_inline(el)}"
+        elif el.name == 'h3':
+            return f"### {format_inline(el)}"
+        elif el.name == 'p':
+            return format_inline(el)
+        elif el.name == 'li':
+            content = []
+            for child in el.contents:
+                content.append(process_element(child, indent + 1))
+            return f"{'  ' * indent}- {' '.join(filter(None, content)).strip()}"
+        elif el.name in ['ul', 'ol']:
+            items = []
+            for li in el.find_all('li', recursive=False):
+                items.append(process_element(li, indent))
+            return '\n'.join(items)
+        elif el.name == 'pre':
+            return "```\n" + el.get_text() + "\n```"
+        elif el.name == 'blockquote':
+            return '> ' + format_inline(el)
+        return ''
+
+    markdown_lines = []
+    for child in soup.contents:
+        if hasattr(child, 'name'):
+            line = process_element(child)
+            if line:
+                markdown_lines.append(line)
+
+    return '\n\n'.join(markdown_lines)
+
+
+def convert_list_to_markdown(tag, indent_level=0):
+    markdown = ""
+    indent = "  " * indent_level
+    if tag.name == "ul":
+        for li in tag.find_all("li", recursive=False):
+            item = convert_children_to_markdown(li, indent_level + 1).strip()
+            markdown += f"{indent}- {item}\n"
+    elif tag.name == "ol":
+        for i, li in enumerate(tag.find_all("li", recursive=False), start=1):
+            item = convert_children_to_markdown(li, indent_level + 1).strip()
+            markdown += f"{indent}{i}. {item}\n"
+    return markdown
+
+
+def convert_table_to_markdown(table):
+    rows = table.find_all("tr")
+    markdown = ""
+    for i, row in enumerate(rows):
+        cols = row.find_all(["td", "th"])
+        line = "| " + " | ".join(col.get_text(strip=True) for col in cols) + " |\n"
+        markdown += line
+        if i == 0:
+            markdown += "| " + " | ".join("---" for _ in cols) + " |\n"
+    return markdown
+
+
+def convert_children_to_markdown(tag, indent_level=0):
+    markdown = ""
+    for child in tag.children:
+        if isinstance(child, NavigableString):
+            markdown += str(child)
+        elif child.name in ["ul", "ol"]:
+            markdown += "\n" + convert_list_to_markdown(child, indent_level)
+        elif child.name == "a":
+            text = child.get_text()
+            markdown += f"{text}"
+        elif child.name == "strong":
+            markdown += f"**{convert_children_to_markdown(child, indent_level)}**"
+        elif child.name == "em":
+            markdown += f"*{convert_children_to_markdown(child, indent_level)}*"
+        elif child.name == "br":
+            markdown += "\n"
+        elif child.name == "table":
+            markdown += "\n" + convert_table_to_markdown(child) + "\n"
+        else:
+            markdown += convert_children_to_markdown(child, indent_level)
+    return markdown
+
+
+def confluence_markdown(html_content):
+    """ConfluenceAPI.html_to_markdown."""
+    soup = BeautifulSoup(html_content, "html.parser")
+    markdown = ""
+
+    for element in soup.find_all(["h1", "h2", "h3", "h4", "h5", "h6", "p", "ul", "ol", "table"], recursive=False):
+        if element.name.startswith("h"):
+            level = int(element.name[1])
+            markdown += "#" * level + " " + element.get_text(strip=True) + "\n\n"
+        elif element.name == "p":
+            markdown += convert_children_to_markdown(element).strip() + "\n\n"
+        elif element.name in ["ul", "ol"]:
+            markdown += convert_list_to_markdown(element) + "\n"
+        elif element.name == "table":
+            markdown += convert_table_to_markdown(element) + "\n"
+
+    return markdown
@@ -0,0 +1,83 @@
+"""
+Golden-output compatibility check and benchmark for the streaming
+HTML to Markdown engine against the BeautifulSoup converters it replaced.
+
+Run from src/:  python -m bench.markdown_engine [--documents 2000] [--seed 1]
+Exits non-zero if any converter output differs from the reference.
+"""
+import argparse
+import html
+import random
+import sys
+import time
+from bench import corpus
+from bench import legacy_markdown
+from util.Parser.html_markdown import stackoverflow_to_markdown, confluence_to_markdown
+
+# hand-picked edge cases on top of the generated corpus
+GOLDEN_CASES = [
+    "",
+    "plain text at the top level",
+    "<p>a <strong>b</strong> c<!-- note --></p>",
+    "<ul><li>one<ul><li>nested <em>two</em></li></ul></li><li>three</li></ul>",
+    "<ol><li><p>para in item</p></li><div>not an item</div></ol>",
+    "<pre><span>x</span><code>first</code><code>second</code></pre>",
+    "<code>top level code</code>",
+    "<p>unclosed <em>emphasis<p>next",
+    "<p>a<br>b</br>c</p><img src=x></img>",
+    "<h4>h4 is dropped by the SO converters</h4><blockquote>quote <a href=' u '>link</a></blockquote>",
+    "<table><tr><th>a</th><th>b</th></tr><tr><td>1<table><tr><td>in</td></tr></table></td></tr></table>",
+    "<p>&amp; &lt;tag&gt; &nbsp; &unknown; &#8212; &#x41; &#150;</p>",
+    '<ac:structured-macro ac:name="info"><ac:rich-text-body><p>inside macro</p></ac:rich-text-body></ac:structured-macro>',
+    "<p><script>var x = '<p>';</script>after script</p>",
+]
+
+CONVERTERS = [
+    ("question", lambda body: stackoverflow_to_markdown(body, "question"), legacy_markdown.question_markdown),
+    ("article", lambda body: stackoverflow_to_markdown(body, "article"), legacy_markdown.article_markdown),
+    ("confluence", confluence_to_markdown, legacy_markdown.confluence_markdown),
+]
+
+
+def documents(kind, count, seed):
+    rng = random.Random(seed)
+    docs = list(GOLDEN_CASES)
+    for _ in range(count):
+        if kind == "confluence":
+            docs.append(corpus.confluence_body(rng, blocks=rng.choice([5, 20, 200])))
+        else:
+            docs.append(html.unescape(corpus.stackoverflow_body(rng, blocks=rng.choice([4, 8, 40]))))
+    return docs
+
+
+def timed(fn, docs):
+    start = time.perf_counter()
+    outputs = [fn(doc) for doc in docs]
+    return outputs, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    failures = 0
+    for kind, streaming, reference in CONVERTERS:
+        docs = documents(kind, args.documents, args.seed)
+        size_kb = sum(len(doc) for doc in docs) / 1024
+        new_out, new_time = timed(streaming, docs)
+        old_out, old_time = timed(reference, docs)
+        mismatches = [i for i, (a, b) in enumerate(zip(new_out, old_out)) if a != b]
+        failures += len(mismatches)
+        print(f"{kind:<11} docs={len(docs):<6} {size_kb:>9.0f} KB  "
+              f"streaming={new_time:7.3f}s  beautifulsoup={old_time:7.3f}s  "
+              f"speedup={old_time / new_time:5.2f}x  mismatches={len(mismatches)}")
+        for i in mismatches[:3]:
+            print(f"  first mismatch in document {i}:\n    input:     {docs[i][:200]!r}\n"
+                  f"    streaming: {new_out[i][:200]!r}\n    reference: {old_out[i][:200]!r}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
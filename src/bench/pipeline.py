@@ -0,0 +1,255 @@
+"""
+End-to-end ingestion benchmark against the local fake StackOverflow and Confluence APIs.
+
+Starts bench.fake_server in its own process, then runs each stage in a fresh
+process and reports requests issued, wall time, items/sec, peak RSS and output
+bytes. Results are written as JSON so runs from different commits can be compared.
+
+Run from src/:  python -m bench.pipeline [--questions 2000] [--latency 0.01] [--output results.json]
+                python -m bench.pipeline --compare old.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+# same tag list handler.py filters on
+FILTER_TAGS = ["terraform", "tfe", "terraform-enterprise", "tfe-enterprise", "UDP", "gitlab", "gitlab-ci",
+               "gitlab-ci-cd", "cicd", "venafi", "modules", "module", "gitlab-ci-pipelines", "gitlab-pipelines",
+               "gitlab-pipeline", "devsecops", "devops"]
+STARTING_PAGES = [("892986628", "tfe"), ("1521043813", "gitlab"), ("1235260306", "gitlab"),
+                  ("1524995199", "gitlab"), ("605591958", "ops-tasks")]
+
+
+def configure_env(url, workdir, stage):
+    os.environ.update({
+        "SSM_OVERRIDE": "true",
+        "STACKOVERFLOW_API_URL": f"{url}/so",
+        "STACKOVERFLOW_API_KEY": "bench",
+        "CONFLUENCE_API_URL": f"{url}/confluence",
+        "CONFLUENCE_API_KEY": "bench",
+        "RAW_OUTPUT_DIR": os.path.join(workdir, "out", stage),
+        "CHECKPOINT_STORE": os.path.join(workdir, "checkpoints.json"),
+        "PARSE_CACHE_DIR": os.path.join(workdir, "parse_cache"),
+    })
+
+
+def stackoverflow_client():
+    from api.StackOverflow import StackOverflow
+    return StackOverflow(os.environ["STACKOVERFLOW_API_URL"], "bench",
+                         max_workers=int(os.environ.get("STACKOVERFLOW_MAX_WORKERS", "4")))
+
+
+def question_plan():
+    from util.filter import Filter
+    from util.query_planner import QueryPlanner
+    return QueryPlanner().plan(Filter(key="tags", values=FILTER_TAGS, id_field="question_id"))
+
+
+def stage_so_listing(workdir):
+    api = stackoverflow_client()
+    return {"items": sum(1 for _ in question_plan().iter_items(api.iter_questions_with_answers))}
+
+
+def stage_so_discovery_full(workdir):
+    # id discovery as two_phase used to do it: full listing payloads kept until the end
+    api = stackoverflow_client()
+    items = list(question_plan().iter_items(api.iter_questions))
+    return {"items": len(items)}
+
+
+def stage_so_discovery(workdir):
+    api = stackoverflow_client()
+    return {"items": len(question_plan().discover(api.iter_question_stubs))}
+
+
+def stage_so_pipeline(workdir):
+    from handler import run_pipeline
+    from util.Parser.question_parser import QuestionParser
+    from util.sink import output_sink_from_env
+    api = stackoverflow_client()
+    sink = output_sink_from_env(os.environ["RAW_OUTPUT_DIR"])
+    items = question_plan().iter_items(api.iter_questions_with_answers)
+    count = run_pipeline(items, QuestionParser, "question_id", sink, "questions", "question")
+    sink.close()
+    return {"items": count}
+
+
+def confluence_client(manifest):
+    from api.confluence import ConfluenceAPI
+    from util.sink import output_sink_from_env
+    return ConfluenceAPI(os.environ["CONFLUENCE_API_URL"], "bench",
+                         sink=output_sink_from_env(os.path.join(os.environ["RAW_OUTPUT_DIR"], "confluence")),
+                         max_workers=int(os.environ.get("CONFLUENCE_MAX_WORKERS", "4")), manifest=manifest)
+
+
+def run_confluence(workdir, mode):
+    from util.checkpoint import checkpoint_store_from_uri
+    from util.page_manifest import PageManifest
+    # one manifest per mode, so the incremental stage sees what the bulk stage saved
+    store = checkpoint_store_from_uri(os.path.join(workdir, f"manifest-{mode}.json"))
+    manifest = PageManifest.from_dict(store.get_state("confluence:pages"))
+    api = confluence_client(manifest)
+    saved = getattr(api, mode)(STARTING_PAGES)
+    api.sink.close()
+    store.set_state("confluence:pages", manifest.to_dict())
+    return {"items": saved, "pages_known": len(manifest.pages)}
+
+
+def stage_confluence_crawl(workdir):
+    return run_confluence(workdir, "crawl")
+
+
+def stage_confluence_bulk(workdir):
+    return run_confluence(workdir, "fetch_subtrees")
+
+
+def stage_confluence_incremental(workdir):
+    # runs after confluence_bulk, so only changed pages are fetched
+    return run_confluence(workdir, "fetch_subtrees")
+
+
+def stage_lambda_handler(workdir):
+    from handler import lambda_handler
+    lambda_handler({"initial_load": True}, None)
+    return {}
+
+
+STAGES = {
+    "so_listing": stage_so_listing,
+    "so_discovery_full": stage_so_discovery_full,
+    "so_discovery": stage_so_discovery,
+    "so_pipeline": stage_so_pipeline,
+    "confluence_crawl": stage_confluence_crawl,
+    "confluence_bulk": stage_confluence_bulk,
+    "confluence_incremental": stage_confluence_incremental,
+    "lambda_handler": stage_lambda_handler,
+}
+
+
+def run_stage(name, url, workdir, quiet):
+    """
+    Body of one stage, run in a fresh process so peak RSS belongs to that stage alone.
+    """
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    configure_env(url, workdir, name)
+    if quiet:
+        sys.stdout = open(os.devnull, "w")
+    start = time.perf_counter()
+    result = STAGES[name](workdir)
+    result["wall_seconds"] = time.perf_counter() - start
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if platform.system() == "Darwin" else 1024
+    result["peak_rss_mb"] = round(max(own, children) * scale / 1024 / 1024, 1)
+    return result
+
+
+def directory_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def fetch_json(url):
+    with urllib.request.urlopen(url) as response:
+        return json.loads(response.read())
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_server(args):
+    command = [sys.executable, "-m", "bench.fake_server", "--port", "0", "--seed", str(args.seed),
+               "--questions", str(args.questions), "--articles", str(args.articles),
+               "--pages-per-root", str(args.pages_per_root), "--latency", str(args.latency)]
+    src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen(command, cwd=src_dir, stdout=subprocess.PIPE, text=True)
+    url = process.stdout.readline().strip()
+    if not url:
+        process.kill()
+        raise RuntimeError("fake server did not start")
+    return process, url
+
+
+def compare(current, baseline_path):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} (commit {baseline.get('commit')}):")
+    for name, stage in current["stages"].items():
+        old = baseline.get("stages", {}).get(name)
+        if not old:
+            continue
+        print(f"  {name:<24} wall {old['wall_seconds']:8.2f}s -> {stage['wall_seconds']:8.2f}s "
+              f"({(stage['wall_seconds'] / old['wall_seconds'] - 1) * 100 if old['wall_seconds'] else 0:+6.1f}%)  "
+              f"requests {old['requests']:>6} -> {stage['requests']:<6}  "
+              f"rss {old['peak_rss_mb']:7.1f} -> {stage['peak_rss_mb']:7.1f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma separated, in order")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--questions", type=int, default=2000)
+    parser.add_argument("--articles", type=int, default=200)
+    parser.add_argument("--pages-per-root", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every fake API response")
+    parser.add_argument("--output", help="write the results JSON here")
+    parser.add_argument("--compare", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--verbose", action="store_true", help="keep the pipeline's own log lines")
+    args = parser.parse_args(argv)
+
+    server, url = start_server(args)
+    results = {"commit": git_commit(), "timestamp": int(time.time()), "python": platform.python_version(),
+               "config": vars(args), "stages": {}}
+    try:
+        with tempfile.TemporaryDirectory(prefix="ingestion-bench-") as workdir:
+            context = multiprocessing.get_context("spawn")
+            for name in args.stages.split(","):
+                before = fetch_json(f"{url}/_stats")
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    stage = executor.submit(run_stage, name, url, workdir, not args.verbose).result()
+                after = fetch_json(f"{url}/_stats")
+                stage["requests"] = after["requests"] - before["requests"]
+                stage["response_bytes"] = after["bytes_sent"] - before["bytes_sent"]
+                stage["output_bytes"] = directory_bytes(os.path.join(workdir, "out", name))
+                items = stage.get("items")
+                stage["items_per_second"] = round(items / stage["wall_seconds"], 1) if items else None
+                results["stages"][name] = stage
+                print(f"{name:<24} wall={stage['wall_seconds']:8.2f}s  requests={stage['requests']:<6} "
+                      f"items={items if items is not None else '-':<7} "
+                      f"items/s={stage['items_per_second'] or '-':<8} rss={stage['peak_rss_mb']:7.1f}MB  "
+                      f"output={stage['output_bytes'] / 1024:9.0f}KB")
+    finally:
+        server.terminate()
+        server.wait()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
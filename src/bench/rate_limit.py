@@ -0,0 +1,71 @@
+"""
+Rate-limit benchmark: StackOverflow discovery and by-id fetches against a fake API that enforces limits.
+
+Runs bench.fake_server in-process with a per-second request limit and injected
+``backoff`` fields, then lists and fetches every matching question with many
+workers, once without and once with the RequestScheduler. Reports requests,
+throttle violations the server counted, retries and throughput.
+
+Run from src/:  python -m bench.rate_limit [--rate-limit 30] [--workers 8] [--questions 3000]
+"""
+import argparse
+import json
+import sys
+import time
+
+from bench.fake_server import FakeApiServer, FakeCorpus
+from bench.pipeline import question_plan
+
+
+def run(url, workers, batch_ids, scheduler):
+    from api.StackOverflow import StackOverflow
+    from util.batch_sizer import AdaptiveBatchSizer
+    from util.metrics import metrics
+    metrics.reset()
+    api = StackOverflow(f"{url}/so", "bench", max_workers=workers, scheduler=scheduler,
+                        batch_sizer_factory=lambda: AdaptiveBatchSizer(max_ids=batch_ids))
+    start = time.perf_counter()
+    error = None
+    items = 0
+    try:
+        for _ in api.iter_questions_by_ids(question_plan().iter_ids(api.iter_question_stubs)):
+            items += 1
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"[:160]
+    wall = time.perf_counter() - start
+    summary = metrics.summary()
+    return {"items": items, "wall_seconds": round(wall, 2), "requests": summary.get("so.requests", 0),
+            "requests_per_second": round(summary.get("so.requests", 0) / wall, 1) if wall else None,
+            "retries": summary.get("so.retries", 0), "backoffs": summary.get("so.backoffs", 0), "error": error}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--questions", type=int, default=3000)
+    parser.add_argument("--rate-limit", type=int, default=30, help="requests per second the fake API allows")
+    parser.add_argument("--backoff-every", type=int, default=40)
+    parser.add_argument("--backoff-seconds", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--batch-ids", type=int, default=5, help="ids per by-id request, small to make many requests")
+    args = parser.parse_args(argv)
+
+    from util.rate_limiter import RequestScheduler
+    server = FakeApiServer(FakeCorpus(questions=args.questions, articles=0, pages_per_root=0),
+                           latency=args.latency, rate_limit=args.rate_limit, backoff_every=args.backoff_every,
+                           backoff_seconds=args.backoff_seconds).start()
+    try:
+        for name, scheduler in (("unscheduled", None), ("scheduled", RequestScheduler())):
+            server.reset()
+            result = run(server.url, args.workers, args.batch_ids, scheduler)
+            result["violations"] = server.stats()["violations"]
+            print(f"{name:<12} {json.dumps(result)}")
+            # let any ban from the previous run run out
+            time.sleep(args.backoff_seconds + 1)
+    finally:
+        server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""
+Startup benchmark for the Lambda entry point: import time, then cold and warm init.
+
+Each repeat runs in a fresh interpreter, like a new Lambda container. It times
+``import handler``, the first token/client setup (cold) and a second one (warm).
+``-X importtime`` also reports the slowest imports. With --invocations N the
+handler runs N times in the same process against bench.fake_server, so the fixed
+per-invocation overhead of warm incremental runs shows up.
+
+Run from src/:  python -m bench.startup [--repeats 5] [--invocations 3] [--output startup.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# runs in the child interpreter; prints one JSON line
+PROBE = r"""
+import json, os, sys, time
+start = time.perf_counter()
+import handler
+imported = time.perf_counter()
+from api.StackOverflow import StackOverflow
+from api.confluence import ConfluenceAPI
+
+def init():
+    begin = time.perf_counter()
+    handler.get_api_client(StackOverflow, os.environ["STACKOVERFLOW_API_URL"],
+                           handler.token_provider("STACKOVERFLOW_API_KEY", "STACKOVERFLOW_API_KEY_PARAM"),
+                           cert_path=None, max_workers=4)
+    handler.get_api_client(ConfluenceAPI, os.environ["CONFLUENCE_API_URL"],
+                           handler.token_provider("CONFLUENCE_API_KEY", "CONFLUENCE_API_KEY_PARAM"),
+                           cert_path=None, max_workers=4)
+    return (time.perf_counter() - begin) * 1000
+
+cold = init()
+warm = init()
+invocations = []
+for i in range(int(os.environ["BENCH_INVOCATIONS"])):
+    sys.stdout, real = open(os.devnull, "w"), sys.stdout
+    begin = time.perf_counter()
+    handler.lambda_handler({"initial_load": True} if i == 0 else {}, None)
+    invocations.append((time.perf_counter() - begin) * 1000)
+    sys.stdout = real
+print(json.dumps({"import_ms": (imported - start) * 1000, "cold_init_ms": cold, "warm_init_ms": warm,
+                  "invocation_ms": invocations, "boto3_loaded": "boto3" in sys.modules}))
+"""
+
+
+def probe_env(url, workdir, invocations):
+    env = dict(os.environ)
+    env.update({
+        "SSM_OVERRIDE": "true",
+        "STACKOVERFLOW_API_URL": f"{url}/so",
+        "STACKOVERFLOW_API_KEY": "bench",
+        "CONFLUENCE_API_URL": f"{url}/confluence",
+        "CONFLUENCE_API_KEY": "bench",
+        "RAW_OUTPUT_DIR": os.path.join(workdir, "out"),
+        "CHECKPOINT_STORE": os.path.join(workdir, "checkpoints.json"),
+        "PARSE_CACHE_DIR": os.path.join(workdir, "parse_cache"),
+        "BENCH_INVOCATIONS": str(invocations),
+    })
+    return env
+
+
+def run_probe(env):
+    completed = subprocess.run([sys.executable, "-c", PROBE], cwd=SRC_DIR, env=env, capture_output=True,
+                               text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(env, top):
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", "import handler"], cwd=SRC_DIR,
+                               env=env, capture_output=True, text=True, check=True)
+    rows, children = [], []
+    for line in completed.stderr.splitlines():
+        parts = line.split("|")
+        # "import time: self [us] | cumulative | imported package", nested imports indented two spaces a level
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2][1:].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        # children are printed before their parent, so collect depth 1 until the top level module closes them
+        if depth == 1:
+            children.append((int(parts[1]) / 1000, name.strip()))
+        elif depth == 0:
+            if name == "handler":
+                rows = children
+            children = []
+    return sorted(rows, reverse=True)[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=5, help="fresh interpreters to average over")
+    parser.add_argument("--invocations", type=int, default=0, help="handler runs per interpreter")
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--top", type=int, default=10, help="slowest imports of handler.py to list")
+    parser.add_argument("--output", help="write the results JSON here")
+    args = parser.parse_args(argv)
+
+    server = None
+    url = "http://127.0.0.1:9"
+    if args.invocations:
+        server = subprocess.Popen([sys.executable, "-m", "bench.fake_server", "--port", "0", "--questions",
+                                   str(args.questions), "--articles", "20", "--pages-per-root", "20"],
+                                  cwd=SRC_DIR, stdout=subprocess.PIPE, text=True)
+        url = server.stdout.readline().strip()
+    try:
+        runs = []
+        with tempfile.TemporaryDirectory(prefix="startup-bench-") as workdir:
+            for i in range(args.repeats):
+                runs.append(run_probe(probe_env(url, os.path.join(workdir, str(i)), args.invocations)))
+            imports = slowest_imports(probe_env(url, workdir, 0), args.top)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    results = {key: round(statistics.median(run[key] for run in runs), 2)
+               for key in ("import_ms", "cold_init_ms", "warm_init_ms")}
+    results["boto3_loaded"] = any(run["boto3_loaded"] for run in runs)
+    if args.invocations:
+        results["invocation_ms"] = [round(statistics.median(run["invocation_ms"][i] for run in runs), 1)
+                                    for i in range(args.invocations)]
+    results["slowest_imports_ms"] = {name: round(ms, 1) for ms, name in imports}
+
+    print(f"import handler   {results['import_ms']:8.1f} ms  (median of {args.repeats})")
+    print(f"cold init        {results['cold_init_ms']:8.1f} ms")
+    print(f"warm init        {results['warm_init_ms']:8.1f} ms")
+    print(f"boto3 imported   {results['boto3_loaded']}")
+    for i, ms in enumerate(results.get("invocation_ms", [])):
+        print(f"invocation {i + 1:<5} {ms:8.1f} ms  ({'initial load' if i == 0 else 'incremental'})")
+    print("slowest imports of handler.py:")
+    for name, ms in results["slowest_imports_ms"].items():
+        print(f"  {ms:8.1f} ms  {name}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
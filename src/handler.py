@@ -1,16 +1,616 @@
 from api.StackOverflow import StackOverflow
 from api.confluence import ConfluenceAPI
 from util.Parser.question_parser import QuestionParser
-from util.aws import AWS
-from datetime import datetime, timedelta
+from util.aws import AWS, ParameterCache
+from datetime import datetime, timedelta, timezone
 import os
 import json
 import sys
 from util.filter import Filter
+from util.query_planner import QueryPlanner, ListingCursor
+from util.checkpoint import Watermark, checkpoint_store_from_uri
+from util.backfill import Backfill
+from util.shards import Deadline, LocalContext, work_queue_from_uri, split_windows, chunks
+from util.page_manifest import PageManifest
 from util.Parser.article_parser import ArticleParser
+from util.Parser.parse_cache import get_parse_cache
+from util.http_cache import get_http_cache
+from util.batch_sizer import AdaptiveBatchSizer
+from util.rate_limiter import get_request_scheduler
+from util.Parser.parse_executor import ParseExecutor
+from util.sink import output_sink_from_env
+from util.dedupe import dedupe_from_env, record_text
+from util.answer_merge import iter_question_updates
+from util.metrics import metrics, log_item
+import time
 
 
 aws_client = AWS(region_name=os.environ.get("AWS_REGION", "us-east-1"))
+query_planner = QueryPlanner()
+## module scope outlives one invocation, so warm starts reuse decrypted tokens and open API sessions
+parameter_cache = ParameterCache(aws_client, ttl_seconds=float(os.environ.get("SECRETS_TTL_SECONDS", "900")))
+api_clients = {}
+## built on first use; local runs share one in-process queue across invocations
+work_queue = None
+
+TAG_FILTERS = ["terraform", "tfe", "terraform-enterprise", "tfe-enterprise", "UDP", "gitlab", "gitlab-ci", "gitlab-ci-cd", "cicd", "venafi", "modules", "module", "gitlab-ci-pipelines", "gitlab-pipelines", "gitlab-pipeline", "devsecops", "devops"]
+# 1. https://confluence:8443/spaces/SSSECIWS01/pages/892986628/TFE+AWS
+# 2. https://confluence:8443/spaces/UP/pages/1521043813/Gitlab+Customer+Documentation
+# 3. https://confluence:8443/spaces/UP/pages/1235260306/UDP+2024-Production+Releases
+# 4. https://confluence:8443/spaces/UP/pages/1524995199/UDP+2025-Production+Releases
+# 5. https://confluence:8443/spaces/ENDO/pages/605591958/Operational+Workflows+-+AWS+Scripts+Usage+and+Jenkins+Setup
+# 6. https://confluence:8443/spaces/ENDO/pages/1503249254/GitLab+Operational+Workflow+Template+Mapping
+# STARTING_PAGES = [tuple(pair) for pair in json.loads(os.environ.get("CONFLUENCE_PAGES_TUPLE", "[]"))]
+STARTING_PAGES = [("892986628", "tfe"), ("1521043813", "gitlab"), ("1235260306", "gitlab"), ("1524995199", "gitlab"), ("605591958", "ops-tasks")]
+## custom execution for one-off gitlab YBYO page
+SINGLE_PAGES = [("1503249254", "gitlab-ops-tasks")]
+
+## per stream: id field, parser, stub listing used for ids (two_phase), listing carrying full items (single_pass), by-id fetch
+SO_STREAMS = {
+    "articles": {"id_field": "article_id", "parser": ArticleParser, "label": "article",
+                 "list_ids": "iter_article_stubs", "list_items": "iter_articles", "by_ids": "iter_articles_by_ids",
+                 "count": "count_articles"},
+    "questions": {"id_field": "question_id", "parser": QuestionParser, "label": "question",
+                  "list_ids": "iter_question_stubs", "list_items": "iter_questions_with_answers",
+                  "by_ids": "iter_questions_by_ids", "count": "count_questions"},
+}
+## first activity window an initial_load covers; nothing on the instance predates it
+BACKFILL_SINCE = int(datetime(2008, 1, 1, tzinfo=timezone.utc).timestamp())
+
+
+def ssm_override():
+    return os.environ.get("SSM_OVERRIDE", "false").lower() == "true"
+
+
+def token_provider(env_name, param_env_name):
+    """
+    Build the callable an API client asks for its token.
+    
+    :param env_name: Env var holding the token when SSM_OVERRIDE is set
+    :param param_env_name: Env var holding the SSM parameter name otherwise
+    :return: Callable taking an optional rejected token and returning the current one
+    """
+    ## allow local runs to use env var for API Key
+    if ssm_override():
+        return lambda stale=None: os.environ.get(env_name)
+    parameter_name = os.environ[param_env_name]
+    return lambda stale=None: parameter_cache.get(parameter_name, stale)
+
+
+def get_api_client(cls, api_url, provider, **settings):
+    """
+    Get the API client an earlier warm invocation built with the same settings, or build one.
+    
+    :param cls: StackOverflow or ConfluenceAPI
+    :param api_url: Base URL of the API
+    :param provider: Token provider from token_provider()
+    :param settings: Further constructor arguments; part of the cache key
+    :return: The client, holding the current token
+    """
+    key = (cls.__name__, api_url, tuple(sorted(settings.items())))
+    client = api_clients.get(key)
+    if client is None:
+        metrics.incr("api_clients.created")
+        client = api_clients[key] = cls(api_url=api_url, api_token=provider(), token_provider=provider, **settings)
+    else:
+        metrics.incr("api_clients.reused")
+        client.token_provider = provider
+        client.set_api_token(provider())
+    return client
+
+
+SECRETS_ERROR = {
+    "statusCode": 500,
+    "body": "Failed to retrieve API token from SSM."
+}
+
+
+def load_secrets():
+    """
+    Warm the token cache with one batched SSM call, skipped while the cached values are fresh.
+    
+    :return: False if SSM could not be read
+    """
+    if ssm_override():
+        return True
+    try:
+        parameter_cache.get_many([os.environ["STACKOVERFLOW_API_KEY_PARAM"], os.environ["CONFLUENCE_API_KEY_PARAM"]])
+    except Exception as e:
+        print(f"Error retrieving SSM parameters: {e}")
+        metrics.incr("secrets.errors")
+        return False
+    return True
+
+
+def get_stackoverflow_api():
+    return get_api_client(
+        StackOverflow,
+        os.environ["STACKOVERFLOW_API_URL"],
+        token_provider("STACKOVERFLOW_API_KEY", "STACKOVERFLOW_API_KEY_PARAM"),
+        cert_path=os.environ.get("CERT_PATH", None),
+        max_workers=int(os.environ.get("STACKOVERFLOW_MAX_WORKERS", "4")),
+        http_cache=get_http_cache(),
+        batch_sizer_factory=AdaptiveBatchSizer.from_env,
+        scheduler=get_request_scheduler()
+    )
+
+
+def get_confluence_api():
+    return get_api_client(
+        ConfluenceAPI,
+        os.environ["CONFLUENCE_API_URL"],
+        token_provider("CONFLUENCE_API_KEY", "CONFLUENCE_API_KEY_PARAM"),
+        cert_path=os.environ.get("CERT_PATH", None),
+        max_workers=int(os.environ.get("CONFLUENCE_MAX_WORKERS", "4")),
+        http_cache=get_http_cache()
+    )
+
+
+def confluence_sink(raw_output_dir, writer=None):
+    return output_sink_from_env(os.environ.get("CONFLUENCE_OUTPUT_DIR", f"{raw_output_dir}/confluence"), aws_client,
+                                writer)
+
+
+def get_work_queue():
+    """
+    Get the queue shard events go to: SQS when SHARD_QUEUE_URL is set, otherwise in-process.
+    
+    :return: A WorkQueue
+    """
+    global work_queue
+    if work_queue is None:
+        work_queue = work_queue_from_uri(os.environ.get("SHARD_QUEUE_URL"), aws_client)
+    return work_queue
+
+
+def resolve_watermark(event, checkpoint_store, source, default_lookback=None):
+    """
+    Pick the watermark a source resumes from.
+    
+    :param event: The Lambda event; ``initial_load`` and ``from_date`` override the stored watermark
+    :param checkpoint_store: CheckpointStore holding watermarks from earlier runs
+    :param source: Source name, e.g. "so:questions"
+    :param default_lookback: timedelta to look back when the source has no watermark yet, None for everything
+    :return: A Watermark
+    """
+    if 'initial_load' in event:
+        return Watermark()
+    if 'from_date' in event:
+        return Watermark(value=int(event['from_date']))
+    stored = checkpoint_store.get(source)
+    if stored is not None:
+        return stored
+    if default_lookback is None:
+        return Watermark()
+    since = datetime.now(timezone.utc) - default_lookback
+    return Watermark(value=int(since.timestamp()))
+
+
+def run_pipeline(items, parser_cls, id_field, sink, stream, label, watermark=None, dedupe=None, on_processed=None):
+    """
+    Stream items through parsing and writing one at a time.
+    
+    :param items: Iterable of full item dicts, consumed lazily
+    :param parser_cls: Parser class used for each item
+    :param id_field: The field holding each item's id
+    :param sink: OutputSink the parsed items are written to
+    :param stream: Sink stream, e.g. "questions"
+    :param label: Item kind used in log lines
+    :param watermark: Optional Watermark; covered items are skipped and it is advanced past written ones
+    :param dedupe: Optional Deduplicator; near-duplicates of items already written are dropped
+    :param on_processed: Optional callable(item_id), called in input order once an item is written or dropped
+    :return: Number of items written
+    """
+    if watermark is not None:
+        items = (item for item in items
+                 if not watermark.covers(item.get(id_field, "unknown"), item.get("last_activity_date")))
+
+    written = 0
+    start = time.perf_counter()
+    ## parsing runs on a process pool, writing stays here in a single writer
+    for item, parsed in ParseExecutor.from_env(parser_cls).map(items):
+        item_id = item.get(id_field, "unknown")
+        candidate = None
+        if dedupe is not None:
+            candidate = dedupe.check(stream, item_id, record_text(parsed), item.get("score"),
+                                     item.get("last_activity_date"))
+            if candidate is None:
+                log_item(f"Skipped {label} {item_id}, a near-duplicate of an item already written")
+                if watermark is not None:
+                    watermark.observe(item_id, item.get("last_activity_date"))
+                if on_processed is not None:
+                    on_processed(item_id)
+                continue
+        with metrics.timer("write_ms"):
+            location = sink.write_record(stream, item_id, parsed)
+        log_item(f"Parsed and saved {label} {item_id} to {location}")
+        if candidate is not None:
+            dedupe.add(candidate, location)
+        if watermark is not None:
+            watermark.observe(item_id, item.get("last_activity_date"))
+        if on_processed is not None:
+            on_processed(item_id)
+        written += 1
+    elapsed = time.perf_counter() - start
+    metrics.incr(f"{stream}.items_written", written)
+    metrics.gauge(f"{stream}.items_per_second", round(written / elapsed, 2) if elapsed else 0, unit="Count/Second")
+    return written
+
+
+def start_backfill(stream_name, plan, checkpoint_store, sink, on_durable=None):
+    """
+    Resume a stream's unfinished backfill, or plan a new one over all of history.
+    
+    :param stream_name: Key of SO_STREAMS
+    :param plan: QueryPlan of the stream
+    :param checkpoint_store: CheckpointStore the backfill's progress is kept in
+    :param sink: OutputSink the stream writes to, closed before progress is saved
+    :param on_durable: Optional callable run once the sink is closed and before progress is saved,
+        e.g. persisting the dedupe index
+    :return: A Backfill
+    """
+    stackoverflow_api = get_stackoverflow_api()
+    state = checkpoint_store.get_state(f"backfill:{stream_name}")
+    backfill = Backfill.from_dict(plan, state) if state and state.get("queries") == plan.queries else None
+    if backfill is not None and not backfill.complete:
+        print(f"Resuming backfill of {stream_name}: {len(backfill.done)} of {len(backfill.units)} windows done")
+    else:
+        page_size = 100
+        backfill = Backfill.plan(
+            plan, getattr(stackoverflow_api, SO_STREAMS[stream_name]["count"]), StackOverflow.activity_params,
+            BACKFILL_SINCE, int(time.time()),
+            target_items=int(os.environ.get("BACKFILL_WINDOW_PAGES", "5")) * page_size,
+            min_window_seconds=int(os.environ.get("BACKFILL_MIN_WINDOW_HOURS", "1")) * 3600,
+            max_workers=stackoverflow_api.max_workers)
+        print(f"Planned backfill of {stream_name} in {len(backfill.units)} windows")
+
+    def save():
+        ## windows only count as done once the shards holding their items are durable
+        sink.close()
+        if on_durable is not None:
+            on_durable()
+        checkpoint_store.set_state(f"backfill:{stream_name}", backfill.to_dict())
+
+    backfill.save = save
+    backfill.checkpoint_seconds = float(os.environ.get("BACKFILL_CHECKPOINT_SECONDS", "60"))
+    return backfill
+
+
+def backfill_items(stream_name, backfill, fetch_mode):
+    """
+    Stream a backfill's items, its windows listed concurrently.
+    
+    :param stream_name: Key of SO_STREAMS
+    :param backfill: Backfill from start_backfill
+    :param fetch_mode: "single_pass" or "two_phase"
+    :return: Generator of full items
+    """
+    stream = SO_STREAMS[stream_name]
+    stackoverflow_api = get_stackoverflow_api()
+    if fetch_mode == "two_phase":
+        stubs = backfill.items(getattr(stackoverflow_api, stream["list_ids"]), StackOverflow.activity_params,
+                               stackoverflow_api.max_workers)
+        return getattr(stackoverflow_api, stream["by_ids"])(stub[stream["id_field"]] for stub in stubs)
+    return backfill.items(getattr(stackoverflow_api, stream["list_items"]), StackOverflow.activity_params,
+                          stackoverflow_api.max_workers)
+
+
+def finish_backfill(stream_name, backfill, checkpoint_store):
+    """
+    Record a drained backfill as complete.
+    
+    :return: Watermark the next incremental run starts from: the end of the backfilled history
+    """
+    backfill.finish()
+    checkpoint_store.set_state(f"backfill:{stream_name}", backfill.to_dict())
+    return Watermark(value=backfill.until)
+
+
+def emit_metrics(context, elapsed):
+    """
+    Print the invocation's metrics as one CloudWatch EMF line.
+    
+    :param context: The Lambda context, None for local runs
+    :param elapsed: Invocation wall time in seconds
+    """
+    summary = metrics.summary()
+    parse_ms = summary.get("parse.item_ms", {}).get("sum", 0)
+    html_kb = summary.get("parse.html_bytes", 0) / 1024
+    if html_kb:
+        metrics.gauge("parse.ms_per_kb", round(parse_ms / html_kb, 3), unit="Milliseconds")
+    metrics.gauge("invocation_seconds", round(elapsed, 3), unit="Seconds")
+    function_name = getattr(context, "function_name", None) or "local"
+    metrics.emit(dimensions={"Function": function_name})
+
+
+def parse_cache_counts():
+    parse_cache = get_parse_cache()
+    return (parse_cache.hits, parse_cache.misses) if parse_cache is not None else (0, 0)
+
+
+def start_invocation():
+    """
+    Reset the per-invocation metrics.
+    
+    :return: Invocation start for finish_invocation: perf_counter time and the parse cache counts,
+        which run on from cold start across warm invocations
+    """
+    metrics.reset()
+    return time.perf_counter(), parse_cache_counts()
+
+
+def finish_invocation(context, invocation_start):
+    started, (hits, misses) = invocation_start
+    if get_parse_cache() is not None:
+        hits_now, misses_now = parse_cache_counts()
+        metrics.incr("parse_cache.hits", hits_now - hits)
+        metrics.incr("parse_cache.misses", misses_now - misses)
+    emit_metrics(context, time.perf_counter() - started)
+
+
+def plan_shards(event, checkpoint_store, until):
+    """
+    Split one run into shards: activity windows per StackOverflow stream and one shard per Confluence root.
+    
+    :param event: The coordinator event; ``initial_load``, ``from_date`` and ``window_days`` are honoured
+    :param checkpoint_store: CheckpointStore holding the StackOverflow watermarks
+    :param until: Epoch seconds the listing windows end at, exclusive
+    :return: List of shard dicts
+    """
+    window_seconds = int(event.get("window_days", os.environ.get("SHARD_WINDOW_DAYS", "90"))) * 24 * 3600
+    shards = []
+    for stream in SO_STREAMS:
+        watermark = resolve_watermark(event, checkpoint_store, f"so:{stream}", timedelta(hours=24))
+        since = watermark.value if watermark.value is not None else BACKFILL_SINCE
+        ## run and window tie a finished shard back to its place in this plan, see advance_listing_watermarks
+        shards.extend({"kind": "so_listing", "stream": stream, "since": start, "until": end, "run": until,
+                       "window": index}
+                      for index, (start, end) in enumerate(split_windows(since, until, window_seconds)))
+    ## Confluence workers resolve their own watermarks, from the state kept per root
+    overrides = {key: event[key] for key in ("initial_load", "from_date") if key in event}
+    shards.extend(dict(overrides, kind="confluence_root", page_id=page, classifier=classifier)
+                  for page, classifier in STARTING_PAGES)
+    shards.extend(dict(overrides, kind="confluence_page", page_id=page, classifier=classifier)
+                  for page, classifier in SINGLE_PAGES)
+    return shards
+
+
+def listing_window_store(checkpoint_uri, stream, index):
+    """
+    Get the document a listing shard marks its window finished in.
+    
+    Documents are numbered by the window's place in a plan and reused by every
+    plan, so the shards of one plan never write the same document and old plans
+    leave nothing behind.
+    
+    :param checkpoint_uri: Location of the checkpoint store
+    :param stream: StackOverflow stream, e.g. "questions"
+    :param index: Position of the window in its plan
+    :return: A CheckpointStore
+    """
+    return checkpoint_store_from_uri(checkpoint_uri, aws_client, partition=f"so-window-{stream}-{index}")
+
+
+def window_marker(shard):
+    return {"run": shard["run"], "since": shard["since"], "until": shard["until"]}
+
+
+def advance_listing_watermarks(checkpoint_store, checkpoint_uri):
+    """
+    Move each StackOverflow watermark past the windows of the last plan whose listing shards finished.
+    
+    Windows are taken in order, so a watermark stops at the first window still
+    running or dead-lettered; that window and the ones after it are planned again.
+    
+    :param checkpoint_store: CheckpointStore holding the StackOverflow watermarks and plans
+    :param checkpoint_uri: Location of the checkpoint store
+    """
+    for stream in SO_STREAMS:
+        plan = checkpoint_store.get_state(f"so:plan:{stream}")
+        if not plan:
+            continue
+        done = None
+        for index, (since, until) in enumerate(plan["windows"]):
+            marker = listing_window_store(checkpoint_uri, stream, index).get_state("so:window")
+            if marker != {"run": plan["run"], "since": since, "until": until}:
+                break
+            done = until
+        stored = checkpoint_store.get(f"so:{stream}")
+        if done is not None and (stored is None or stored.value is None or done > stored.value):
+            checkpoint_store.set(f"so:{stream}", Watermark(value=done))
+
+
+def run_coordinator(event, checkpoint_store, checkpoint_uri):
+    """
+    Enqueue one worker event per shard.
+    
+    StackOverflow watermarks only move past windows whose shards have finished:
+    each run first advances them over the previous plan, then plans from there.
+    
+    :param event: The coordinator event, its ``fetch_mode`` is passed on to every worker
+    :param checkpoint_store: CheckpointStore holding the StackOverflow watermarks
+    :param checkpoint_uri: Location of the checkpoint store
+    :return: A response dict
+    """
+    advance_listing_watermarks(checkpoint_store, checkpoint_uri)
+    until = int(time.time())
+    shards = plan_shards(event, checkpoint_store, until)
+    for stream in SO_STREAMS:
+        windows = [[shard["since"], shard["until"]] for shard in shards
+                   if shard["kind"] == "so_listing" and shard["stream"] == stream]
+        checkpoint_store.set_state(f"so:plan:{stream}", {"run": until, "windows": windows})
+    get_work_queue().put_many([{"fetch_mode": event["fetch_mode"], "shard": shard} for shard in shards])
+    metrics.incr("shards.enqueued", len(shards))
+    print(f"Enqueued {len(shards)} shards")
+    return {"statusCode": 200, "body": json.dumps({"shards": len(shards)})}
+
+
+def shard_name(shard):
+    """
+    Stable name of a shard, shared with its continuations, so they resume its interrupted S3 uploads.
+    
+    :param shard: Shard dict
+    :return: Name usable in an S3 key
+    """
+    if "writer" in shard:
+        return shard["writer"]
+    if shard["kind"] == "so_listing":
+        ## a window still running when the next plan lists it again must not share its upload
+        return f"so_listing-{shard['stream']}-{shard['since']}-{shard['run']}"
+    if shard["kind"] == "so_ids":
+        return f"so_ids-{shard['stream']}-{shard['ids'][0] if shard['ids'] else 0}"
+    return f"{shard['kind']}-{shard['page_id']}"
+
+
+def run_listing_shard(event, deadline, raw_output_dir, checkpoint_uri):
+    """
+    List one activity window of a StackOverflow stream, from the shard's cursor until the deadline.
+    
+    In two_phase mode the listed ids are enqueued as ``so_ids`` shards; otherwise
+    the listing payloads are parsed and written here.
+    
+    :return: Continuation shard, or None when the window is done
+    """
+    shard = event["shard"]
+    stream = SO_STREAMS[shard["stream"]]
+    stackoverflow_api = get_stackoverflow_api()
+    plan = query_planner.plan(Filter(key="tags", values=TAG_FILTERS, id_field=stream["id_field"]))
+    window = StackOverflow.activity_params(shard["since"], shard.get("until"))
+    cursor = ListingCursor.from_dict(shard.get("cursor"), stop=deadline.expired)
+    if event["fetch_mode"] == "two_phase":
+        ## listing ids is cheap next to fetching and parsing them, so the ids fan out as shards of their own
+        ids = plan.discover(getattr(stackoverflow_api, stream["list_ids"]), window, cursor).ids
+        batch_size = int(os.environ.get("SHARD_ID_BATCH_SIZE", "500"))
+        get_work_queue().put_many([dict(event, shard={"kind": "so_ids", "stream": shard["stream"],
+                                                      "ids": batch.tolist()})
+                                   for batch in chunks(ids, batch_size)])
+        metrics.incr("shards.enqueued", -(-len(ids) // batch_size))
+    else:
+        sink = output_sink_from_env(raw_output_dir, aws_client, shard_name(shard))
+        items = plan.iter_items(getattr(stackoverflow_api, stream["list_items"]), window, cursor)
+        run_pipeline(items, stream["parser"], stream["id_field"], sink, shard["stream"], stream["label"])
+        sink.close()
+    if cursor.stopped:
+        return dict(shard, cursor=cursor.to_dict())
+    ## in two_phase the window is finished once its ids are enqueued; an so_ids shard that keeps failing
+    ## is left to the queue's redrive policy and dead-letter queue, a later plan does not list it again
+    listing_window_store(checkpoint_uri, shard["stream"], shard["window"]).set_state("so:window", window_marker(shard))
+    return None
+
+
+def run_ids_shard(event, deadline, raw_output_dir, checkpoint_uri):
+    """
+    Fetch, parse and write a batch of StackOverflow ids until the deadline.
+    
+    :return: Continuation shard holding the ids not reached, or None when all were written
+    """
+    shard = event["shard"]
+    stream = SO_STREAMS[shard["stream"]]
+    ids = shard["ids"]
+    fed = []
+
+    def until_deadline():
+        ## every id handed to the by-id fetch gets written, so the ones never handed over are exactly what is left
+        for item_id in ids:
+            if deadline.expired():
+                return
+            fed.append(item_id)
+            yield item_id
+
+    sink = output_sink_from_env(raw_output_dir, aws_client, shard_name(shard))
+    items = getattr(get_stackoverflow_api(), stream["by_ids"])(until_deadline())
+    run_pipeline(items, stream["parser"], stream["id_field"], sink, shard["stream"], stream["label"])
+    sink.close()
+    remaining = ids[len(fed):]
+    if remaining:
+        return dict(shard, ids=remaining, writer=shard_name(shard))
+    return None
+
+
+def run_confluence_root_shard(event, deadline, raw_output_dir, checkpoint_uri):
+    """
+    Save one starting page's subtree until the deadline.
+    
+    :return: Continuation shard, or None when the subtree is done
+    """
+    shard = event["shard"]
+    page = shard["page_id"]
+    ## each root keeps its own state document, so roots running side by side never overwrite each other
+    checkpoint_store = checkpoint_store_from_uri(checkpoint_uri, aws_client, partition=f"confluence-{page}")
+    if "watermark" in shard:
+        watermark = Watermark.from_dict(shard["watermark"])
+    else:
+        watermark = resolve_watermark(shard, checkpoint_store, f"confluence:{page}")
+    start = watermark.to_dict()
+    if "initial_load" in shard:
+        page_manifest = PageManifest()
+    else:
+        page_manifest = PageManifest.from_dict(checkpoint_store.get_state("confluence:pages"))
+    confluence_api = get_confluence_api()
+    confluence_api.begin_run(sink=confluence_sink(raw_output_dir, shard_name(shard)), manifest=page_manifest,
+                             should_stop=deadline.expired)
+    ## pages under the other roots are left to their own shards
+    confluence_api.fetch_subtrees([(page, shard["classifier"])], {page: watermark},
+                                  root_ids=[root for root, _ in STARTING_PAGES])
+    confluence_api.sink.close()
+    checkpoint_store.set_state("confluence:pages", page_manifest.to_dict())
+    if confluence_api.stopped:
+        ## saved pages are in the manifest and skipped as unchanged; the watermark stays where this shard started
+        return {"kind": shard["kind"], "page_id": page, "classifier": shard["classifier"], "watermark": start}
+    checkpoint_store.set(f"confluence:{page}", watermark)
+    return None
+
+
+def run_confluence_page_shard(event, deadline, raw_output_dir, checkpoint_uri):
+    shard = event["shard"]
+    page = shard["page_id"]
+    checkpoint_store = checkpoint_store_from_uri(checkpoint_uri, aws_client, partition=f"confluence-{page}")
+    watermark = resolve_watermark(shard, checkpoint_store, f"confluence:{page}")
+    if "initial_load" in shard:
+        page_manifest = PageManifest()
+    else:
+        page_manifest = PageManifest.from_dict(checkpoint_store.get_state("confluence:pages"))
+    confluence_api = get_confluence_api()
+    confluence_api.begin_run(sink=confluence_sink(raw_output_dir, shard_name(shard)), manifest=page_manifest)
+    confluence_api.process_single_page(page, shard["classifier"], watermark)
+    confluence_api.sink.close()
+    checkpoint_store.set(f"confluence:{page}", watermark)
+    checkpoint_store.set_state("confluence:pages", page_manifest.to_dict())
+    return None
+
+
+SHARD_RUNNERS = {
+    "so_listing": run_listing_shard,
+    "so_ids": run_ids_shard,
+    "confluence_root": run_confluence_root_shard,
+    "confluence_page": run_confluence_page_shard,
+}
+
+
+def run_shard(event, context, raw_output_dir, checkpoint_uri):
+    """
+    Work on one shard until it is done or the invocation is about to time out.
+    
+    A shard that runs out of time is re-enqueued with a continuation describing
+    where it stopped, so the next worker picks up from there.
+    
+    :param event: The worker event, ``{"fetch_mode": ..., "shard": {"kind": ..., ...}}``
+    :param context: The Lambda context, None never times out
+    :param raw_output_dir: Root output directory
+    :param checkpoint_uri: Location of the checkpoint store
+    :return: A response dict carrying the continuation, if any
+    """
+    if not load_secrets():
+        return SECRETS_ERROR
+    shard = event["shard"]
+    deadline = Deadline(context, float(os.environ.get("SHARD_RESERVE_SECONDS", "60")))
+    continuation = SHARD_RUNNERS[shard["kind"]](event, deadline, raw_output_dir, checkpoint_uri)
+    if continuation is not None:
+        metrics.incr("shards.continued")
+        print(f"Out of time, re-enqueuing {shard['kind']} shard from where it stopped")
+        get_work_queue().put(dict(event, shard=continuation))
+    return {"statusCode": 200, "body": json.dumps({"kind": shard["kind"], "continuation": continuation})}
+
 
 def lambda_handler(event, context):
     """
@@ -20,138 +620,179 @@ def lambda_handler(event, context):
     :param context: The runtime information of the Lambda function (object)
     :return: A response dict
     """
+    if "Records" in event:
+        ## SQS delivers shard events wrapped in records
+        return [lambda_handler(json.loads(record["body"]), context) for record in event["Records"]]
     # Log the received event
     print("Received event:", event)
-    from_date = None
-    if 'initial_load' not in event:
-        if 'from_date' in event:
-            from_date = event['from_date']
-        else:
-            now = datetime.now(datetime.timezone.utc)
-            timestamp_24_hours_ago = now - timedelta(hours=24)
-            # Convert to a UTC timestamp
-            from_date = int(timestamp_24_hours_ago.timestamp())
-
-    api_token = None
-    ## allow local runs to use env var for API Key
-    if os.environ.get("SSM_OVERRIDE", "false").lower() == "true":
-        api_token = os.environ.get("STACKOVERFLOW_API_KEY")
-    else:
-        ssm_client = aws_client.get_ssm_client()
-        try:
-            response = ssm_client.get_parameter(Name=os.environ["STACKOVERFLOW_API_KEY_PARAM"], WithDecryption=True)
-            api_token = response["Parameter"]["Value"]
-        except Exception as e:
-            print(f"Error retrieving SSM parameter: {e}")
-            return {
-                "statusCode": 500,
-                "body": "Failed to retrieve API token from SSM."
-            }
-    stackoverflow_api = StackOverflow(
-        api_url=os.environ["STACKOVERFLOW_API_URL"],
-        api_token=api_token,
-        from_date=from_date,
-        cert_path=os.environ.get("CERT_PATH", None)
-    )
+    invocation_start = start_invocation()
+    ## single_pass parses listing payloads directly, two_phase lists ids then fetches details by id
+    fetch_mode = event.get("fetch_mode", os.environ.get("FETCH_MODE", "single_pass"))
+    raw_output_dir = os.environ.get("RAW_OUTPUT_DIR", "/tmp")
+    checkpoint_uri = os.environ.get("CHECKPOINT_STORE", f"{raw_output_dir}/checkpoints.json")
+    checkpoint_store = checkpoint_store_from_uri(checkpoint_uri, aws_client)
+
+    ## "coordinator" splits the run into shard events, a "shard" event works on one until it nears the timeout
+    if "shard" in event:
+        response = run_shard(dict(event, fetch_mode=fetch_mode), context, raw_output_dir, checkpoint_uri)
+        finish_invocation(context, invocation_start)
+        return response
+    if event.get("mode") == "coordinator":
+        response = run_coordinator(dict(event, fetch_mode=fetch_mode), checkpoint_store, checkpoint_uri)
+        finish_invocation(context, invocation_start)
+        return response
+
+    output_sink = output_sink_from_env(raw_output_dir, aws_client)
+    confluence_output = confluence_sink(raw_output_dir)
+    ## near-duplicate index across every stream, kept in its own document since it grows with the corpus
+    dedupe_store = checkpoint_store_from_uri(checkpoint_uri, aws_client, partition="dedupe")
+    dedupe = dedupe_from_env(lambda: None if 'initial_load' in event else dedupe_store.get_state("dedupe:index"))
+    if dedupe is not None:
+        def delete_duplicate(stream, record_id, location):
+            ## a superseded copy is removed from whichever sink wrote it
+            sink = output_sink if stream in SO_STREAMS else confluence_output
+            sink.delete(stream, record_id, location)
+        dedupe.on_superseded = delete_duplicate
+
+    def save_dedupe():
+        ## saved before every watermark, so items a watermark moves past are always in the saved index;
+        ## superseded copies may be tombstoned in either sink, so both are made durable first
+        if dedupe is None:
+            return
+        output_sink.close()
+        confluence_output.close()
+        dedupe_store.set_state("dedupe:index", dedupe.to_dict())
+
+    if not load_secrets():
+        ## the failed invocation still gets its EMF line, so the alarm on secrets.errors can see it
+        finish_invocation(context, invocation_start)
+        return SECRETS_ERROR
+    stackoverflow_api = get_stackoverflow_api()
     
     ### START: Article retrieval and processing ################
     print("Fetching articles from StackOverflow API...")
-    all_articles = stackoverflow_api.get_articles()
-    print(f"Retrieved {len(all_articles)} articles from StackOverflow API.")
-    article_filters = ["terraform", "tfe", "terraform-enterprise", "tfe-enterprise", "UDP", "gitlab", "gitlab-ci", "gitlab-ci-cd", "cicd", "venafi", "modules", "module", "gitlab-ci-pipelines", "gitlab-pipelines", "gitlab-pipeline", "devsecops", "devops"]
+    article_filters = TAG_FILTERS
     article_filter = Filter(
         key="tags",
         values=article_filters,
         id_field="article_id"
     )
-    article_ids = article_filter.do_filter(all_articles)
-    print(f"Found {len(article_ids)} articles matching filters: {article_filters}")
+    article_plan = query_planner.plan(article_filter)
+    article_watermark = resolve_watermark(event, checkpoint_store, "so:articles", timedelta(hours=24))
+    article_window = StackOverflow.activity_params(article_watermark.value) if article_watermark.value else None
+    article_backfill = None
+    if 'initial_load' in event:
+        ## history is split into activity windows listed side by side instead of paging one listing from page 1
+        article_backfill = start_backfill("articles", article_plan, checkpoint_store, output_sink, save_dedupe)
+        articles = backfill_items("articles", article_backfill, fetch_mode)
+    elif fetch_mode == "two_phase":
+        article_ids = article_plan.iter_ids(stackoverflow_api.iter_article_stubs, article_window)
+        articles = stackoverflow_api.iter_articles_by_ids(article_ids)
+    else:
+        ## the article listing filter already carries everything ArticleParser needs
+        articles = article_plan.iter_items(stackoverflow_api.iter_articles, article_window)
 
     # parsing
-    raw_output_dir = os.environ.get("RAW_OUTPUT_DIR", "/tmp")
-    article_output_dir = f"{raw_output_dir}/articles"
-    os.makedirs(article_output_dir, exist_ok=True)
-    article_content_list = stackoverflow_api.get_articles_by_ids(article_ids=article_ids)
-    for article in article_content_list:
-        article_parser = ArticleParser(article)
-        article_id = article.get("article_id", "unknown")
-        outfile = os.path.join(article_output_dir, f"{article_id}.json")
-        article_parser.parse_to_outfile(outfile)
-        print(f"Parsed and saved article {article_id} to {outfile}")
+    article_count = run_pipeline(articles, ArticleParser, "article_id", output_sink, "articles", "article",
+                                 article_watermark, dedupe,
+                                 article_backfill.processed if article_backfill is not None else None)
+    ## shards must be durable before the watermark moves past them
+    output_sink.close()
+    save_dedupe()
+    if article_backfill is not None:
+        article_watermark = finish_backfill("articles", article_backfill, checkpoint_store)
+    checkpoint_store.set("so:articles", article_watermark)
+    print(f"Saved {article_count} articles matching filters: {article_filters}")
 
     ### END: Article retrieval and processing ################
     ### START: Question retrieval and processing ################
     print("Fetching questions from StackOverflow API...")
-    all_questions = stackoverflow_api.get_questions()
-    print(f"Retrieved {len(all_questions)} questions from StackOverflow API.")
-    question_filters = ["terraform", "tfe", "terraform-enterprise", "tfe-enterprise", "UDP", "gitlab", "gitlab-ci", "gitlab-ci-cd", "cicd", "venafi", "modules", "module", "gitlab-ci-pipelines", "gitlab-pipelines", "gitlab-pipeline", "devsecops", "devops"]
+    question_filters = TAG_FILTERS
     question_filter = Filter(
         key="tags",
         values=question_filters,
         id_field="question_id"
     )
-    question_ids = question_filter.do_filter(all_questions)
-    print(f"Found {len(question_ids)} questions matching filters: {question_filters}")
+    question_plan = query_planner.plan(question_filter)
+    question_watermark = resolve_watermark(event, checkpoint_store, "so:questions", timedelta(hours=24))
+    question_window = StackOverflow.activity_params(question_watermark.value) if question_watermark.value else None
+    question_backfill = None
+    if 'initial_load' in event:
+        question_backfill = start_backfill("questions", question_plan, checkpoint_store, output_sink, save_dedupe)
+        questions = backfill_items("questions", question_backfill, fetch_mode)
+    elif (question_window is not None and output_sink.reads_records
+          and os.environ.get("ANSWER_MERGE", "true").lower() == "true"):
+        ## most changed questions only gained or edited answers: those are fetched and merged into the stored record;
+        ## sinks that can't read records back would refetch every question on top of the change listing
+        question_changes = question_plan.iter_items(stackoverflow_api.iter_question_changes, question_window)
+        questions = iter_question_updates(question_changes, stackoverflow_api, output_sink, question_watermark.value)
+    elif fetch_mode == "two_phase":
+        question_ids = question_plan.iter_ids(stackoverflow_api.iter_question_stubs, question_window)
+        questions = stackoverflow_api.iter_questions_by_ids(question_ids)
+    else:
+        questions = question_plan.iter_items(stackoverflow_api.iter_questions_with_answers, question_window)
 
     # parsing
-    raw_output_dir = os.environ.get("RAW_OUTPUT_DIR", "/tmp")
-    question_output_dir = f"{raw_output_dir}/questions"
-    os.makedirs(question_output_dir, exist_ok=True)
-    question_content_list = stackoverflow_api.get_questions_by_ids(question_ids=question_ids)
-    for question in question_content_list:
-        question_parser = QuestionParser(question)
-        question_id = question.get("question_id", "unknown")
-        outfile = os.path.join(question_output_dir, f"{question_id}.json")
-        question_parser.parse_to_outfile(outfile)
-        print(f"Parsed and saved question {question_id} to {outfile}")
+    question_count = run_pipeline(questions, QuestionParser, "question_id", output_sink, "questions", "question",
+                                  question_watermark, dedupe,
+                                  question_backfill.processed if question_backfill is not None else None)
+    output_sink.close()
+    save_dedupe()
+    if question_backfill is not None:
+        question_watermark = finish_backfill("questions", question_backfill, checkpoint_store)
+    checkpoint_store.set("so:questions", question_watermark)
+    print(f"Saved {question_count} questions matching filters: {question_filters}")
 
     # ### END: Question retrieval and processing ################
     ### START: Confluence processing ################
     print("Fetching Confluence pages...")
-    ## allow local runs to use env var for API Key
-    if os.environ.get("SSM_OVERRIDE", "false").lower() == "true":
-        api_token = os.environ.get("CONFLUENCE_API_KEY")
+    starting_pages = STARTING_PAGES
+    ## what was saved on earlier runs, so only pages whose version moved are downloaded again
+    if 'initial_load' in event:
+        page_manifest = PageManifest()
     else:
-        ssm_client = aws_client.get_ssm_client()
-        try:
-            response = ssm_client.get_parameter(Name=os.environ["CONFLUENCE_API_KEY_PARAM"], WithDecryption=True)
-            api_token = response["Parameter"]["Value"]
-        except Exception as e:
-            print(f"Error retrieving SSM parameter: {e}")
-            return {
-                "statusCode": 500,
-                "body": "Failed to retrieve API token from SSM."
-            }
-    # 1. https://confluence:8443/spaces/SSSECIWS01/pages/892986628/TFE+AWS
-    # 2. https://confluence:8443/spaces/UP/pages/1521043813/Gitlab+Customer+Documentation
-    # 3. https://confluence:8443/spaces/UP/pages/1235260306/UDP+2024-Production+Releases
-    # 4. https://confluence:8443/spaces/UP/pages/1524995199/UDP+2025-Production+Releases
-    # 5. https://confluence:8443/spaces/ENDO/pages/605591958/Operational+Workflows+-+AWS+Scripts+Usage+and+Jenkins+Setup
-    # 6. https://confluence:8443/spaces/ENDO/pages/1503249254/GitLab+Operational+Workflow+Template+Mapping
-    # starting_pages = [tuple(pair) for pair in json.loads(os.environ.get("CONFLUENCE_PAGES_TUPLE", "[]"))]
-    starting_pages = [  ("892986628", "tfe"), ("1521043813", "gitlab"), ("1235260306", "gitlab"), ("1524995199", "gitlab"), ("605591958", "ops-tasks")]
-    raw_output_dir = os.environ.get("RAW_OUTPUT_DIR", "/tmp")
-    confluence_output_dir = f"{raw_output_dir}/confluence"
-    confluence_api = ConfluenceAPI(
-        api_url=os.environ["CONFLUENCE_API_URL"],
-        api_token=api_token,
-        cert_path=os.environ.get("CERT_PATH", None),
-        output_dir=os.environ.get("CONFLUENCE_OUTPUT_DIR", confluence_output_dir)
-    )
+        page_manifest = PageManifest.from_dict(checkpoint_store.get_state("confluence:pages"))
+    confluence_api = get_confluence_api()
+    confluence_api.begin_run(sink=confluence_output, manifest=page_manifest, dedupe=dedupe)
 
-    ## straying a bit from the stackoverflow pattern here, as confluence requires some recursion and it's simplest
+    ## straying a bit from the stackoverflow pattern here, as confluence requires a tree walk and it's simplest
     ## to allow the confluenceAPI to handle the parsing itself. TODO: refactor maybe?
-    for page, classifier in starting_pages:
-        confluence_api.do_process(page, classifier)
+    ## all roots are crawled together so pages shared between them are only fetched once
+    page_watermarks = {page: resolve_watermark(event, checkpoint_store, f"confluence:{page}")
+                       for page, _ in starting_pages}
+    ## bulk pulls whole subtrees with bodies inlined, crawl walks the tree listing children page by page
+    if os.environ.get("CONFLUENCE_FETCH_MODE", "bulk") == "crawl":
+        confluence_api.crawl(starting_pages, page_watermarks)
+    else:
+        confluence_api.fetch_subtrees(starting_pages, page_watermarks)
+    confluence_api.sink.close()
+    save_dedupe()
+    for page, page_watermark in page_watermarks.items():
+        checkpoint_store.set(f"confluence:{page}", page_watermark)
 
-    ## custom execution for one-off gitlab YBYO page
-    # ("1503249254", "gitlab-ops-tasks")
-    confluence_api.process_single_page("1503249254", "gitlab-ops-tasks")
+    for page, classifier in SINGLE_PAGES:
+        page_watermark = resolve_watermark(event, checkpoint_store, f"confluence:{page}")
+        confluence_api.process_single_page(page, classifier, page_watermark)
+        confluence_api.sink.close()
+        save_dedupe()
+        checkpoint_store.set(f"confluence:{page}", page_watermark)
+    checkpoint_store.set_state("confluence:pages", page_manifest.to_dict())
     ### END: Confluence processing ################
 
+    if dedupe is not None:
+        metrics.gauge("dedupe.indexed", len(dedupe), unit="Count")
+
+    finish_invocation(context, invocation_start)
+
 if __name__ == "__main__":
     # For local testing
     event = {
         "initial_load": True
     }
-    lambda_handler(event, None)
+    if "--sharded" in sys.argv:
+        ## coordinator and workers in this process, each worker with a simulated Lambda timeout
+        lambda_handler(dict(event, mode="coordinator"), None)
+        timeout = float(os.environ.get("LOCAL_TIMEOUT_SECONDS", "900"))
+        get_work_queue().drain(lambda_handler, lambda: LocalContext(timeout))
+    else:
+        lambda_handler(event, None)
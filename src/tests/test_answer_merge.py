@@ -0,0 +1,86 @@
+from util.answer_merge import iter_question_updates
+from util.Parser.question_parser import QuestionParser
+from util.sink import FileSink
+
+SINCE = 1000
+
+
+def answer(answer_id, question_id, body, score=0, edited=None, created=100):
+    data = {"answer_id": answer_id, "question_id": question_id, "score": score, "is_accepted": False,
+            "creation_date": created, "body": body}
+    if edited is not None:
+        data["last_edit_date"] = edited
+    return data
+
+
+def question(question_id, answers, edited=None):
+    data = {"question_id": question_id, "title": f"Q{question_id}", "tags": ["gitlab"], "score": 1,
+            "creation_date": 50, "link": f"https://example.com/{question_id}", "body": "<p>question</p>",
+            "last_activity_date": 2000, "answers": answers}
+    if edited is not None:
+        data["last_edit_date"] = edited
+    return data
+
+
+class FakeStackOverflow:
+    def __init__(self, questions):
+        self.questions = {q["question_id"]: q for q in questions}
+        self.fetched_answers = []
+        self.fetched_questions = []
+
+    def iter_answer_changes(self, question_ids):
+        for question_id in question_ids:
+            for a in self.questions[question_id]["answers"]:
+                yield {key: value for key, value in a.items() if key != "body"}
+
+    def iter_answers_by_ids(self, ids):
+        self.fetched_answers.extend(ids)
+        for q in self.questions.values():
+            yield from (a for a in q["answers"] if a["answer_id"] in ids)
+
+    def iter_questions_by_ids(self, ids):
+        ids = list(ids)
+        self.fetched_questions.extend(ids)
+        return (self.questions[question_id] for question_id in ids)
+
+
+def change(q):
+    return {key: value for key, value in q.items() if key not in ("answers", "body")}
+
+
+def test_merge_matches_a_full_reparse(tmp_path):
+    sink = FileSink(str(tmp_path))
+    before = question(1, [answer(11, 1, "<p>old</p>"), answer(12, 1, "<p>kept</p>"), answer(13, 1, "<p>gone</p>")])
+    sink.write_record("questions", 1, QuestionParser(before).to_clean_json())
+
+    after = question(1, [answer(11, 1, "<p>edited</p>", edited=1500), answer(12, 1, "<p>kept</p>", score=7),
+                         answer(14, 1, "<p>new</p>", created=1600)])
+    api = FakeStackOverflow([after])
+    items = list(iter_question_updates([change(after)], api, sink, SINCE))
+
+    assert api.fetched_questions == []
+    assert sorted(api.fetched_answers) == [11, 14]
+    assert QuestionParser(items[0]).to_clean_json() == QuestionParser(after).to_clean_json()
+
+
+def test_edited_or_unknown_questions_are_refetched(tmp_path):
+    sink = FileSink(str(tmp_path))
+    edited = question(1, [answer(11, 1, "<p>a</p>")], edited=1200)
+    sink.write_record("questions", 1, QuestionParser(edited).to_clean_json())
+    unknown = question(2, [answer(21, 2, "<p>b</p>")])
+    api = FakeStackOverflow([edited, unknown])
+    items = list(iter_question_updates([change(edited), change(unknown)], api, sink, SINCE))
+    assert api.fetched_questions == [1, 2]
+    assert all("stored_record" not in item for item in items)
+
+
+def test_records_without_answer_ids_are_refetched(tmp_path):
+    sink = FileSink(str(tmp_path))
+    q = question(1, [answer(11, 1, "<p>a</p>")])
+    record = QuestionParser(q).to_clean_json()
+    for a in record["answers"]:
+        del a["answer_id"]
+    sink.write_record("questions", 1, record)
+    api = FakeStackOverflow([q])
+    list(iter_question_updates([change(q)], api, sink, SINCE))
+    assert api.fetched_questions == [1]
@@ -0,0 +1,104 @@
+import pytest
+
+from util import aws
+from util.aws import ParameterCache
+
+
+class FakeSSM:
+    def __init__(self, parameters):
+        self.parameters = parameters
+        self.calls = []
+        self.unavailable = False
+
+    def get_parameters(self, Names, WithDecryption):
+        assert WithDecryption
+        self.calls.append(list(Names))
+        if self.unavailable:
+            raise ConnectionError("SSM unavailable")
+        return {
+            "Parameters": [{"Name": name, "Value": self.parameters[name]} for name in Names if name in self.parameters],
+            "InvalidParameters": [name for name in Names if name not in self.parameters],
+        }
+
+
+class FakeAWS:
+    def __init__(self, ssm):
+        self.ssm = ssm
+
+    def get_ssm_client(self):
+        return self.ssm
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(aws.time, "monotonic", clock)
+    return clock
+
+
+def test_missing_parameters_are_fetched_in_batches():
+    ssm = FakeSSM({f"p{i}": f"v{i}" for i in range(12)})
+    cache = ParameterCache(FakeAWS(ssm))
+    names = [f"p{i}" for i in range(12)]
+
+    assert cache.get_many(names + ["p0"]) == {name: f"v{name[1:]}" for name in names}
+    assert [len(call) for call in ssm.calls] == [10, 2]
+    assert cache.get("p3") == "v3"
+    assert cache.get_many(names) == {name: f"v{name[1:]}" for name in names}
+    assert len(ssm.calls) == 2
+
+
+def test_unknown_parameter_raises_key_error():
+    cache = ParameterCache(FakeAWS(FakeSSM({"known": "v"})))
+    with pytest.raises(KeyError):
+        cache.get_many(["known", "unknown"])
+
+
+def test_values_are_fetched_again_after_the_ttl(clock):
+    ssm = FakeSSM({"token": "v1"})
+    cache = ParameterCache(FakeAWS(ssm), ttl_seconds=60)
+
+    assert cache.get("token") == "v1"
+    ssm.parameters["token"] = "v2"
+    clock.now += 59
+    assert cache.get("token") == "v1"
+    clock.now += 2
+    assert cache.get("token") == "v2"
+    assert len(ssm.calls) == 2
+
+
+def test_expired_value_is_served_when_ssm_is_unavailable(clock):
+    ssm = FakeSSM({"token": "v1"})
+    cache = ParameterCache(FakeAWS(ssm), ttl_seconds=60)
+    cache.get_many(["token"])
+    ssm.unavailable = True
+    clock.now += 120
+
+    assert cache.get_many(["token"]) == {"token": "v1"}
+    assert cache.get("token") == "v1"
+    # a value the API rejected is never handed out again
+    with pytest.raises(ConnectionError):
+        cache.get("token", stale="v1")
+    # nothing to fall back on before the first fetch
+    with pytest.raises(ConnectionError):
+        ParameterCache(FakeAWS(ssm)).get("token")
+
+
+def test_rejected_value_is_refreshed_before_the_ttl():
+    ssm = FakeSSM({"token": "v1"})
+    cache = ParameterCache(FakeAWS(ssm))
+    assert cache.get("token") == "v1"
+    ssm.parameters["token"] = "v2"
+
+    assert cache.get("token", stale="v1") == "v2"
+    # a caller still holding the old value gets the replacement without another fetch
+    assert cache.get("token", stale="v1") == "v2"
+    assert len(ssm.calls) == 2
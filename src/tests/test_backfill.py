@@ -0,0 +1,80 @@
+from util.backfill import Backfill, plan_windows
+from util.query_planner import QueryPlan
+
+# one item per timestamp, busy early on and quiet later
+TIMES = list(range(0, 1000, 10)) + list(range(1000, 10_000, 500))
+
+
+def count(since, until):
+    return sum(1 for t in TIMES if since <= t < until)
+
+
+def window_params(since, until):
+    return {"min": since, "max": until}
+
+
+def list_items(params):
+    items = [{"id": t, "tag": params.get("tagged")} for t in TIMES if params["min"] <= t < params["max"]]
+    # a second query lists some of the same items again
+    return items if params.get("tagged") == "a" else items[::2]
+
+
+def test_plan_windows_cover_every_item_within_target():
+    windows = plan_windows(count, 0, 10_000, target_items=20, min_window_seconds=10)
+    assert sum(count(*window) for window in windows) == len(TIMES)
+    assert all(count(*window) <= 20 for window in windows)
+    assert windows == sorted(windows)
+    # the quiet stretch gets longer windows than the busy one
+    assert windows[-1][1] - windows[-1][0] > windows[0][1] - windows[0][0]
+
+
+def test_plan_windows_never_cut_below_the_minimum():
+    assert plan_windows(count, 0, 100, target_items=1, min_window_seconds=100) == [(0, 100)]
+    assert plan_windows(count, 20_000, 30_000, target_items=1) == []
+
+
+def plan_backfill(queries=({"tagged": "a"}, {"tagged": "b"})):
+    plan = QueryPlan(list(queries), "id")
+    return Backfill.plan(plan, lambda params: count(params["min"], params["max"]), window_params,
+                         0, 10_000, target_items=20, min_window_seconds=10)
+
+
+def test_items_are_listed_once():
+    backfill = plan_backfill()
+    ids = [item["id"] for item in backfill.items(list_items, window_params, max_workers=3)]
+    assert sorted(ids) == TIMES
+    backfill.finish()
+    assert backfill.complete
+
+
+def test_resume_skips_finished_units():
+    backfill = plan_backfill([{"tagged": "a"}])
+    first_unit = count(*backfill.units[0][1:])
+    seen = []
+    items = backfill.items(list_items, window_params, max_workers=1)
+    for item in items:
+        backfill.processed(item["id"])
+        seen.append(item["id"])
+        if len(seen) == first_unit + 1:
+            break
+    items.close()
+    # the first item of the second unit was processed, so only the first unit is known to be done
+    assert backfill.done == {0}
+
+    resumed = Backfill.from_dict(backfill.query_plan, backfill.to_dict())
+    rest = [item["id"] for item in resumed.items(list_items, window_params, max_workers=2)]
+    assert not set(rest) & set(seen[:first_unit])
+    assert sorted(set(seen[:first_unit]) | set(rest)) == TIMES
+
+
+def test_checkpoints_are_rate_limited():
+    backfill = plan_backfill()
+    saves = []
+    backfill.save = lambda: saves.append(sorted(backfill.done))
+    backfill.checkpoint_seconds = 0
+    for item in backfill.items(list_items, window_params, max_workers=2):
+        backfill.processed(item["id"])
+    assert saves and saves == sorted(saves, key=len)
+    assert not backfill.complete
+    backfill.finish()
+    assert backfill.complete
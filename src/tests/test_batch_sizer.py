@@ -0,0 +1,39 @@
+from util.batch_sizer import MAX_VECTOR_IDS, AdaptiveBatchSizer
+
+
+def test_starts_at_the_api_limit():
+    sizer = AdaptiveBatchSizer(max_ids=500)
+    assert sizer.size() == MAX_VECTOR_IDS
+    assert [len(batch) for batch in sizer.batches(range(250))] == [100, 100, 50]
+
+
+def test_shrinks_to_fit_one_page_of_items():
+    sizer = AdaptiveBatchSizer(page_size=100)
+    # four answers per question
+    sizer.observe(ids=100, items=400, response_bytes=1000, seconds=0.1)
+    assert sizer.size() == 25
+
+
+def test_shrinks_for_bytes_and_grows_back():
+    sizer = AdaptiveBatchSizer(target_bytes=10_000, smoothing=0.5)
+    sizer.observe(ids=10, items=10, response_bytes=10_000, seconds=0.1)
+    assert sizer.size() == 10
+    for _ in range(10):
+        sizer.observe(ids=10, items=10, response_bytes=100, seconds=0.1)
+    assert sizer.size() == MAX_VECTOR_IDS
+
+
+def test_latency_target_dropped_when_quota_is_low():
+    sizer = AdaptiveBatchSizer(target_seconds=1.0, low_quota=1000)
+    sizer.observe(ids=10, items=10, response_bytes=100, seconds=1.0)
+    assert sizer.size() == 10
+    sizer.observe(ids=10, items=10, response_bytes=100, seconds=1.0, quota_remaining=50)
+    assert sizer.size() == MAX_VECTOR_IDS
+
+
+def test_batches_keep_the_url_short_and_hand_out_every_id():
+    sizer = AdaptiveBatchSizer(max_url_chars=100)
+    ids = list(range(10_000_000, 10_000_050))
+    batches = list(sizer.batches(iter(ids), base_url_chars=40))
+    assert [item_id for batch in batches for item_id in batch] == ids
+    assert all(40 + 9 * len(batch) <= 100 for batch in batches)
@@ -0,0 +1,31 @@
+from util.checkpoint import Watermark
+
+
+def test_covers_only_against_the_starting_mark():
+    watermark = Watermark(value=100, ids=[1])
+    assert watermark.covers(2, 99)
+    assert watermark.covers(1, 100)
+    assert not watermark.covers(2, 100)
+    assert not watermark.covers(3, 101)
+    watermark.observe(3, 150)
+    # observing never changes what the run skips
+    assert not watermark.covers(4, 120)
+
+
+def test_observe_keeps_ids_at_the_highest_value():
+    watermark = Watermark(value=100)
+    watermark.observe(1, 120)
+    watermark.observe(2, 150)
+    watermark.observe(3, 150)
+    watermark.observe(4, 110)
+    watermark.observe(5, None)
+    assert watermark.to_dict() == {"value": 150, "ids": [2, 3]}
+
+
+def test_round_trip():
+    watermark = Watermark()
+    assert not watermark.covers(1, 0)
+    watermark.observe("a", 5)
+    restored = Watermark.from_dict(watermark.to_dict())
+    assert restored.covers("a", 5)
+    assert not restored.covers("b", 5)
@@ -0,0 +1,217 @@
+import glob
+import json
+import os
+import re
+from datetime import datetime, timezone
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from api.confluence import ConfluenceAPI
+from util.checkpoint import Watermark
+from util.dedupe import Deduplicator
+from util.page_manifest import PageManifest
+from util.sink import FileSink, ShardedJsonlSink
+
+
+def page(version, title="Page", page_id="1", body=None):
+    listed = {"id": page_id, "title": title, "version": {"number": version, "when": f"2024-01-0{version}T00:00:00Z"}}
+    return listed, {"body": {"storage": {"value": body or f"<p>version {version}</p>"}}}
+
+
+def live_records(directory, stream):
+    # what a reader applying records and tombstones in order ends up with
+    live = {}
+    for path in sorted(glob.glob(os.path.join(directory, stream, "*.jsonl"))):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record.get("deleted"):
+                    live.pop(record["id"], None)
+                else:
+                    live[record["id"]] = record
+    return live
+
+
+def confluence(sink):
+    return ConfluenceAPI("http://confluence.invalid", "token", sink=sink, manifest=PageManifest())
+
+
+def test_resaved_page_stays_live_in_jsonl(tmp_path):
+    sink = ShardedJsonlSink(str(tmp_path))
+    api = confluence(sink)
+    api._save_page(*page(1), "docs", root="0")
+    api._save_page(*page(2), "docs", root="0")
+    sink.close()
+    live = live_records(str(tmp_path), "docs")
+    assert list(live) == ["1"]
+    assert "version 2" in live["1"]["markdown"]
+
+
+def test_reclassified_page_is_removed_from_its_old_stream(tmp_path):
+    sink = ShardedJsonlSink(str(tmp_path))
+    api = confluence(sink)
+    api._save_page(*page(1), "docs", root="0")
+    api._save_page(*page(2), "runbooks", root="0")
+    sink.close()
+    assert live_records(str(tmp_path), "docs") == {}
+    assert list(live_records(str(tmp_path), "runbooks")) == ["1"]
+
+
+def test_renamed_page_file_is_removed(tmp_path):
+    api = confluence(FileSink(str(tmp_path)))
+    api._save_page(*page(1, "Old title"), "docs", root="0")
+    api._save_page(*page(2, "New title"), "docs", root="0")
+    assert os.listdir(tmp_path / "docs") == ["New_title.md"]
+
+
+def test_page_dropped_as_duplicate_is_recorded_and_its_old_output_removed(tmp_path):
+    sink = ShardedJsonlSink(str(tmp_path))
+    api = confluence(sink)
+    api.dedupe = Deduplicator(policy="first")
+    shared = "<p>" + " ".join(f"word{i}" for i in range(200)) + "</p>"
+    api._save_page(*page(1, "Original", page_id="2", body=shared), "docs", root="0")
+    api._save_page(*page(1), "docs", root="0")
+    # page 1 is edited into a copy of page 2
+    api._save_page(*page(2, body=shared), "docs", root="0")
+    sink.close()
+
+    assert list(live_records(str(tmp_path), "docs")) == ["2"]
+    assert api.manifest.is_current("1", 2, "docs")
+    assert api.manifest.pages["1"]["location"] is None
+    # pruning a page that was never written deletes nothing
+    api.manifest.seen.discard("1")
+    api._prune(["0"])
+    assert "1" not in api.manifest.pages
+
+
+BASE = "http://confluence.invalid"
+
+
+class Response:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self.content = json.dumps(data or {}).encode("utf-8")
+        self.headers = {}
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class FakeConfluence:
+    # session answering the content endpoints the crawler uses from a tree of page id to child ids;
+    # days gives the day of January a page was last modified, links=False pages by start only
+    def __init__(self, tree, days=None, links=True):
+        self.links = links
+        self.requests = []
+        self.parents = {child: parent for parent, children in tree.items() for child in children}
+        self.tree = tree
+        self.days = days or {}
+
+    def page(self, page_id, with_body=True):
+        when = datetime(2024, 1, self.days.get(page_id, 1), tzinfo=timezone.utc)
+        page = {"id": page_id, "title": f"Page {page_id}", "ancestors": [{"id": ancestor} for ancestor in
+                                                                         self.ancestors(page_id)],
+                "version": {"number": 1, "when": when.strftime("%Y-%m-%dT%H:%M:%SZ")}}
+        if with_body:
+            page["body"] = {"storage": {"value": f"<p>Body of {page_id}</p>"}}
+        return page
+
+    def ancestors(self, page_id):
+        chain = []
+        while page_id in self.parents:
+            page_id = self.parents[page_id]
+            chain.insert(0, page_id)
+        return chain
+
+    def descendants(self, page_id):
+        for child in self.tree.get(page_id, []):
+            yield child
+            yield from self.descendants(child)
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        parts = urlsplit(url)
+        query = dict(parse_qsl(parts.query), **{key: str(value) for key, value in (params or {}).items()})
+        self.requests.append((parts.path, query))
+        with_body = "body.storage" in query.get("expand", "")
+        match = re.fullmatch(r"/rest/api/content/(\w+)(/child/page|/descendant/page)?", parts.path)
+        if parts.path == "/rest/api/content/search":
+            root, day = re.fullmatch(r'ancestor=(\w+) and type=page and lastmodified >= "2024-01-(\d+)"',
+                                     query["cql"]).groups()
+            ids = [page_id for page_id in self.descendants(root) if self.days.get(page_id, 1) >= int(day)]
+        elif match and match.group(2) == "/child/page":
+            ids = self.tree.get(match.group(1), [])
+        elif match and match.group(2):
+            ids = list(self.descendants(match.group(1)))
+        elif match:
+            return Response(200, self.page(match.group(1)))
+        else:
+            return Response(404)
+        start, limit = int(query.get("start", 0)), int(query["limit"])
+        results = [self.page(page_id, with_body) for page_id in ids[start:start + limit]]
+        data = {"results": results, "start": start, "limit": limit, "size": len(results)}
+        if self.links:
+            data["_links"] = {"base": BASE}
+            if start + limit < len(ids):
+                data["_links"]["next"] = f"{parts.path}?{urlencode(dict(query, start=start + limit))}"
+        return Response(200, data)
+
+
+# 100 and 200 are both starting pages, 200 sits under 100
+TREE = {"100": ["101", "102", "103"], "101": ["111"], "102": ["200"], "200": ["201", "202"]}
+
+
+def crawler(tmp_path, session, manifest=True):
+    api = ConfluenceAPI(BASE, "token", sink=FileSink(str(tmp_path)), page_limit=2,
+                        manifest=PageManifest() if manifest else None)
+    api.session = session
+    return api
+
+
+def saved(tmp_path, stream):
+    return sorted(name[len("Page_"):-len(".md")] for name in os.listdir(tmp_path / stream))
+
+
+def test_crawl_follows_child_pagination_and_leaves_nested_roots_to_themselves(tmp_path):
+    session = FakeConfluence(TREE)
+    api = crawler(tmp_path, session)
+
+    assert api.crawl([("100", "a"), ("200", "b")]) == 7
+    # the nested root is saved where it was found, its subtree under its own classifier
+    assert saved(tmp_path, "a") == ["101", "102", "103", "111", "200"]
+    assert saved(tmp_path, "b") == ["201", "202"]
+    listed = [query["start"] for path, query in session.requests if path == "/rest/api/content/100/child/page"]
+    assert listed == ["0", "2"]
+    assert [path for path, _ in session.requests].count("/rest/api/content/200/child/page") == 1
+    assert api.manifest.pages["201"]["root"] == "200"
+
+
+def test_fetch_subtrees_assigns_pages_to_their_nearest_root(tmp_path):
+    session = FakeConfluence(TREE, links=False)
+    api = crawler(tmp_path, session)
+
+    assert api.fetch_subtrees([("100", "a"), ("200", "b")]) == 7
+    assert saved(tmp_path, "a") == ["101", "102", "103", "111", "200"]
+    assert saved(tmp_path, "b") == ["201", "202"]
+    # without _links the listing pages on by start until a short page
+    listed = [query["start"] for path, query in session.requests if path == "/rest/api/content/100/descendant/page"]
+    assert listed == ["0", "2", "4", "6"]
+
+
+def test_fetch_subtrees_only_processes_the_given_roots(tmp_path):
+    api = crawler(tmp_path, FakeConfluence(TREE))
+
+    assert api.fetch_subtrees([("100", "a")], root_ids=["100", "200"]) == 5
+    assert saved(tmp_path, "a") == ["101", "102", "103", "111", "200"]
+    assert not (tmp_path / "b").exists()
+
+
+def test_fetch_subtrees_searches_by_cql_from_the_watermark(tmp_path):
+    session = FakeConfluence(TREE, days={"101": 9, "111": 12, "103": 5})
+    api = crawler(tmp_path, session, manifest=False)
+    watermark = Watermark(value=int(datetime(2024, 1, 10, tzinfo=timezone.utc).timestamp()))
+
+    assert api.fetch_subtrees([("100", "a")], {"100": watermark}) == 1
+    [(path, query)] = session.requests
+    assert path == "/rest/api/content/search"
+    assert query["cql"] == 'ancestor=100 and type=page and lastmodified >= "2024-01-09"'
+    # the day of slack lists 101 too, the watermark then skips it
+    assert saved(tmp_path, "a") == ["111"]
@@ -0,0 +1,60 @@
+import random
+
+from util.dedupe import Deduplicator, minhash_signature
+
+WORDS = [f"word{i}" for i in range(500)]
+
+
+def text(seed, words=300):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def near_copy(source):
+    words = source.split()
+    words[10] = "changed"
+    return " ".join(words)
+
+
+def test_signature_is_stable_and_sized():
+    assert minhash_signature(text(1)) == minhash_signature(text(1))
+    assert len(minhash_signature(text(1), num_perm=128)) == 128
+    assert minhash_signature("  ... ") is None
+
+
+def test_lower_scored_copy_is_dropped():
+    dedupe = Deduplicator(policy="score")
+    original = text(1)
+    first = dedupe.check("questions", 1, original, score=5)
+    dedupe.add(first, "q/1")
+    assert dedupe.check("questions", 2, near_copy(original), score=1) is None
+    assert dedupe.check("questions", 3, text(2), score=1) is not None
+
+
+def test_higher_scored_copy_supersedes():
+    dedupe = Deduplicator(policy="score")
+    removed = []
+    dedupe.on_superseded = lambda stream, record_id, location: removed.append((stream, record_id, location))
+    original = text(1)
+    dedupe.add(dedupe.check("questions", 1, original, score=1), "q/1")
+    winner = dedupe.check("pages", "p", near_copy(original), score=10)
+    assert winner is not None
+    dedupe.add(winner, "pages/p.md")
+    assert removed == [("questions", 1, "q/1")]
+    assert len(dedupe) == 1
+
+
+def test_recheck_of_an_indexed_item_is_not_a_duplicate_of_itself():
+    dedupe = Deduplicator(policy="first")
+    original = text(1)
+    dedupe.add(dedupe.check("questions", 1, original), "q/1")
+    assert dedupe.check("questions", 1, original) is not None
+
+
+def test_index_survives_a_round_trip():
+    dedupe = Deduplicator(policy="first")
+    original = text(1)
+    dedupe.add(dedupe.check("questions", 1, original), "q/1")
+    restored = Deduplicator(policy="first", docs=dedupe.to_dict()["docs"])
+    assert len(restored) == 1
+    assert restored.check("questions", 2, near_copy(original)) is None
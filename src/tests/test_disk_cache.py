@@ -0,0 +1,31 @@
+import os
+
+from util.disk_cache import DiskCache
+
+
+def test_overwrite_does_not_grow_the_tracked_size(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1000)
+    for _ in range(50):
+        cache.put("aa11", b"x" * 100)
+    assert cache.stats()["bytes"] == 100
+    cache.put("aa11", b"x" * 10)
+    assert cache.stats()["bytes"] == 10
+    assert cache.get("aa11") == b"x" * 10
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1000)
+    for i in range(10):
+        cache.put(f"k{i:03d}", b"x" * 100)
+        os.utime(cache._path(f"k{i:03d}"), (i, i))
+    os.utime(cache._path("k000"), (100, 100))
+    cache.put("k010", b"x" * 100)
+    assert cache.stats()["bytes"] <= 900
+    assert cache.get("k000") is not None
+    assert cache.get("k001") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_size_is_picked_up_from_the_directory(tmp_path):
+    DiskCache(str(tmp_path)).put("bb22", b"y" * 42)
+    assert DiskCache(str(tmp_path)).stats()["bytes"] == 42
@@ -0,0 +1,33 @@
+from util.filter import Filter
+from util.query_planner import QueryPlanner
+
+ITEMS = [
+    {"id": 1, "tags": ["gitlab", "ci"], "score": 5},
+    {"id": 2, "tags": ["terraform"], "score": 0},
+    {"id": 3, "tags": ["gitlab-ci", "Terraform"], "score": 2},
+    {"id": 4},
+    "not an item",
+]
+
+
+def test_empty_filter_matches_nothing():
+    assert Filter("tags", [], "id").do_filter(ITEMS) == []
+    assert Filter("tags", None, "id").do_filter(ITEMS) == []
+
+
+def test_empty_filter_lists_nothing():
+    plan = QueryPlanner().plan(Filter("tags", [], "id"))
+    assert plan.queries == []
+    assert plan.fetch_ids(lambda params: ITEMS) == []
+
+
+def test_any_of_matches_exact_tags_and_globs():
+    assert Filter("tags", ["terraform", "ci"], "id").do_filter(ITEMS) == [1, 2]
+    assert Filter("tags", ["gitlab*"], "id").do_filter(ITEMS) == [1, 3]
+    assert Filter("tags", ["terraform"], "id", ignore_case=True).do_filter(ITEMS) == [2, 3]
+
+
+def test_composed_rules():
+    assert Filter("tags", ["gitlab*"], "id", none_of=["ci"]).do_filter(ITEMS) == [3]
+    assert Filter("tags", [], "id", all_of=["gitlab", "c?"]).do_filter(ITEMS) == [1]
+    assert Filter("tags", [], "id", min_score=1).do_filter(ITEMS) == [1, 3]
@@ -0,0 +1,193 @@
+import json
+import time
+
+import pytest
+
+import handler
+from util.checkpoint import checkpoint_store_from_uri
+
+
+def emf_lines(output):
+    return [json.loads(line) for line in output.splitlines() if line.startswith("{") and '"_aws"' in line]
+
+
+def test_secrets_failure_still_emits_metrics(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv("RAW_OUTPUT_DIR", str(tmp_path))
+    monkeypatch.setenv("SSM_OVERRIDE", "false")
+    monkeypatch.setenv("STACKOVERFLOW_API_KEY_PARAM", "so")
+    monkeypatch.setenv("CONFLUENCE_API_KEY_PARAM", "confluence")
+
+    def unavailable(names):
+        raise RuntimeError("SSM unavailable")
+    monkeypatch.setattr(handler.parameter_cache, "get_many", unavailable)
+
+    assert handler.lambda_handler({}, None) == handler.SECRETS_ERROR
+    [document] = emf_lines(capsys.readouterr().out)
+    assert document["secrets.errors"] == 1
+    assert "invocation_seconds" in document
+
+
+@pytest.fixture
+def fake_apis(tmp_path, monkeypatch):
+    from bench.fake_server import FakeApiServer, FakeCorpus
+    server = FakeApiServer(FakeCorpus(questions=60, articles=40, pages_per_root=0)).start()
+    monkeypatch.setenv("SSM_OVERRIDE", "true")
+    monkeypatch.setenv("STACKOVERFLOW_API_URL", f"{server.url}/so")
+    monkeypatch.setenv("STACKOVERFLOW_API_KEY", "test")
+    monkeypatch.setenv("CONFLUENCE_API_URL", f"{server.url}/confluence")
+    monkeypatch.setenv("CONFLUENCE_API_KEY", "test")
+    monkeypatch.setenv("RAW_OUTPUT_DIR", str(tmp_path / "out"))
+    monkeypatch.setenv("CHECKPOINT_STORE", str(tmp_path / "checkpoints.json"))
+    monkeypatch.setattr(handler, "api_clients", {})
+    yield server
+    server.stop()
+
+
+def test_dedupe_index_is_saved_with_each_stream_watermark(tmp_path, monkeypatch, fake_apis):
+    monkeypatch.setenv("DEDUPE", "true")
+    start_backfill = handler.start_backfill
+
+    def questions_fail(stream_name, *args, **kwargs):
+        if stream_name == "questions":
+            raise RuntimeError("invocation dies after the articles")
+        return start_backfill(stream_name, *args, **kwargs)
+    monkeypatch.setattr(handler, "start_backfill", questions_fail)
+
+    with pytest.raises(RuntimeError):
+        handler.lambda_handler({"initial_load": True}, None)
+
+    checkpoints = checkpoint_store_from_uri(str(tmp_path / "checkpoints.json"))
+    dedupe_store = checkpoint_store_from_uri(str(tmp_path / "checkpoints.json"), partition="dedupe")
+    assert checkpoints.get("so:articles").value is not None
+    docs = dedupe_store.get_state("dedupe:index")["docs"]
+    assert docs and all(key.startswith("articles:") for key in docs)
+
+
+def test_parse_cache_counts_are_per_invocation(tmp_path, monkeypatch, capsys):
+    import util.Parser.parse_cache
+    monkeypatch.setenv("PARSE_CACHE_DIR", str(tmp_path / "parse_cache"))
+    monkeypatch.setattr(util.Parser.parse_cache, "_parse_cache", None)
+    reported = []
+    for hits in (3, 2):
+        invocation_start = handler.start_invocation()
+        handler.get_parse_cache().store.hits += hits
+        handler.finish_invocation(None, invocation_start)
+        [document] = emf_lines(capsys.readouterr().out)
+        reported.append(document["parse_cache.hits"])
+    assert reported == [3, 2]
+
+
+class Countdown:
+    # time left for the first calls, out of time after them
+    def __init__(self, calls):
+        self.calls = calls
+
+    def get_remaining_time_in_millis(self):
+        self.calls -= 1
+        return 600_000 if self.calls >= 0 else 0
+
+
+def test_plan_shards_splits_each_stream_into_windows(tmp_path):
+    checkpoints = checkpoint_store_from_uri(str(tmp_path / "checkpoints.json"))
+    until = 100 * 86400
+    shards = handler.plan_shards({"from_date": 25 * 86400, "window_days": 30}, checkpoints, until)
+
+    for stream in handler.SO_STREAMS:
+        windows = [shard for shard in shards if shard["kind"] == "so_listing" and shard["stream"] == stream]
+        assert [(shard["since"], shard["until"]) for shard in windows] == [
+            (25 * 86400, 55 * 86400), (55 * 86400, 85 * 86400), (85 * 86400, until)]
+        assert [shard["window"] for shard in windows] == [0, 1, 2]
+        assert {shard["run"] for shard in windows} == {until}
+    roots = [shard for shard in shards if shard["kind"] == "confluence_root"]
+    assert [shard["page_id"] for shard in roots] == [page for page, _ in handler.STARTING_PAGES]
+    assert all(shard["from_date"] == 25 * 86400 for shard in roots)
+
+
+def test_watermarks_move_only_past_finished_windows(tmp_path, monkeypatch, fake_apis):
+    monkeypatch.setattr(handler, "work_queue", None)
+    monkeypatch.setenv("SHARD_WINDOW_DAYS", "30")
+    checkpoints = checkpoint_store_from_uri(str(tmp_path / "checkpoints.json"))
+    since = int(time.time()) - 70 * 86400
+    handler.lambda_handler({"mode": "coordinator", "from_date": since}, None)
+
+    queue = handler.get_work_queue()
+    assert checkpoints.get("so:questions") is None
+    events = list(queue.events)
+    queue.events.clear()
+    plan = checkpoints.get_state("so:plan:questions")
+    assert len(plan["windows"]) == 3
+    for event in events:
+        # the second questions window never finishes, as if its shard were dead-lettered
+        if event["shard"].get("stream") == "questions" and event["shard"]["window"] == 1:
+            continue
+        handler.lambda_handler(event, None)
+    assert checkpoints.get("so:questions") is None
+
+    handler.lambda_handler({"mode": "coordinator"}, None)
+
+    assert checkpoints.get("so:questions").value == plan["windows"][0][1]
+    assert checkpoints.get("so:articles").value == plan["run"]
+    replanned = [event["shard"] for event in queue.events if event["shard"].get("stream") == "questions"]
+    assert replanned[0]["since"] == plan["windows"][0][1]
+
+
+def test_shard_out_of_time_is_continued_from_the_queue(tmp_path, monkeypatch, fake_apis):
+    monkeypatch.setattr(handler, "work_queue", None)
+    monkeypatch.setenv("PARSE_WORKERS", "1")
+    queue = handler.get_work_queue()
+    ids = list(range(1, 21))
+    queue.put({"fetch_mode": "two_phase", "shard": {"kind": "so_ids", "stream": "questions", "ids": ids}})
+
+    responses = queue.drain(handler.lambda_handler, lambda: Countdown(8))
+
+    continuations = [json.loads(response["body"])["continuation"] for response in responses]
+    assert len(continuations) > 1 and continuations[-1] is None
+    remaining = [continuation["ids"] for continuation in continuations[:-1]]
+    assert all(len(later) < len(earlier) for earlier, later in zip([ids] + remaining, remaining))
+    assert {continuation["writer"] for continuation in continuations[:-1]} == {"so_ids-questions-1"}
+    written = sorted(int(path.stem) for path in (tmp_path / "out" / "questions").glob("*.json"))
+    assert written == ids
+
+
+def test_rejected_token_is_refreshed_and_the_client_reused(monkeypatch):
+    from tests.test_aws import FakeAWS, FakeSSM
+    from util.aws import ParameterCache
+
+    class Response:
+        def __init__(self, status_code):
+            self.status_code = status_code
+            self.ok = status_code < 400
+            self.content = b'{"items": []}'
+
+        def json(self):
+            return json.loads(self.content)
+
+        def raise_for_status(self):
+            assert self.ok
+
+    class Session:
+        def __init__(self):
+            self.keys = []
+
+        def get(self, url, params=None, timeout=None):
+            self.keys.append(params["key"])
+            return Response(200 if params["key"] == "rotated" else 401)
+
+    ssm = FakeSSM({"so": "old", "confluence": "c"})
+    monkeypatch.setattr(handler, "parameter_cache", ParameterCache(FakeAWS(ssm)))
+    monkeypatch.setattr(handler, "api_clients", {})
+    monkeypatch.setenv("SSM_OVERRIDE", "false")
+    monkeypatch.setenv("STACKOVERFLOW_API_KEY_PARAM", "so")
+    monkeypatch.setenv("CONFLUENCE_API_KEY_PARAM", "confluence")
+    monkeypatch.setenv("STACKOVERFLOW_API_URL", "https://api.example.com/2.3")
+
+    assert handler.load_secrets()
+    client = handler.get_stackoverflow_api()
+    client.session = Session()
+    ssm.parameters["so"] = "rotated"
+
+    assert client._make_request("questions", params={}) == {"items": []}
+    assert client.session.keys == ["old", "rotated"]
+    assert handler.get_stackoverflow_api() is client
+    assert client.api_token == "rotated"
+    assert ssm.calls == [["so", "confluence"], ["so"]]
@@ -0,0 +1,23 @@
+import random
+
+import pytest
+
+from util.Parser.html_markdown import confluence_to_markdown, stackoverflow_to_markdown
+
+
+def test_stackoverflow_blocks_and_inline():
+    body = "<p>Use <code>x</code></p><ul><li>one</li><li>two</li></ul><pre><code>x = 1\n</code></pre>"
+    assert stackoverflow_to_markdown(body) == "Use`x`\n\n- one\n- two\n\n```\nx = 1\n\n```"
+
+
+def test_confluence_table():
+    body = "<h2>Title</h2><table><tr><th>A</th></tr><tr><td>1</td></tr></table>"
+    assert confluence_to_markdown(body) == "## Title\n\n| A |\n| --- |\n| 1 |\n\n"
+
+
+def test_matches_beautifulsoup_converters():
+    pytest.importorskip("bs4")
+    from bench.markdown_engine import CONVERTERS, documents
+    for kind, convert, reference in CONVERTERS:
+        for doc in documents(kind, 30, seed=random.Random(kind).randrange(1000)):
+            assert convert(doc) == reference(doc), (kind, doc)
@@ -0,0 +1,107 @@
+import json
+
+from util import http_cache
+from util.http_cache import CachedResponse, HttpCache
+
+URL = "https://api.example.com/2.3/questions"
+
+
+class FakeSession:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        self.calls.append({"url": url, "params": params, "headers": headers})
+        return self.responses.pop(0)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def ok(body, etag=None):
+    headers = {"Content-Type": "application/json"}
+    if etag:
+        headers["ETag"] = etag
+    return CachedResponse(200, headers, json.dumps(body).encode("utf-8"), URL)
+
+
+def test_secret_params_are_left_out_of_the_key(tmp_path):
+    params = {"site": "stackoverflow", "page": 1}
+    assert HttpCache.key(URL, {**params, "key": "k1"}) == HttpCache.key(URL, params)
+    assert HttpCache.key(f"{URL}?access_token=t1", params) == HttpCache.key(URL, params)
+    assert HttpCache.key(URL, {**params, "page": 2}) != HttpCache.key(URL, params)
+
+    cache = HttpCache(str(tmp_path))
+    session = FakeSession(ok({"items": [1]}))
+    cache.get(session, URL, params={**params, "key": "k1", "access_token": "t1"})
+    response = cache.get(session, URL, params={**params, "key": "k2", "access_token": "t2"})
+
+    assert len(session.calls) == 1
+    assert response.json() == {"items": [1]}
+    [entry] = [path.read_bytes() for path in tmp_path.rglob("*") if path.is_file()]
+    assert b"k1" not in entry and b"t1" not in entry
+
+
+def test_replay_answers_a_miss_with_504(tmp_path):
+    HttpCache(str(tmp_path)).get(FakeSession(ok({"items": [1]})), URL, params={"page": 1})
+    replay = HttpCache(str(tmp_path), mode="replay", ttl_seconds=0)
+    session = FakeSession()
+
+    assert replay.get(session, URL, params={"page": 1}).json() == {"items": [1]}
+    missed = replay.get(session, URL, params={"page": 2})
+    assert missed.status_code == 504
+    assert not missed.ok
+    assert session.calls == []
+
+
+def test_record_fetches_again_once_the_ttl_has_passed(tmp_path, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(http_cache.time, "time", clock)
+    cache = HttpCache(str(tmp_path), ttl_seconds=60)
+    session = FakeSession(ok({"version": 1}), ok({"version": 2}))
+
+    assert cache.get(session, URL).json() == {"version": 1}
+    clock.now += 59
+    assert cache.get(session, URL).json() == {"version": 1}
+    assert len(session.calls) == 1
+
+    clock.now += 2
+    assert cache.get(session, URL).json() == {"version": 2}
+    assert len(session.calls) == 2
+    assert cache.get(session, URL).json() == {"version": 2}
+    assert len(session.calls) == 2
+
+
+def test_stale_entry_revalidated_with_304_serves_the_stored_body(tmp_path, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(http_cache.time, "time", clock)
+    cache = HttpCache(str(tmp_path), ttl_seconds=60)
+    session = FakeSession(ok({"version": 1}, etag='"v1"'), CachedResponse(304, {"ETag": '"v1"'}, b"", URL))
+
+    cache.get(session, URL)
+    clock.now += 120
+    response = cache.get(session, URL)
+
+    assert session.calls[1]["headers"] == {"If-None-Match": '"v1"'}
+    assert response.status_code == 200
+    assert response.json() == {"version": 1}
+    # the revalidation restarted the TTL
+    clock.now += 30
+    assert cache.get(session, URL).json() == {"version": 1}
+    assert len(session.calls) == 2
+
+
+def test_conditional_request_matching_the_recorded_etag_gets_304(tmp_path):
+    cache = HttpCache(str(tmp_path))
+    session = FakeSession(ok({"version": 1}, etag='"v1"'))
+    cache.get(session, URL, headers={"If-None-Match": '"v0"'})
+
+    assert session.calls[0]["headers"] is None
+    assert cache.get(session, URL, headers={"If-None-Match": '"v1"'}).status_code == 304
+    assert cache.get(session, URL, headers={"If-None-Match": '"v0"'}).json() == {"version": 1}
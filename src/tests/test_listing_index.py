@@ -0,0 +1,45 @@
+import random
+import tracemalloc
+
+from util.listing_index import IdSet, ListingIndex
+from util.query_planner import QueryPlan
+
+
+def test_id_set_behaves_like_a_set():
+    rng = random.Random(1)
+    ids = [rng.randrange(-10**12, 10**12) for _ in range(20_000)] + list(range(5000)) + [0, -1, "a", 2**70]
+    reference = set()
+    id_set = IdSet(bits=2)
+    for item_id in ids:
+        assert id_set.add(item_id) == (item_id not in reference)
+        reference.add(item_id)
+    assert len(id_set) == len(reference)
+    assert all(item_id in id_set for item_id in reference)
+    assert 10**13 not in id_set and "b" not in id_set
+
+
+def test_id_set_is_smaller_than_a_set_of_ints():
+    def peak(build):
+        tracemalloc.start()
+        kept = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del kept
+        return size
+
+    def fill(container):
+        for item_id in range(70_000_000, 70_080_000, 2):
+            container.add(item_id)
+        return container
+
+    assert peak(lambda: fill(IdSet())) * 2 < peak(lambda: fill(set()))
+
+
+def test_plan_drops_ids_listed_by_several_queries():
+    listings = {"a": [{"id": 1, "tags": ["a"]}, {"id": 2, "tags": ["a", "b"]}],
+                "b": [{"id": 2, "tags": ["a", "b"]}, {"id": 3, "tags": ["b"]}, {"tags": ["b"]}]}
+    plan = QueryPlan([{"tagged": "a"}, {"tagged": "b"}], "id")
+    index = plan.discover(lambda params: listings[params["tagged"]])
+    assert isinstance(index, ListingIndex)
+    assert list(index) == [1, 2, 3]
+    assert [tags for _, tags, _ in index.records()] == [("a",), ("a", "b"), ("b",)]
@@ -0,0 +1,33 @@
+from util.page_manifest import PageManifest
+
+
+def record(manifest, page_id, location, version=1, classifier="docs", root="0"):
+    return manifest.record(page_id, version, 0, root, classifier, location)
+
+
+def test_shared_location_stays_referenced_until_its_last_page_moves():
+    manifest = PageManifest()
+    record(manifest, "1", "docs/Same.md")
+    record(manifest, "2", "docs/Same.md")
+    previous = record(manifest, "1", "docs/Other.md", version=2)
+    assert previous["location"] == "docs/Same.md"
+    assert manifest.is_referenced("docs/Same.md")
+    manifest.forget("2")
+    assert not manifest.is_referenced("docs/Same.md")
+    assert manifest.is_referenced("docs/Other.md")
+
+
+def test_rewrite_to_the_same_location_is_not_a_move():
+    manifest = PageManifest()
+    record(manifest, "1", "docs/Page.md")
+    assert record(manifest, "1", "docs/Page.md", version=2) is None
+    assert manifest.is_referenced("docs/Page.md")
+
+
+def test_locations_are_rebuilt_from_a_saved_manifest():
+    manifest = PageManifest()
+    record(manifest, "1", "docs/A.md")
+    record(manifest, "2", "docs/B.md", root="9")
+    restored = PageManifest.from_dict(manifest.to_dict())
+    assert restored.is_referenced("docs/A.md") and restored.is_referenced("docs/B.md")
+    assert [page_id for page_id, _ in restored.stale(["0"])] == ["1"]
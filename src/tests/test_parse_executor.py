@@ -0,0 +1,88 @@
+import pytest
+
+from util.Parser import parse_cache
+from util.Parser.parse_executor import ParseExecutor
+from util.Parser.question_parser import QuestionParser
+
+
+class FailingParser:
+    def __init__(self, item):
+        self.item = item
+
+    def to_clean_json(self):
+        if self.item.get("fail"):
+            raise ValueError(f"cannot parse {self.item['question_id']}")
+        return {"question_id": self.item["question_id"]}
+
+
+def questions(count, distinct_bodies=None):
+    distinct_bodies = distinct_bodies or count
+    return [{
+        "question_id": i,
+        "title": f"Question {i}",
+        "tags": ["python"],
+        "body": f"<p>Body {i % distinct_bodies} with <code>code</code></p>",
+        "answers": [{"answer_id": 1000 + i, "body": f"<p>Answer {i}</p>"}],
+    } for i in range(count)]
+
+
+@pytest.fixture
+def no_parse_cache(monkeypatch):
+    monkeypatch.setenv("PARSE_CACHE_DIR", "")
+    monkeypatch.setattr(parse_cache, "_parse_cache", None)
+
+
+@pytest.fixture
+def shared_parse_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("PARSE_CACHE_DIR", str(tmp_path / "parse_cache"))
+    monkeypatch.setattr(parse_cache, "_parse_cache", None)
+    return parse_cache.get_parse_cache()
+
+
+def test_workers_match_in_process_output_in_order(no_parse_cache):
+    items = questions(37)
+    serial = list(ParseExecutor(QuestionParser, workers=1).map(items))
+    parallel = list(ParseExecutor(QuestionParser, workers=2, chunk_size=3).map(items))
+
+    assert [item["question_id"] for item, _ in parallel] == list(range(37))
+    assert parallel == serial
+
+
+def test_input_is_read_at_most_max_pending_chunks_ahead(no_parse_cache):
+    read = []
+
+    def source():
+        for item in questions(200):
+            read.append(item["question_id"])
+            yield item
+
+    executor = ParseExecutor(QuestionParser, workers=2, chunk_size=4, max_pending=2)
+    results = executor.map(source())
+    first, _ = next(results)
+
+    assert first["question_id"] == 0
+    assert len(read) <= 2 * 4
+    results.close()
+    assert executor._processes == []
+
+
+def test_worker_exception_is_raised_in_the_parent(no_parse_cache):
+    items = [{"question_id": i, "fail": i == 5} for i in range(10)]
+    executor = ParseExecutor(FailingParser, workers=2, chunk_size=2)
+
+    with pytest.raises(RuntimeError, match="cannot parse 5"):
+        list(executor.map(items))
+    assert executor._processes == []
+
+
+def test_worker_cache_stats_are_merged_into_the_parent(shared_parse_cache):
+    # 12 questions over 4 distinct bodies, plus 12 distinct answer bodies
+    items = questions(12, distinct_bodies=4)
+    list(ParseExecutor(QuestionParser, workers=2, chunk_size=3).map(items))
+
+    assert shared_parse_cache.hits + shared_parse_cache.misses == 24
+    assert shared_parse_cache.misses >= 16
+
+    hits = shared_parse_cache.hits
+    list(ParseExecutor(QuestionParser, workers=2, chunk_size=3).map(items))
+    assert shared_parse_cache.hits == hits + 24
@@ -0,0 +1,81 @@
+from util.filter import Filter
+from util.query_planner import ListingCursor, QueryPlanner
+
+ITEMS = [
+    {"question_id": 1, "tags": ["gitlab", "terraform"], "score": 5},
+    {"question_id": 2, "tags": ["terraform"], "score": -1},
+    {"question_id": 3, "tags": ["gitlab"], "score": 2},
+    {"question_id": 4, "tags": ["python"], "score": 9},
+    {"question_id": 5, "tags": ["gitlab-ci", "terraform"], "score": 1},
+]
+
+
+class FakeListing:
+    def __init__(self, items=ITEMS, page_size=2):
+        self.items = items
+        self.page_size = page_size
+        self.calls = []
+
+    def __call__(self, params, cursor=None):
+        # like the API: tagged= narrows the listing server side, other params pass through
+        self.calls.append(dict(params))
+        tagged = params.get("tagged")
+        matching = [item for item in self.items if tagged is None or tagged in item["tags"]]
+        page = cursor.page if cursor is not None else 1
+        while (page - 1) * self.page_size < len(matching):
+            if cursor is not None and cursor.should_stop():
+                return
+            yield from matching[(page - 1) * self.page_size:page * self.page_size]
+            page += 1
+            if cursor is not None:
+                cursor.page = page
+
+
+def test_each_tag_is_pushed_down_as_its_own_query():
+    plan = QueryPlanner().plan(Filter(key="tags", values=["terraform", "gitlab", "terraform"],
+                                      id_field="question_id"))
+    listing = FakeListing()
+
+    assert plan.queries == [{"tagged": "terraform"}, {"tagged": "gitlab"}]
+    assert plan.residual_filter is None
+    assert plan.fetch_ids(listing, {"fromdate": 100}) == [1, 2, 5, 3]
+    assert listing.calls == [{"tagged": "terraform", "fromdate": 100}, {"tagged": "gitlab", "fromdate": 100}]
+
+
+def test_rules_the_api_cannot_express_stay_as_a_residual_filter():
+    item_filter = Filter(key="tags", values=["terraform", "gitlab"], id_field="question_id", min_score=2)
+    plan = QueryPlanner().plan(item_filter)
+
+    assert plan.queries == [{"tagged": "terraform"}, {"tagged": "gitlab"}]
+    assert plan.residual_filter is item_filter
+    assert plan.fetch_ids(FakeListing()) == [1, 3]
+
+
+def test_globs_fall_back_to_one_full_listing_filtered_client_side():
+    plan = QueryPlanner().plan(Filter(key="tags", values=["gitlab*"], id_field="question_id"))
+    listing = FakeListing()
+
+    assert plan.fetch_ids(listing) == [1, 3, 5]
+    assert listing.calls == [{}]
+
+
+def test_empty_filter_lists_nothing():
+    listing = FakeListing()
+    assert QueryPlanner().plan(Filter(key="tags", values=[], id_field="question_id")).fetch_ids(listing) == []
+    assert listing.calls == []
+
+
+def test_cursor_resumes_at_the_query_and_page_it_stopped_at():
+    plan = QueryPlanner().plan(Filter(key="tags", values=["terraform", "gitlab"], id_field="question_id"))
+    listed = []
+    cursor = ListingCursor(stop=lambda: len(listed) >= 3)
+
+    for item in plan.iter_items(FakeListing(), cursor=cursor):
+        listed.append(item["question_id"])
+    assert cursor.stopped
+    assert cursor.to_dict() == {"query": 1, "page": 1}
+
+    resumed = ListingCursor.from_dict(cursor.to_dict())
+    rest = list(plan.iter_ids(FakeListing(), cursor=resumed))
+    # duplicates are only dropped within one run, so 1 comes back after the resume
+    assert listed + rest == [1, 2, 5, 1, 3]
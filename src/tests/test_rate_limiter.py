@@ -0,0 +1,63 @@
+from util.rate_limiter import RequestScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def scheduler(**settings):
+    clock = FakeClock()
+    return RequestScheduler(clock=clock, sleep=clock.sleep, **settings), clock
+
+
+def test_burst_then_steady_rate():
+    limiter, clock = scheduler(rate=10, burst=5)
+    times = []
+    for _ in range(25):
+        limiter.acquire("questions")
+        times.append(clock.now)
+    assert times[:5] == [0.0] * 5
+    # never more than burst + rate requests in any one second
+    assert all(sum(1 for t in times if start <= t < start + 1) <= 15 for start in times)
+    assert abs(times[-1] - 2.0) < 1e-6
+
+
+def test_backoff_holds_back_only_its_method():
+    limiter, clock = scheduler(rate=100, burst=100)
+    limiter.observe("questions", {"backoff": 10})
+    limiter.acquire("answers")
+    assert clock.now == 0.0
+    limiter.acquire("questions")
+    assert clock.now >= 10.0
+
+
+def test_pause_holds_back_every_method():
+    limiter, clock = scheduler(rate=100, burst=100)
+    limiter.pause(30)
+    limiter.acquire("answers")
+    assert clock.now >= 30.0
+
+
+def test_rate_shrinks_with_quota():
+    limiter, _ = scheduler(rate=20, low_quota=1000, min_rate_fraction=0.1)
+    limiter.observe("questions", {"quota_remaining": 5000})
+    assert limiter.current_rate() == 20
+    limiter.observe("questions", {"quota_remaining": 500})
+    assert limiter.current_rate() == 10
+    limiter.observe("questions", {"quota_remaining": 0})
+    assert limiter.current_rate() == 2
+
+
+def test_retry_delay_is_jittered_exponential():
+    limiter, _ = scheduler(base_delay=1.0, max_delay=8.0)
+    for attempt, ceiling in enumerate([1, 2, 4, 8, 8]):
+        delay = limiter.retry_delay(attempt)
+        assert ceiling / 2 <= delay <= ceiling
+    assert limiter.retry_delay(0, minimum=30) == 30
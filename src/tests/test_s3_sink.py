@@ -0,0 +1,161 @@
+import gzip
+import hashlib
+import io
+import json
+
+import pytest
+
+import util.s3_sink
+from util.metrics import metrics
+from util.s3_sink import S3JsonlSink
+
+
+class FakeS3:
+    """In-memory stand-in for the S3 calls S3JsonlSink makes."""
+
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+        class NoSuchUpload(Exception):
+            pass
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+
+    def create_multipart_upload(self, Bucket, Key):
+        upload_id = f"upload-{len(self.uploads)}"
+        self.uploads[upload_id] = {"key": (Bucket, Key), "parts": {}}
+        return {"UploadId": upload_id}
+
+    def _upload(self, Bucket, Key, UploadId):
+        upload = self.uploads.get(UploadId)
+        if upload is None or upload["key"] != (Bucket, Key):
+            raise self.exceptions.NoSuchUpload(UploadId)
+        return upload
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self._upload(Bucket, Key, UploadId)["parts"][PartNumber] = bytes(Body)
+        return {"ETag": hashlib.md5(Body).hexdigest()}
+
+    def list_parts(self, Bucket, Key, UploadId, MaxParts=1000):
+        parts = self._upload(Bucket, Key, UploadId)["parts"]
+        return {"Parts": [{"PartNumber": number} for number in sorted(parts)][:MaxParts]}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self._upload(Bucket, Key, UploadId)["parts"]
+        numbers = [part["PartNumber"] for part in MultipartUpload["Parts"]]
+        assert numbers == sorted(parts), "every uploaded part must be completed, in order"
+        self.objects[(Bucket, Key)] = b"".join(parts[number] for number in numbers)
+        del self.uploads[UploadId]
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        self.objects[(Bucket, Key)] = bytes(Body)
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise self.exceptions.NoSuchKey(Key)
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+
+class FakeAws:
+    def __init__(self):
+        self.s3 = FakeS3()
+
+    def get_s3_client(self):
+        return self.s3
+
+
+@pytest.fixture(autouse=True)
+def small_parts(monkeypatch):
+    # real S3 needs 5 MiB parts; the fake takes any size, so a few records fill one
+    monkeypatch.setattr(util.s3_sink, "MIN_PART_BYTES", 1)
+    metrics.reset()
+
+
+def sink(aws, **settings):
+    return S3JsonlSink("bucket", "out", aws, part_bytes=2048, max_concurrency=2, writer="w", **settings)
+
+
+def record(i):
+    # hex digests, so gzip blocks don't shrink to nothing
+    return {"id": i, "body": "".join(hashlib.sha256(f"{i}-{j}".encode()).hexdigest() for j in range(4))}
+
+
+def shard_objects(aws):
+    shards = {key: body for (_, key), body in aws.s3.objects.items()
+              if key.startswith("out/questions/") and not key.endswith(".manifest.json")}
+    return [(body, json.loads(aws.s3.objects[("bucket", f"{key}.manifest.json")])) for key, body in shards.items()]
+
+
+def lines(body, compression):
+    if compression == "gzip":
+        body = gzip.decompress(body)
+    return [json.loads(line) for line in body.decode("utf-8").splitlines()]
+
+
+def test_close_completes_the_upload_and_writes_a_manifest():
+    aws = FakeAws()
+    output = sink(aws)
+    for i in range(100):
+        output.write_record("questions", i, record(i))
+    output.close()
+
+    [(body, manifest)] = shard_objects(aws)
+    assert lines(body, None) == [record(i) for i in range(100)]
+    assert manifest["count"] == 100 and len(manifest["parts"]) > 1
+    assert manifest["sha256"] == hashlib.sha256(body).hexdigest()
+    for entry in manifest["records"]:
+        assert json.loads(body[entry["offset"]:entry["offset"] + entry["length"]])["id"] == entry["id"]
+    assert aws.s3.uploads == {}
+    assert ("bucket", "out/_uploads/w/questions.json") not in aws.s3.objects
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_interrupted_upload_is_resumed(compression):
+    aws = FakeAws()
+    killed = sink(aws, compression=compression, block_bytes=1024)
+    for i in range(100):
+        killed.write_record("questions", i, record(i))
+    # the invocation dies: in-flight parts land, nothing else happens
+    killed.executor.shutdown(wait=True)
+    state = json.loads(aws.s3.objects[("bucket", "out/_uploads/w/questions.json")])
+    durable = len(state["records"])
+    assert 0 < durable < 100
+
+    resumed = sink(aws, compression=compression, block_bytes=1024)
+    for i in range(100, 150):
+        resumed.write_record("questions", i, record(i))
+    resumed.close()
+
+    [(body, manifest)] = shard_objects(aws)
+    expected = [record(i) for i in range(durable)] + [record(i) for i in range(100, 150)]
+    assert lines(body, compression) == expected
+    assert [entry["id"] for entry in manifest["records"]] == [r["id"] for r in expected]
+    assert manifest["sha256"] is None
+    assert aws.s3.uploads == {}
+    summary = metrics.summary()
+    assert summary["s3.uploads_resumed"] == 1
+    # records accepted after the last save are only known to the killed invocation, so this is a lower bound
+    assert summary.get("s3.records_dropped_on_resume", 0) == state["accepted"] - durable <= 100 - durable
+
+
+def test_upload_gone_starts_a_new_shard():
+    aws = FakeAws()
+    killed = sink(aws)
+    for i in range(50):
+        killed.write_record("questions", i, record(i))
+    killed.executor.shutdown(wait=True)
+    # e.g. aborted by the bucket's lifecycle rule
+    aws.s3.uploads.clear()
+
+    fresh = sink(aws)
+    fresh.write_record("questions", 50, record(50))
+    fresh.close()
+    [(body, manifest)] = shard_objects(aws)
+    assert lines(body, None) == [record(50)]
+    assert "s3.uploads_resumed" not in metrics.summary()
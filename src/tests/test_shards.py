@@ -0,0 +1,55 @@
+from util.shards import Deadline, LocalContext, LocalWorkQueue, chunks, split_windows
+
+
+class Countdown:
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+def test_split_windows_covers_the_range_without_gaps():
+    assert split_windows(0, 250, 100) == [(0, 100), (100, 200), (200, 250)]
+    assert split_windows(0, 200, 100) == [(0, 100), (100, 200)]
+    assert split_windows(50, 50, 100) == []
+    assert split_windows(0, 3, 0) == [(0, 1), (1, 2), (2, 3)]
+
+
+def test_chunks():
+    assert list(chunks([1, 2, 3, 4, 5], 2)) == [[1, 2], [3, 4], [5]]
+    assert list(chunks([], 2)) == []
+
+
+def test_deadline_keeps_the_reserve_back():
+    context = Countdown(90_000)
+    deadline = Deadline(context, reserve_seconds=60)
+    assert not deadline.expired()
+    context.remaining_ms = 59_999
+    assert deadline.expired()
+    assert not Deadline(None).expired()
+    assert LocalContext(timeout_seconds=0).get_remaining_time_in_millis() == 0
+
+
+def test_local_queue_drains_events_enqueued_while_draining():
+    queue = LocalWorkQueue()
+    queue.put({"shard": {"ids": [1, 2, 3, 4, 5]}})
+
+    def handler(event, context):
+        ids = event["shard"]["ids"]
+        # each invocation gets through two ids, then re-enqueues the rest like run_shard does
+        if ids[2:]:
+            queue.put({"shard": {"ids": ids[2:]}})
+        return ids[:2]
+
+    assert queue.drain(handler) == [[1, 2], [3, 4], [5]]
+    assert not queue.events
+
+
+def test_local_queue_delivers_events_as_json():
+    queue = LocalWorkQueue()
+    event = {"shard": {"window": (1, 2)}}
+    queue.put(event)
+    event["shard"]["window"] = None
+
+    assert list(queue.events) == [{"shard": {"window": [1, 2]}}]
@@ -0,0 +1,98 @@
+import gzip
+import hashlib
+import json
+
+from util.sink import FileSink, ShardedJsonlSink, output_sink_from_env
+
+
+def records(count):
+    # hex digests keep the lines from compressing to almost nothing
+    return [{"id": i, "body": hashlib.sha256(str(i).encode()).hexdigest() * 4} for i in range(count)]
+
+
+def manifests(stream_dir):
+    return [json.loads(path.read_text()) for path in sorted(stream_dir.glob("*.manifest.json"))]
+
+
+def test_only_file_output_reads_records_back(tmp_path, monkeypatch):
+    monkeypatch.setenv("OUTPUT_SINK", "files")
+    files = output_sink_from_env(str(tmp_path))
+    assert isinstance(files, FileSink) and files.reads_records
+    files.write_record("questions", 1, {"title": "t"})
+    assert files.read_record("questions", 1) == {"title": "t"}
+
+    monkeypatch.setenv("OUTPUT_SINK", "jsonl")
+    jsonl = output_sink_from_env(str(tmp_path))
+    assert isinstance(jsonl, ShardedJsonlSink) and not jsonl.reads_records
+    jsonl.write_record("questions", 1, {"title": "t"})
+    assert jsonl.read_record("questions", 1) is None
+    jsonl.close()
+
+
+def test_manifest_matches_the_shard_bytes(tmp_path):
+    sink = ShardedJsonlSink(str(tmp_path))
+    locations = [sink.write_record("questions", record["id"], record) for record in records(5)]
+    sink.close()
+
+    [manifest] = manifests(tmp_path / "questions")
+    shard = tmp_path / "questions" / manifest["shard"]
+    raw = shard.read_bytes()
+    assert not list((tmp_path / "questions").glob("*.tmp"))
+    assert manifest["count"] == 5
+    assert manifest["bytes"] == manifest["uncompressed_bytes"] == len(raw)
+    assert manifest["sha256"] == hashlib.sha256(raw).hexdigest()
+    for entry, location, record in zip(manifest["records"], locations, records(5)):
+        line = raw[entry["offset"]:entry["offset"] + entry["length"]]
+        assert location == f"{shard}@{entry['offset']}"
+        assert hashlib.sha256(line).hexdigest() == entry["sha256"]
+        assert json.loads(line) == record
+
+
+def test_gzip_blocks_decompress_on_their_own(tmp_path):
+    sink = ShardedJsonlSink(str(tmp_path), compression="gzip", block_bytes=600)
+    for record in records(12):
+        sink.write_record("questions", record["id"], record)
+    sink.close()
+
+    [manifest] = manifests(tmp_path / "questions")
+    raw = (tmp_path / "questions" / manifest["shard"]).read_bytes()
+    assert manifest["shard"].endswith(".jsonl.gz")
+    assert manifest["sha256"] == hashlib.sha256(raw).hexdigest()
+    assert len(manifest["blocks"]) > 1
+    blocks = []
+    for block in manifest["blocks"]:
+        data = gzip.decompress(raw[block["offset"]:block["offset"] + block["length"]])
+        assert len(data) == block["uncompressed_length"]
+        blocks.append(data)
+    # the members also read as one gzip stream
+    assert gzip.decompress(raw) == b"".join(blocks)
+    for entry, record in zip(manifest["records"], records(12)):
+        block = manifest["blocks"][entry["block"]]
+        start = entry["offset"] - block["uncompressed_offset"]
+        line = blocks[entry["block"]][start:start + entry["length"]]
+        assert hashlib.sha256(line).hexdigest() == entry["sha256"]
+        assert json.loads(line) == record
+
+
+def test_shards_roll_over_at_max_records(tmp_path):
+    sink = ShardedJsonlSink(str(tmp_path), max_records=3)
+    for record in records(7):
+        sink.write_record("questions", record["id"], record)
+    sink.close()
+
+    found = manifests(tmp_path / "questions")
+    assert [manifest["count"] for manifest in found] == [3, 3, 1]
+    assert [entry["id"] for manifest in found for entry in manifest["records"]] == list(range(7))
+
+
+def test_shards_roll_over_at_max_bytes(tmp_path):
+    line_bytes = len(json.dumps(records(1)[0])) + 1
+    sink = ShardedJsonlSink(str(tmp_path), max_bytes=2 * line_bytes + 1)
+    for record in records(7):
+        sink.write_record("questions", record["id"], record)
+    sink.close()
+
+    found = manifests(tmp_path / "questions")
+    # a shard is closed by the record that takes it over the limit
+    assert [manifest["count"] for manifest in found] == [3, 3, 1]
+    assert all(manifest["uncompressed_bytes"] > 2 * line_bytes for manifest in found[:-1])
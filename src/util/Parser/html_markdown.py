@@ -0,0 +1,597 @@
+"""
+Single-pass HTML to Markdown conversion on top of the stdlib tokenizer.
+
+Every converter here is driven by html.parser events and never builds a
+DOM. Each open element is a small frame on a stack; text and finished
+children are appended to the frame's list of parts, and a frame renders
+itself exactly once when its end tag arrives. Output therefore grows in
+one linear pass instead of being re-concatenated at every level.
+
+The frames reproduce the Markdown the BeautifulSoup based converters in
+QuestionParser, ArticleParser and ConfluenceAPI produced, including how
+html.parser trees are built: end tags close everything up to the most
+recent open element of the same name, void elements close immediately,
+and whitespace-only text outside <pre> collapses to a single space or
+newline.
+"""
+import html
+import re
+from html.entities import html5
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+
+TEXT = "text"
+# comments, doctypes, processing instructions and <script>/<style> text:
+# kept where a converter used str(), skipped where it used get_text()
+OTHER = "other"
+
+ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+VOID_ELEMENTS = frozenset([
+    "area", "base", "basefont", "bgsound", "br", "col", "command", "embed", "frame", "hr", "image",
+    "img", "input", "isindex", "keygen", "link", "menuitem", "meta", "nextid", "param", "source",
+    "spacer", "track", "wbr",
+])
+PRESERVE_WHITESPACE = frozenset(["pre", "textarea"])
+STRING_CONTAINERS = frozenset(["rt", "rp", "style", "script", "template"])
+
+# named entities without their trailing semicolon; unknown names stay literal text
+ENTITIES: Dict[str, str] = {}
+for _name, _character in sorted(html5.items()):
+    ENTITIES.setdefault(_name[:-1] if _name.endswith(";") else _name, _character)
+DECIMAL_REFERENCE = re.compile("^([0-9]+)(.*)")
+HEX_REFERENCE = re.compile("^([0-9a-f]+)(.*)")
+
+
+def numeric_reference(name: str) -> str:
+    """
+    Resolve the body of a numeric character reference such as "9731" or "x2603".
+
+    :param name: The reference without its leading ``&#``
+    :return: The character, followed by any trailing text that was not part of the number
+    """
+    base, pattern = 10, DECIMAL_REFERENCE
+    if name[:1] in ("x", "X"):
+        name, base, pattern = name[1:], 16, HEX_REFERENCE
+    extra = ""
+    try:
+        number = int(name, base)
+    except ValueError:
+        match = pattern.search(name)
+        if match is None:
+            return name
+        number, extra = int(match.group(1), base), match.group(2)
+    if number == 0 or number > 0x10FFFF or 0xD800 <= number <= 0xDFFF:
+        return "\ufffd" + extra
+    if number == 0x0D or 0x80 <= number <= 0x9F:
+        # the HTML5 windows-1252 replacements
+        return html.unescape(f"&#{number};") + extra
+    return chr(number) + extra
+
+
+class Frame:
+    __slots__ = ("tag", "attrs", "parts")
+
+    def __init__(self, tag: str, attrs: Dict[str, str]):
+        self.tag = tag
+        self.attrs = attrs
+        self.parts: List[str] = []
+
+    def text(self, data: str, kind: str) -> None:
+        pass
+
+    def child(self, tag: str, attrs: Dict[str, str]) -> "Frame":
+        return DropFrame(tag, attrs)
+
+    def add(self, rendered: Optional[str]) -> None:
+        if rendered is not None:
+            self.parts.append(rendered)
+
+    def render(self) -> Optional[str]:
+        return "".join(self.parts)
+
+
+class DropFrame(Frame):
+    """An element whose whole subtree contributes nothing."""
+    __slots__ = ()
+
+    def render(self) -> Optional[str]:
+        return None
+
+
+class StreamingConverter(HTMLParser):
+    def __init__(self, root: Frame):
+        """
+        Feed HTML events to a stack of frames rooted at ``root``.
+
+        :param root: Frame collecting the top-level output
+        """
+        super().__init__(convert_charrefs=False)
+        self.root = root
+        self.stack: List[Frame] = [root]
+        self.open_counts: Dict[str, int] = {}
+        self.already_closed: List[str] = []
+        self.pending: List[str] = []
+        self.preserve_depth = 0
+        self.container_depth = 0
+
+    def convert(self, html_content: str) -> str:
+        """
+        Convert a whole document.
+
+        :param html_content: The HTML to convert
+        :return: The Markdown
+        """
+        self.feed(html_content)
+        self.close()
+        self.flush()
+        while len(self.stack) > 1:
+            self.pop()
+        return self.root.render()
+
+    def flush(self, kind: Optional[str] = None) -> None:
+        if not self.pending:
+            return
+        data = "".join(self.pending)
+        self.pending = []
+        if not self.preserve_depth and not data.strip(ASCII_SPACES):
+            data = "\n" if "\n" in data else " "
+        if kind is None:
+            kind = OTHER if self.container_depth else TEXT
+        self.stack[-1].text(data, kind)
+
+    def push(self, tag: str, attrs) -> None:
+        self.flush()
+        attr_dict = {name: value if value is not None else "" for name, value in attrs}
+        self.stack.append(self.stack[-1].child(tag, attr_dict))
+        self.open_counts[tag] = self.open_counts.get(tag, 0) + 1
+        if tag in PRESERVE_WHITESPACE:
+            self.preserve_depth += 1
+        if tag in STRING_CONTAINERS:
+            self.container_depth += 1
+
+    def pop(self) -> None:
+        frame = self.stack.pop()
+        self.open_counts[frame.tag] -= 1
+        if frame.tag in PRESERVE_WHITESPACE:
+            self.preserve_depth -= 1
+        if frame.tag in STRING_CONTAINERS:
+            self.container_depth -= 1
+        self.stack[-1].add(frame.render())
+
+    def close_to(self, tag: str) -> None:
+        self.flush()
+        if not self.open_counts.get(tag):
+            return
+        while self.stack[-1].tag != tag:
+            self.pop()
+        self.pop()
+
+    def handle_starttag(self, tag, attrs):
+        self.push(tag, attrs)
+        if tag in VOID_ELEMENTS:
+            self.close_to(tag)
+            # a later </br> or </img> is redundant and must not split the text around it
+            self.already_closed.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.push(tag, attrs)
+        self.close_to(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.already_closed:
+            self.already_closed.remove(tag)
+        else:
+            self.close_to(tag)
+
+    def handle_data(self, data):
+        self.pending.append(data)
+
+    def handle_entityref(self, name):
+        self.pending.append(ENTITIES.get(name, f"&{name}"))
+
+    def handle_charref(self, name):
+        self.pending.append(numeric_reference(name))
+
+    def _special(self, data: str, kind: str) -> None:
+        self.flush()
+        self.pending.append(data)
+        self.flush(kind)
+
+    def handle_comment(self, data):
+        self._special(data, OTHER)
+
+    def handle_decl(self, decl):
+        self._special(decl[len("DOCTYPE "):], OTHER)
+
+    def unknown_decl(self, data):
+        if data.upper().startswith("CDATA["):
+            self._special(data[len("CDATA["):], TEXT)
+        else:
+            self._special(data, OTHER)
+
+    def handle_pi(self, data):
+        self._special(data, OTHER)
+
+
+# -- StackOverflow questions, answers and articles -------------------------
+
+INLINE_WRAPS = {"strong": ("**", "**"), "em": ("_", "_"), "code": ("`", "`")}
+HEADING_PREFIXES = {"h1": "# ", "h2": "## ", "h3": "### "}
+
+
+class InlineFrame(Frame):
+    """Inline formatting: every string is stripped and parts are joined without spaces."""
+    __slots__ = ("prefix", "suffix")
+
+    def __init__(self, tag, attrs, prefix="", suffix=""):
+        super().__init__(tag, attrs)
+        self.prefix = prefix
+        self.suffix = suffix
+
+    def text(self, data, kind):
+        self.parts.append(data.strip())
+
+    def child(self, tag, attrs):
+        if tag == "a":
+            return LinkFrame(tag, attrs)
+        return InlineFrame(tag, attrs, *INLINE_WRAPS.get(tag, ("", "")))
+
+    def render(self):
+        return self.prefix + "".join(self.parts) + self.suffix
+
+
+class LinkFrame(InlineFrame):
+    __slots__ = ()
+
+    def render(self):
+        text = "".join(self.parts).strip()
+        href = self.attrs.get("href", "").strip()
+        return f"{text} [{href}]" if href else text
+
+
+class BlockFrame(Frame):
+    """Shared block dispatch for the document root and list items."""
+    __slots__ = ("variant", "indent")
+
+    def __init__(self, tag, attrs, variant, indent=0):
+        super().__init__(tag, attrs)
+        self.variant = variant
+        self.indent = indent
+
+    def text(self, data, kind):
+        self.parts.append(data.strip())
+
+    def child(self, tag, attrs):
+        return block_frame(tag, attrs, self.variant, self.indent)
+
+
+class DocumentFrame(BlockFrame):
+    __slots__ = ()
+
+    def render(self):
+        return "\n\n".join(part for part in self.parts if part)
+
+
+class ListItemFrame(BlockFrame):
+    __slots__ = ()
+
+    def child(self, tag, attrs):
+        return block_frame(tag, attrs, self.variant, self.indent + 1)
+
+    def render(self):
+        content = " ".join(part for part in self.parts if part).strip()
+        return f"{'  ' * self.indent}- {content}"
+
+
+class ListFrame(BlockFrame):
+    __slots__ = ()
+
+    def text(self, data, kind):
+        pass
+
+    def child(self, tag, attrs):
+        if tag == "li":
+            return ListItemFrame(tag, attrs, self.variant, self.indent)
+        return DropFrame(tag, attrs)
+
+    def render(self):
+        return "\n".join(self.parts)
+
+
+class PreFrame(Frame):
+    """
+    Collects the text of every descendant. The question variant fences the
+    first nested <code> element instead when there is one.
+    """
+    __slots__ = ("variant", "code", "code_frame", "code_open")
+
+    def __init__(self, tag, attrs, variant):
+        super().__init__(tag, attrs)
+        self.variant = variant
+        self.code: List[str] = []
+        self.code_frame = None
+        self.code_open = False
+
+    def text(self, data, kind):
+        if kind == TEXT:
+            self.parts.append(data)
+            if self.code_open:
+                self.code.append(data)
+
+    def child(self, tag, attrs):
+        frame = PreChildFrame(tag, attrs, self)
+        if tag == "code" and self.code_frame is None:
+            self.code_frame = frame
+            self.code_open = True
+        return frame
+
+    def add(self, rendered):
+        pass
+
+    def render(self):
+        if self.variant == "question" and self.code_frame is not None:
+            return f"```\n{''.join(self.code)}\n```"
+        return f"```\n{''.join(self.parts)}\n```"
+
+
+class PreChildFrame(Frame):
+    __slots__ = ("pre",)
+
+    def __init__(self, tag, attrs, pre):
+        super().__init__(tag, attrs)
+        self.pre = pre
+
+    def text(self, data, kind):
+        self.pre.text(data, kind)
+
+    def child(self, tag, attrs):
+        return self.pre.child(tag, attrs)
+
+    def render(self):
+        if self.pre.code_frame is self:
+            self.pre.code_open = False
+        return None
+
+
+def block_frame(tag, attrs, variant, indent):
+    if tag in HEADING_PREFIXES:
+        return InlineFrame(tag, attrs, HEADING_PREFIXES[tag])
+    if tag == "p":
+        return InlineFrame(tag, attrs)
+    if tag == "li":
+        return ListItemFrame(tag, attrs, variant, indent)
+    if tag in ("ul", "ol"):
+        return ListFrame(tag, attrs, variant, indent)
+    if tag == "pre":
+        return PreFrame(tag, attrs, variant)
+    if tag == "code" and variant == "question":
+        # inline code at block level is wrapped twice, matching the old converter
+        return InlineFrame(tag, attrs, "``", "``")
+    if tag == "blockquote":
+        return InlineFrame(tag, attrs, "> ")
+    return DropFrame(tag, attrs)
+
+
+def stackoverflow_to_markdown(html_content: str, variant: str = "question") -> str:
+    """
+    Convert a StackOverflow question, answer or article body to Markdown.
+
+    :param html_content: Body HTML, already entity-unescaped
+    :param variant: "question" (questions and answers) or "article"
+    :return: The Markdown
+    """
+    return StreamingConverter(DocumentFrame("[document]", {}, variant)).convert(html_content)
+
+
+# -- Confluence storage format ----------------------------------------------
+
+class ConfluenceFrame(Frame):
+    """
+    Inline Confluence content. Strings are kept verbatim, including macro
+    bodies in CDATA sections; unknown elements such as ac:structured-macro
+    pass their content through.
+    """
+    __slots__ = ("indent", "prefix", "suffix")
+
+    def __init__(self, tag, attrs, indent=0, prefix="", suffix=""):
+        super().__init__(tag, attrs)
+        self.indent = indent
+        self.prefix = prefix
+        self.suffix = suffix
+
+    def text(self, data, kind):
+        self.parts.append(data)
+
+    def child(self, tag, attrs):
+        if tag in ("ul", "ol"):
+            return ConfluenceListFrame(tag, attrs, self.indent, prefix="\n")
+        if tag == "a":
+            return TextFrame(tag, attrs)
+        if tag == "strong":
+            return ConfluenceFrame(tag, attrs, self.indent, "**", "**")
+        if tag == "em":
+            return ConfluenceFrame(tag, attrs, self.indent, "*", "*")
+        if tag == "br":
+            return FixedFrame(tag, attrs, "\n")
+        if tag == "table":
+            return TableFrame(tag, attrs, prefix="\n", suffix="\n")
+        return ConfluenceFrame(tag, attrs, self.indent)
+
+    def render(self):
+        return self.prefix + "".join(self.parts) + self.suffix
+
+
+class ConfluenceParagraphFrame(ConfluenceFrame):
+    __slots__ = ()
+
+    def render(self):
+        return "".join(self.parts).strip() + "\n\n"
+
+
+class ConfluenceListItemFrame(ConfluenceFrame):
+    __slots__ = ("marker",)
+
+    def __init__(self, tag, attrs, indent, marker):
+        super().__init__(tag, attrs, indent + 1)
+        self.marker = marker
+
+    def render(self):
+        return f"{'  ' * (self.indent - 1)}{self.marker} {''.join(self.parts).strip()}\n"
+
+
+class ConfluenceListFrame(Frame):
+    __slots__ = ("indent", "prefix", "suffix", "count")
+
+    def __init__(self, tag, attrs, indent, prefix="", suffix=""):
+        super().__init__(tag, attrs)
+        self.indent = indent
+        self.prefix = prefix
+        self.suffix = suffix
+        self.count = 0
+
+    def child(self, tag, attrs):
+        if tag != "li":
+            return DropFrame(tag, attrs)
+        self.count += 1
+        marker = f"{self.count}." if self.tag == "ol" else "-"
+        return ConfluenceListItemFrame(tag, attrs, self.indent, marker)
+
+    def render(self):
+        return self.prefix + "".join(self.parts) + self.suffix
+
+
+class TextFrame(Frame):
+    """Plain text of every descendant, optionally with each string stripped."""
+    __slots__ = ("owner", "strip", "prefix", "suffix")
+
+    def __init__(self, tag, attrs, strip=False, prefix="", suffix="", owner=None):
+        super().__init__(tag, attrs)
+        self.owner = owner or self
+        self.strip = strip
+        self.prefix = prefix
+        self.suffix = suffix
+
+    def text(self, data, kind):
+        owner = self.owner
+        if kind != TEXT:
+            return
+        if owner.strip:
+            data = data.strip()
+            if not data:
+                return
+        owner.parts.append(data)
+
+    def child(self, tag, attrs):
+        return TextFrame(tag, attrs, owner=self.owner)
+
+    def add(self, rendered):
+        pass
+
+    def render(self):
+        if self.owner is not self:
+            return None
+        return self.prefix + "".join(self.parts) + self.suffix
+
+
+class FixedFrame(Frame):
+    __slots__ = ("output",)
+
+    def __init__(self, tag, attrs, output):
+        super().__init__(tag, attrs)
+        self.output = output
+
+    def render(self):
+        return self.output
+
+
+class TableFrame(Frame):
+    """
+    Collects every descendant row and, per row, every descendant cell as
+    stripped text; nested tables only contribute their rows and cells.
+    """
+    __slots__ = ("prefix", "suffix", "rows", "open_rows", "open_cells")
+
+    def __init__(self, tag, attrs, prefix="", suffix=""):
+        super().__init__(tag, attrs)
+        self.prefix = prefix
+        self.suffix = suffix
+        self.rows: List[List[List[str]]] = []
+        self.open_rows: List[List[List[str]]] = []
+        self.open_cells: List[List[str]] = []
+
+    def text(self, data, kind):
+        if kind != TEXT or not self.open_cells:
+            return
+        data = data.strip()
+        if data:
+            for cell in self.open_cells:
+                cell.append(data)
+
+    def child(self, tag, attrs):
+        if tag == "tr":
+            row = []
+            self.rows.append(row)
+            self.open_rows.append(row)
+        elif tag in ("td", "th"):
+            cell = []
+            for row in self.open_rows:
+                row.append(cell)
+            self.open_cells.append(cell)
+        return TableChildFrame(tag, attrs, self)
+
+    def add(self, rendered):
+        pass
+
+    def render(self):
+        lines = []
+        for i, row in enumerate(self.rows):
+            lines.append("| " + " | ".join("".join(cell) for cell in row) + " |\n")
+            if i == 0:
+                lines.append("| " + " | ".join("---" for _ in row) + " |\n")
+        return self.prefix + "".join(lines) + self.suffix
+
+
+class TableChildFrame(Frame):
+    __slots__ = ("table",)
+
+    def __init__(self, tag, attrs, table):
+        super().__init__(tag, attrs)
+        self.table = table
+
+    def text(self, data, kind):
+        self.table.text(data, kind)
+
+    def child(self, tag, attrs):
+        return self.table.child(tag, attrs)
+
+    def render(self):
+        if self.tag == "tr":
+            self.table.open_rows.pop()
+        elif self.tag in ("td", "th"):
+            self.table.open_cells.pop()
+        return None
+
+
+class ConfluenceDocumentFrame(Frame):
+    __slots__ = ()
+
+    def child(self, tag, attrs):
+        if tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            return TextFrame(tag, attrs, strip=True, prefix="#" * int(tag[1]) + " ", suffix="\n\n")
+        if tag == "p":
+            return ConfluenceParagraphFrame(tag, attrs)
+        if tag in ("ul", "ol"):
+            return ConfluenceListFrame(tag, attrs, 0, suffix="\n")
+        if tag == "table":
+            return TableFrame(tag, attrs, suffix="\n")
+        return DropFrame(tag, attrs)
+
+
+def confluence_to_markdown(html_content: str) -> str:
+    """
+    Convert a Confluence page body in storage format to Markdown.
+
+    :param html_content: The ``body.storage`` value of the page
+    :return: The Markdown
+    """
+    return StreamingConverter(ConfluenceDocumentFrame("[document]", {})).convert(html_content)
@@ -0,0 +1,69 @@
+import hashlib
+import os
+from typing import Callable, Optional
+from util.disk_cache import DiskCache
+
+
+class ParseCache:
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024):
+        """
+        Content-addressed cache of HTML to Markdown conversions.
+        
+        :param directory: Directory holding the cache entries
+        :param max_bytes: Total size the cache is trimmed back under
+        """
+        self.store = DiskCache(directory, max_bytes)
+
+    @staticmethod
+    def key(converter: str, version: str, raw_html: str) -> str:
+        digest = hashlib.sha256(f"{converter}:{version}\0".encode("utf-8"))
+        digest.update(raw_html.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get_or_convert(self, converter: str, version: str, raw_html: str, convert: Callable[[str], str]) -> str:
+        """
+        Return the cached Markdown for a body, converting and storing it on a miss.
+        
+        :param converter: Name of the converter, so different converters never share entries
+        :param version: Converter version; bump it to invalidate old entries
+        :param raw_html: The raw body HTML
+        :param convert: Function producing the Markdown on a miss
+        :return: The Markdown
+        """
+        key = self.key(converter, version, raw_html)
+        cached = self.store.get(key)
+        if cached is not None:
+            return cached.decode("utf-8")
+        markdown = convert(raw_html)
+        self.store.put(key, markdown.encode("utf-8"))
+        return markdown
+
+    @property
+    def hits(self) -> int:
+        return self.store.hits
+
+    @property
+    def misses(self) -> int:
+        return self.store.misses
+
+    def stats(self):
+        return self.store.stats()
+
+
+_parse_cache = None
+
+
+def get_parse_cache() -> Optional[ParseCache]:
+    """
+    Shared parse cache configured from PARSE_CACHE_DIR / PARSE_CACHE_MAX_MB.
+    
+    :return: The ParseCache, or None when PARSE_CACHE_DIR is set to an empty string
+    """
+    global _parse_cache
+    if _parse_cache is None:
+        directory = os.environ.get("PARSE_CACHE_DIR", "/tmp/parse_cache")
+        if not directory:
+            return None
+        max_bytes = int(os.environ.get("PARSE_CACHE_MAX_MB", "256")) * 1024 * 1024
+        _parse_cache = ParseCache(directory, max_bytes)
+    return _parse_cache
@@ -0,0 +1,190 @@
+import multiprocessing
+import os
+import time
+import traceback
+from collections import deque
+from multiprocessing.connection import wait
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+from util.Parser.parse_cache import get_parse_cache
+from util.metrics import metrics
+
+
+def _parse_chunk(parser_cls, items: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[float]]:
+    results = []
+    durations = []
+    for item in items:
+        start = time.perf_counter()
+        results.append(parser_cls(item).to_clean_json())
+        durations.append((time.perf_counter() - start) * 1000)
+    return results, durations
+
+
+def _html_bytes(item: Dict[str, Any]) -> int:
+    return len(item.get("body") or "") + sum(len(answer.get("body") or "") for answer in item.get("answers", []))
+
+
+def _record_parse(items, durations) -> None:
+    for item, duration in zip(items, durations):
+        metrics.observe("parse.item_ms", duration)
+        metrics.incr("parse.html_bytes", _html_bytes(item), unit="Bytes")
+
+
+def _worker_main(conn, parser_cls) -> None:
+    """
+    Worker loop: receive a chunk of raw items, send back their clean JSON.
+
+    Workers talk to the parent over a Pipe only; multiprocessing queues and
+    pools need /dev/shm, which Lambda does not provide.
+    """
+    cache = get_parse_cache()
+    while True:
+        chunk = conn.recv()
+        if chunk is None:
+            break
+        hits, misses = (cache.hits, cache.misses) if cache else (0, 0)
+        try:
+            results, durations = _parse_chunk(parser_cls, chunk)
+        except Exception:
+            conn.send(("error", traceback.format_exc()))
+            continue
+        if cache:
+            hits, misses = cache.hits - hits, cache.misses - misses
+        conn.send(("ok", results, hits, misses, durations))
+    conn.close()
+
+
+class ParseExecutor:
+    def __init__(self, parser_cls, workers: int = None, chunk_size: int = 16, max_pending: int = None,
+                 start_method: str = "spawn"):
+        """
+        Run parser_cls(item).to_clean_json() for a stream of items on a pool of processes.
+
+        :param parser_cls: Parser class used for each item
+        :param workers: Number of worker processes, defaults to the CPU count; 1 parses in-process
+        :param chunk_size: Items sent to a worker at a time
+        :param max_pending: Chunks read ahead of the writer before input is paused, defaults to 2 per worker
+        :param start_method: multiprocessing start method; spawn keeps workers clear of the parent's threads
+        """
+        self.parser_cls = parser_cls
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.chunk_size = max(1, chunk_size)
+        self.max_pending = max(self.workers, max_pending or 2 * self.workers)
+        self.start_method = start_method
+        self._processes = []
+
+    @classmethod
+    def from_env(cls, parser_cls) -> "ParseExecutor":
+        """
+        Build an executor configured by PARSE_WORKERS, PARSE_CHUNK_SIZE and PARSE_MAX_PENDING.
+
+        :param parser_cls: Parser class used for each item
+        :return: A ParseExecutor
+        """
+        workers = os.environ.get("PARSE_WORKERS")
+        max_pending = os.environ.get("PARSE_MAX_PENDING")
+        return cls(
+            parser_cls,
+            workers=int(workers) if workers else None,
+            chunk_size=int(os.environ.get("PARSE_CHUNK_SIZE", "16")),
+            max_pending=int(max_pending) if max_pending else None,
+        )
+
+    def map(self, items: Iterable[Dict[str, Any]]) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """
+        Parse items, yielding results in input order.
+
+        :param items: Iterable of raw item dicts, consumed lazily
+        :return: Generator of (item, clean_json) pairs
+        """
+        if self.workers == 1:
+            for item in items:
+                results, durations = _parse_chunk(self.parser_cls, [item])
+                _record_parse([item], durations)
+                yield item, results[0]
+            return
+
+        context = multiprocessing.get_context(self.start_method)
+        idle = []
+        for _ in range(self.workers):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=_worker_main, args=(child_conn, self.parser_cls), daemon=True)
+            process.start()
+            child_conn.close()
+            self._processes.append((process, parent_conn))
+            idle.append(parent_conn)
+
+        try:
+            yield from self._dispatch(self._chunks(items), idle)
+        finally:
+            self.close()
+
+    def _chunks(self, items):
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) == self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _dispatch(self, chunks, idle):
+        # chunks in input order: [items, results or None]; only the head is ever yielded
+        pending = deque()
+        busy = {}
+        exhausted = False
+        cache = get_parse_cache()
+
+        while True:
+            # hand chunks to idle workers, but never read more than max_pending ahead of the writer
+            while idle and not exhausted and len(pending) < self.max_pending:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                    break
+                slot = [chunk, None]
+                pending.append(slot)
+                conn = idle.pop()
+                conn.send(chunk)
+                busy[conn] = slot
+
+            while pending and pending[0][1] is not None:
+                chunk, results = pending.popleft()
+                yield from zip(chunk, results)
+
+            if not busy:
+                if exhausted and not pending:
+                    return
+                continue
+
+            for conn in wait(list(busy)):
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError) as e:
+                    raise RuntimeError(f"Parse worker exited unexpectedly: {e}") from e
+                if message[0] == "error":
+                    raise RuntimeError(f"Parse worker failed:\n{message[1]}")
+                _, results, hits, misses, durations = message
+                if cache:
+                    cache.store.hits += hits
+                    cache.store.misses += misses
+                slot = busy.pop(conn)
+                _record_parse(slot[0], durations)
+                slot[1] = results
+                idle.append(conn)
+
+    def close(self) -> None:
+        """
+        Stop the worker processes.
+        """
+        for process, conn in self._processes:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process, conn in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+            conn.close()
+        self._processes = []
@@ -1,18 +1,45 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Dict, Any, Callable
+from util.Parser.parse_cache import get_parse_cache
 
 
 class Parser(ABC):
+    # bump whenever a converter's Markdown output changes, so cached entries are not reused
+    CONVERTER_VERSION = "1"
+
     @abstractmethod
     def to_clean_json(self) -> Dict[str, Any]:
         pass
 
+    def cached_markdown(self, raw_html: str, convert: Callable[[str], str]) -> str:
+        """
+        Convert a body to Markdown through the shared parse cache.
+        
+        :param raw_html: The raw body HTML
+        :param convert: Function doing the actual conversion on a cache miss
+        :return: The Markdown
+        """
+        cache = get_parse_cache()
+        if cache is None:
+            return convert(raw_html)
+        return cache.get_or_convert(type(self).__name__, self.CONVERTER_VERSION, raw_html, convert)
+
     def parse_to_outfile(self, outfile: str) -> None:
         """
         Write the parsed data to a JSON file.
         
+        :param outfile: Path to the output file
+        """
+        self.write_outfile(self.to_clean_json(), outfile)
+
+    @staticmethod
+    def write_outfile(data: Dict[str, Any], outfile: str) -> None:
+        """
+        Write already parsed data to a JSON file.
+        
+        :param data: Output of to_clean_json
         :param outfile: Path to the output file
         """
         import json
         with open(outfile, 'w', encoding='utf-8') as f:
-            json.dump(self.to_clean_json(), f, ensure_ascii=False, indent=4)
\ No newline at end of file
+            json.dump(data, f, ensure_ascii=False, indent=4)
\ No newline at end of file
@@ -1,75 +1,32 @@
 from typing import Dict, Any, List
-from bs4 import BeautifulSoup, NavigableString
 import html
 from util.Parser.parser import Parser
+from util.Parser.html_markdown import stackoverflow_to_markdown
 
 
 class QuestionParser(Parser):
     def __init__(self, response_data: Dict[str, Any]):
         self.response_data = response_data
-    def format_inline(self, el) -> str:
-        if isinstance(el, NavigableString):
-            return el.strip()
-        elif el.name == 'strong':
-            return f"**{''.join(self.format_inline(c) for c in el.contents)}**"
-        elif el.name == 'em':
-            return f"_{''.join(self.format_inline(c) for c in el.contents)}_"
-        elif el.name == 'code':
-            return f"`{''.join(self.format_inline(c) for c in el.contents)}`"
-        elif el.name == 'a':
-            href = el.get('href', '').strip()
-            text = ''.join(self.format_inline(c) for c in el.contents).strip()
-            return f"{text} [{href}]" if href else text
-        else:
-            return ''.join(self.format_inline(c) for c in el.contents)
 
     def parse_body_to_markdown(self, raw_html: str) -> str:
-        soup = BeautifulSoup(html.unescape(raw_html), 'html.parser')
+        return self.cached_markdown(raw_html, self.convert_body_to_markdown)
 
-        
-        def process_element(el, indent=0):
-            if isinstance(el, NavigableString):
-                return el.strip()
+    def convert_body_to_markdown(self, raw_html: str) -> str:
+        return stackoverflow_to_markdown(html.unescape(raw_html), variant="question")
 
-            if el.name == 'h1':
-                return f"# {self.format_inline(el)}"
-            elif el.name == 'h2':
-                return f"## {self.format_inline(el)}"
-            elif el.name == 'h3':
-                return f"### {self.format_inline(el)}"
-            elif el.name == 'p':
-                return self.format_inline(el)
-            elif el.name == 'li':
-                content = [process_element(child, indent + 1) for child in el.contents]
-                return f"{'  ' * indent}- {' '.join(filter(None, content)).strip()}"
-            elif el.name in ['ul', 'ol']:
-                items = [process_element(li, indent) for li in el.find_all('li', recursive=False)]
-                return '\n'.join(items)
-            elif el.name == 'pre':
-                # Check if <code> is inside <pre>
-                code_block = el.find('code')
-                if code_block:
-                    return f"```\n{code_block.get_text()}\n```"
-                else:
-                    return f"```\n{el.get_text()}\n```"
-            elif el.name == 'code':
-                # Inline code
-                return f"`{self.format_inline(el)}`"
-            elif el.name == 'blockquote':
-                return '> ' + self.format_inline(el)
-            return ''
-
-
-        markdown_lines = []
-        for child in soup.contents:
-            if hasattr(child, 'name'):
-                line = process_element(child)
-                if line:
-                    markdown_lines.append(line)
-
-        return '\n\n'.join(markdown_lines)
+    def parse_answer(self, answer: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "answer_id": answer.get("answer_id"),
+            "score": answer.get("score"),
+            "created": answer.get("creation_date"),
+            "is_accepted": answer.get("is_accepted"),
+            "body_markdown": self.parse_body_to_markdown(answer.get("body", ""))
+        }
 
     def to_clean_json(self) -> List[Dict[str, Any]]:
+        if "stored_record" in self.response_data:
+            return self.merge_answers()
+
         question = {
             "title": self.response_data.get("title"),
             "tags": self.response_data.get("tags", []),
@@ -81,12 +38,31 @@ class QuestionParser(Parser):
         }
 
         for answer in self.response_data.get("answers", []):
-            parsed_answer = {
-                "score": answer.get("score"),
-                "created": answer.get("creation_date"),
-                "is_accepted": answer.get("is_accepted"),
-                "body_markdown": self.parse_body_to_markdown(answer.get("body", ""))
-            }
-            question["answers"].append(parsed_answer)
+            question["answers"].append(self.parse_answer(answer))
 
         return question
+
+    def merge_answers(self) -> Dict[str, Any]:
+        """
+        Merge changed answers into a question record written by an earlier run.
+
+        The item is a merge item from util.answer_merge: ``stored_record`` is the
+        earlier output, ``answer_stubs`` every current answer without bodies and
+        ``answers`` only the new or edited ones, with bodies. Only those are parsed;
+        the others keep their Markdown and get their score and is_accepted updated.
+        Deleted answers are dropped and new ones go after the existing ones.
+
+        :return: The merged record
+        """
+        stubs = {stub["answer_id"]: stub for stub in self.response_data.get("answer_stubs", [])}
+        changed = {answer["answer_id"]: self.parse_answer(answer) for answer in self.response_data.get("answers", [])}
+        answers = []
+        for answer in self.response_data["stored_record"].get("answers", []):
+            stub = stubs.get(answer["answer_id"])
+            if stub is None:
+                continue
+            parsed = changed.pop(answer["answer_id"], None)
+            answers.append(parsed or dict(answer, score=stub.get("score"), is_accepted=stub.get("is_accepted")))
+        answers.extend(changed.values())
+        return dict(self.response_data["stored_record"], tags=self.response_data.get("tags", []),
+                    score=self.response_data.get("score"), answers=answers)
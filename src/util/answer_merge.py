@@ -0,0 +1,75 @@
+from typing import Any, Dict, Iterable, Iterator, List
+from util.metrics import metrics
+
+
+def _edited_since(stub: Dict[str, Any], since: int) -> bool:
+    return (stub.get("last_edit_date") or stub.get("creation_date") or 0) >= since
+
+
+def iter_question_updates(changes: Iterable[Dict[str, Any]], stackoverflow_api, sink, since: int,
+                          batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+    """
+    Turn changed questions into the items QuestionParser needs, fetching as few bodies as possible.
+
+    A question whose record can be read back from the sink, and was not itself
+    edited since ``since``, becomes a merge item: its answers are listed without
+    bodies and only new or edited ones are fetched, by answer id. Every other
+    question is fetched whole, as before.
+
+    :param changes: Question change stubs in an activity window, e.g. StackOverflow.iter_question_changes
+    :param stackoverflow_api: StackOverflow client
+    :param sink: OutputSink the questions were written to, one whose reads_records is True
+    :param since: Epoch seconds the window starts at; answers edited at or after it are fetched again
+    :param batch_size: Changed questions looked at together, bounding the records held at once
+    :return: Generator of full question items and merge items, each with question_id and last_activity_date
+    """
+    batch: List[Dict[str, Any]] = []
+    for change in changes:
+        batch.append(change)
+        if len(batch) >= batch_size:
+            yield from _batch_updates(batch, stackoverflow_api, sink, since)
+            batch = []
+    if batch:
+        yield from _batch_updates(batch, stackoverflow_api, sink, since)
+
+
+def _batch_updates(changes, stackoverflow_api, sink, since):
+    refetch = []
+    merges = []
+    for change in changes:
+        record = None
+        if not _edited_since(change, since):
+            record = sink.read_record("questions", change["question_id"])
+        # records written before answers carried their ids can't be merged into
+        if record is None or any("answer_id" not in answer for answer in record.get("answers", [])):
+            refetch.append(change["question_id"])
+        else:
+            merges.append((change, record))
+
+    answer_stubs: Dict[Any, List[Dict[str, Any]]] = {}
+    wanted = []
+    if merges:
+        for stub in stackoverflow_api.iter_answer_changes(change["question_id"] for change, _ in merges):
+            answer_stubs.setdefault(stub["question_id"], []).append(stub)
+    for change, record in merges:
+        stored = {answer["answer_id"] for answer in record.get("answers", [])}
+        wanted.extend(stub["answer_id"] for stub in answer_stubs.get(change["question_id"], [])
+                      if stub["answer_id"] not in stored or _edited_since(stub, since))
+    answers: Dict[Any, List[Dict[str, Any]]] = {}
+    for answer in stackoverflow_api.iter_answers_by_ids(wanted) if wanted else ():
+        answers.setdefault(answer["question_id"], []).append(answer)
+
+    metrics.incr("merge.questions_merged", len(merges))
+    metrics.incr("merge.questions_refetched", len(refetch))
+    metrics.incr("merge.answers_fetched", len(wanted))
+    for change, record in merges:
+        yield {
+            "question_id": change["question_id"],
+            "last_activity_date": change.get("last_activity_date"),
+            "tags": change.get("tags", []),
+            "score": change.get("score"),
+            "stored_record": record,
+            "answer_stubs": answer_stubs.get(change["question_id"], []),
+            "answers": answers.get(change["question_id"], []),
+        }
+    yield from stackoverflow_api.iter_questions_by_ids(refetch)
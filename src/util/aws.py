@@ -1,18 +1,143 @@
-import boto3
+from typing import Dict, List, Optional
+import threading
+import time
+from util.metrics import metrics
+
 
 class AWS:
     def __init__(self, region_name="us-east-1"):
         """
         Initialize the AWS helper class.
         
+        boto3 is imported on first use, so runs that never touch AWS (local runs
+        with SSM_OVERRIDE and file checkpoints) skip its import cost entirely.
+        
         :param region_name: AWS region to use (default: us-east-1)
         """
         self.region_name = region_name
+        self._clients = {}
+        # creating clients from the default boto3 session is not thread safe
+        self._lock = threading.Lock()
+
+    def _client(self, service):
+        with self._lock:
+            client = self._clients.get(service)
+            if client is None:
+                import boto3
+                client = self._clients[service] = boto3.client(service, region_name=self.region_name)
+            return client
 
     def get_ssm_client(self):
         """
-        Get a boto3 SSM client.
+        Get a boto3 SSM client, created once and reused.
         
         :return: boto3 SSM client object
         """
-        return boto3.client("ssm", region_name=self.region_name)
\ No newline at end of file
+        return self._client("ssm")
+
+    def get_s3_client(self):
+        """
+        Get a boto3 S3 client, created once and reused.
+        
+        :return: boto3 S3 client object
+        """
+        return self._client("s3")
+
+    def get_sqs_client(self):
+        """
+        Get a boto3 SQS client, created once and reused.
+
+        :return: boto3 SQS client object
+        """
+        return self._client("sqs")
+
+
+class ParameterCache:
+    # get_parameters accepts at most 10 names per call
+    BATCH_SIZE = 10
+
+    def __init__(self, aws_client: AWS, ttl_seconds: float = 900):
+        """
+        Decrypted SSM parameters, kept for ttl_seconds so warm invocations skip SSM.
+        
+        When SSM can't be reached to refresh an expired value, the expired value is
+        served instead of failing the invocation; a value a caller reported as
+        rejected never is.
+        
+        :param aws_client: AWS helper used to create the SSM client
+        :param ttl_seconds: How long a fetched value is reused before SSM is asked again
+        """
+        self.aws_client = aws_client
+        self.ttl_seconds = ttl_seconds
+        self._values: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def _fresh(self, name: str) -> Optional[str]:
+        entry = self._values.get(name)
+        if entry is not None and time.monotonic() - entry[1] < self.ttl_seconds:
+            return entry[0]
+        return None
+
+    def get_many(self, names: List[str]) -> Dict[str, str]:
+        """
+        Get several parameters, fetching every missing or expired one in a single get_parameters call.
+        
+        :param names: SSM parameter names
+        :return: Dict of parameter name to decrypted value
+        :raises KeyError: If SSM does not know one of the names
+        """
+        with self._lock:
+            missing = [name for name in dict.fromkeys(names) if self._fresh(name) is None]
+            for i in range(0, len(missing), self.BATCH_SIZE):
+                self._refresh(missing[i:i + self.BATCH_SIZE])
+            return {name: self._values[name][0] for name in names}
+
+    def get(self, name: str, stale: Optional[str] = None) -> str:
+        """
+        Get one parameter.
+        
+        Callers that were rejected with a value pass it as ``stale``; SSM is then
+        asked again unless another caller has already replaced that value.
+        
+        :param name: SSM parameter name
+        :param stale: A value the caller knows to be rejected
+        :return: The decrypted value
+        """
+        with self._lock:
+            entry = self._values.get(name)
+            if stale is not None and entry is not None and entry[0] == stale:
+                self._fetch([name])
+            elif self._fresh(name) is None:
+                self._refresh([name])
+            return self._values[name][0]
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        """
+        Drop one cached parameter, or all of them.
+        
+        :param name: SSM parameter name, None for everything
+        """
+        with self._lock:
+            if name is None:
+                self._values.clear()
+            else:
+                self._values.pop(name, None)
+
+    def _refresh(self, names: List[str]) -> None:
+        try:
+            self._fetch(names)
+        except KeyError:
+            raise
+        except Exception as e:
+            if not all(name in self._values for name in names):
+                raise
+            metrics.incr("secrets.stale")
+            print(f"Could not refresh SSM parameters, reusing the expired values: {e}")
+
+    def _fetch(self, names: List[str]) -> None:
+        response = self.aws_client.get_ssm_client().get_parameters(Names=names, WithDecryption=True)
+        if response.get("InvalidParameters"):
+            raise KeyError(f"SSM parameters not found: {response['InvalidParameters']}")
+        fetched_at = time.monotonic()
+        for parameter in response["Parameters"]:
+            self._values[parameter["Name"]] = (parameter["Value"], fetched_at)
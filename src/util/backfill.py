@@ -0,0 +1,180 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import time
+from util.listing_index import IdSet
+from util.metrics import metrics
+
+
+def plan_windows(count: Callable[[int, int], int], since: int, until: int, target_items: int,
+                 min_window_seconds: int = 3600) -> List[Tuple[int, int]]:
+    """
+    Split [since, until) into windows holding at most about target_items items each.
+
+    A window over target is cut into as many equal parts as its count calls
+    for and each part is probed again, so busy stretches of history get short
+    windows and quiet ones long windows. Empty windows are left out.
+
+    :param count: Callable(since, until) returning the number of items in a window
+    :param since: Epoch seconds, inclusive
+    :param until: Epoch seconds, exclusive
+    :param target_items: Items a window should fit in, e.g. a handful of pages
+    :param min_window_seconds: Windows are never cut shorter than this, however many items they hold
+    :return: List of (since, until) pairs in time order
+    """
+    total = count(since, until)
+    metrics.incr("backfill.count_probes")
+    if total == 0:
+        return []
+    if total <= target_items or until - since <= min_window_seconds:
+        return [(since, until)]
+    parts = max(2, min(-(-total // target_items), (until - since) // min_window_seconds))
+    step = -(-(until - since) // parts)
+    windows = []
+    for start in range(since, until, step):
+        windows.extend(plan_windows(count, start, min(start + step, until), target_items, min_window_seconds))
+    return windows
+
+
+class Backfill:
+    def __init__(self, query_plan, until: int, units: List[List[Any]], done=None):
+        """
+        A full listing of a QueryPlan split into (query, window) units that are paged concurrently.
+
+        Each unit is one of the plan's queries over one activity window. Units
+        are recorded as done once every item they listed has been processed, so
+        an interrupted backfill only lists the units still missing.
+
+        :param query_plan: QueryPlan whose queries the units index into
+        :param until: Epoch seconds every window ends by, exclusive
+        :param units: List of [query index, since, until]
+        :param done: Indices of units finished by an earlier invocation
+        """
+        self.query_plan = query_plan
+        self.until = until
+        self.units = units
+        self.done = set(done or [])
+        # optional callable() persisting to_dict(), called at most every checkpoint_seconds as units finish
+        self.save: Optional[Callable[[], None]] = None
+        self.checkpoint_seconds = 60.0
+        self._last_save = time.monotonic()
+        # units in the order they were handed out, and how many of them are known to be done
+        self._order: List[int] = []
+        self._through = 0
+        self._position: Dict[Any, int] = {}
+
+    @classmethod
+    def plan(cls, query_plan, count_fn: Callable[[Dict[str, Any]], int], window_params, since: int, until: int,
+             target_items: int, min_window_seconds: int = 3600, max_workers: int = 4) -> "Backfill":
+        """
+        Plan a backfill from cheap count probes, the plan's queries probed concurrently.
+
+        :param query_plan: QueryPlan to backfill
+        :param count_fn: Callable(params) returning the number of items a listing would return,
+            e.g. StackOverflow.count_questions
+        :param window_params: Callable(since, until) returning the listing parameters of a window,
+            e.g. StackOverflow.activity_params
+        :param since: Epoch seconds history starts at
+        :param until: Epoch seconds history ends at, exclusive
+        :param target_items: Items a window should fit in
+        :param min_window_seconds: Shortest window
+        :param max_workers: Probes in flight at once
+        :return: A Backfill
+        """
+        def plan_query(query):
+            return plan_windows(lambda start, end: count_fn(dict(query, **window_params(start, end))),
+                                since, until, target_items, min_window_seconds)
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            windows = list(executor.map(plan_query, query_plan.queries))
+        units = [[index, start, end] for index, query_windows in enumerate(windows) for start, end in query_windows]
+        metrics.incr("backfill.windows", len(units))
+        return cls(query_plan, until, units)
+
+    @classmethod
+    def from_dict(cls, query_plan, data: Dict[str, Any]) -> "Backfill":
+        return cls(query_plan, data["until"], data["units"], data.get("done"))
+
+    def to_dict(self) -> Dict[str, Any]:
+        # the queries the unit indices point into, so a plan for other filters is never resumed
+        return {"until": self.until, "queries": self.query_plan.queries, "units": self.units,
+                "done": sorted(self.done)}
+
+    @property
+    def complete(self) -> bool:
+        return len(self.done) == len(self.units)
+
+    def items(self, list_fn, window_params, max_workers: int = 4) -> Iterator[Dict[str, Any]]:
+        """
+        List every unit not done yet, up to max_workers at once, dropping ids already yielded.
+
+        Units are handed back whole and in order, so at most max_workers units
+        of items are held at a time.
+
+        :param list_fn: Listing method accepting a ``params`` dict, e.g. StackOverflow.iter_questions
+        :param window_params: Callable(since, until) returning the listing parameters of a window
+        :param max_workers: Units listed at once
+        :return: Generator of items
+        """
+        id_field = self.query_plan.id_field
+        residual_filter = self.query_plan.residual_filter
+
+        def fetch(unit):
+            index, start, end = unit
+            params = dict(self.query_plan.queries[index], **window_params(start, end))
+            return list(list_fn(params=params))
+
+        seen = IdSet()
+        pending_units = [i for i in range(len(self.units)) if i not in self.done]
+        metrics.incr("backfill.windows_skipped", len(self.units) - len(pending_units))
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            pending = deque()
+            for unit_index in pending_units:
+                pending.append((unit_index, executor.submit(fetch, self.units[unit_index])))
+                while pending and (pending[0][1].done() or len(pending) >= max_workers):
+                    yield from self._unit_items(*pending.popleft(), id_field, residual_filter, seen)
+            while pending:
+                yield from self._unit_items(*pending.popleft(), id_field, residual_filter, seen)
+
+    def _unit_items(self, unit_index, future, id_field, residual_filter, seen):
+        self._order.append(unit_index)
+        position = len(self._order) - 1
+        for item in future.result():
+            if id_field not in item:
+                continue
+            if residual_filter is not None and not residual_filter.matches(item):
+                metrics.incr("filter.rejected")
+                continue
+            item_id = item[id_field]
+            if seen.add(item_id):
+                self._position[item_id] = position
+                yield item
+
+    def processed(self, item_id) -> None:
+        """
+        Note that a yielded item was written or dropped.
+
+        Items are processed in the order they were yielded, so once an item of
+        a unit is processed every unit handed out before it is done.
+
+        :param item_id: Id of the processed item
+        """
+        position = self._position.pop(item_id, None)
+        if position is None or position <= self._through:
+            return
+        self.done.update(self._order[self._through:position])
+        self._through = position
+        self._checkpoint()
+
+    def finish(self) -> None:
+        """
+        Mark every unit handed out as done, once all of their items were processed.
+        """
+        self.done.update(self._order)
+        self._through = len(self._order)
+        self._position.clear()
+
+    def _checkpoint(self) -> None:
+        if self.save is not None and time.monotonic() - self._last_save >= self.checkpoint_seconds:
+            self._last_save = time.monotonic()
+            self.save()
@@ -0,0 +1,124 @@
+from typing import Iterable, Iterator, List, Optional
+import os
+import threading
+
+# the most ids a StackExchange vector request accepts
+MAX_VECTOR_IDS = 100
+# room kept for one more id and its separator: 19 digits and a ";"
+_MAX_ID_CHARS = 20
+
+
+class AdaptiveBatchSizer:
+    def __init__(self, max_ids: int = MAX_VECTOR_IDS, max_url_chars: int = 2000, page_size: int = 100,
+                 target_bytes: int = 4 * 1024 * 1024, target_seconds: float = 10.0, low_quota: int = 1000,
+                 smoothing: float = 0.3):
+        """
+        Picks how many ids go into each by-id request, aiming for the fewest requests per id.
+
+        Batches start at max_ids and only shrink while what came back says they
+        should: a batch whose items overflow one page (answers are many per
+        question), whose response is over target_bytes or that took over
+        target_seconds. Per-id averages are smoothed over recent batches, so
+        batches grow back once responses get small again. While quota_remaining
+        is under low_quota the latency target is dropped, spending time rather
+        than requests.
+
+        :param max_ids: Most ids per request, at most MAX_VECTOR_IDS
+        :param max_url_chars: Longest request URL, query string included
+        :param page_size: pagesize sent with every request; a batch is sized to fit one page
+        :param target_bytes: Response size batches are shrunk under
+        :param target_seconds: Response time batches are shrunk under
+        :param low_quota: quota_remaining under which the latency target no longer applies
+        :param smoothing: Weight of the latest batch in the per-id averages
+        """
+        self.max_ids = max(1, min(max_ids, MAX_VECTOR_IDS))
+        self.max_url_chars = max_url_chars
+        self.page_size = page_size
+        self.target_bytes = target_bytes
+        self.target_seconds = target_seconds
+        self.low_quota = low_quota
+        self.smoothing = smoothing
+        self.items_per_id: Optional[float] = None
+        self.bytes_per_id: Optional[float] = None
+        self.seconds_per_id: Optional[float] = None
+        self.quota_remaining: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "AdaptiveBatchSizer":
+        """
+        Sizer configured from STACKOVERFLOW_BATCH_MAX_IDS / STACKOVERFLOW_BATCH_TARGET_KB /
+        STACKOVERFLOW_BATCH_TARGET_SECONDS / STACKOVERFLOW_LOW_QUOTA.
+        """
+        return cls(
+            max_ids=int(os.environ.get("STACKOVERFLOW_BATCH_MAX_IDS", str(MAX_VECTOR_IDS))),
+            target_bytes=int(os.environ.get("STACKOVERFLOW_BATCH_TARGET_KB", "4096")) * 1024,
+            target_seconds=float(os.environ.get("STACKOVERFLOW_BATCH_TARGET_SECONDS", "10")),
+            low_quota=int(os.environ.get("STACKOVERFLOW_LOW_QUOTA", "1000")),
+        )
+
+    def size(self) -> int:
+        """
+        :return: Number of ids the next batch should carry
+        """
+        with self._lock:
+            size = float(self.max_ids)
+            if self.items_per_id:
+                size = min(size, self.page_size / self.items_per_id)
+            if self.bytes_per_id:
+                size = min(size, self.target_bytes / self.bytes_per_id)
+            low_quota = self.quota_remaining is not None and self.quota_remaining < self.low_quota
+            if self.seconds_per_id and not low_quota:
+                size = min(size, self.target_seconds / self.seconds_per_id)
+            return max(1, int(size))
+
+    def batches(self, ids: Iterable[int], base_url_chars: int = 0) -> Iterator[List[int]]:
+        """
+        Split ids into batches of the current size that keep the URL under max_url_chars.
+
+        Ids are pulled one at a time and a batch is handed out as soon as it is
+        full, never holding an id back, so a consumer that stops early has sent
+        every id it pulled.
+
+        :param ids: Iterable of ids, consumed lazily
+        :param base_url_chars: Length of the request URL without the ids
+        :return: Generator of id lists
+        """
+        batch: List[int] = []
+        chars = base_url_chars
+        size = self.size()
+        for item_id in ids:
+            batch.append(item_id)
+            chars += len(str(item_id)) + 1
+            if len(batch) >= size or chars + _MAX_ID_CHARS > self.max_url_chars:
+                yield batch
+                batch = []
+                chars = base_url_chars
+                size = self.size()
+        if batch:
+            yield batch
+
+    def observe(self, ids: int, items: int, response_bytes: int, seconds: float,
+                quota_remaining: Optional[int] = None) -> None:
+        """
+        Feed back what one whole batch returned, across all of its pages.
+
+        :param ids: Ids in the batch
+        :param items: Items returned
+        :param response_bytes: Bytes received
+        :param seconds: Time spent fetching it
+        :param quota_remaining: Last quota_remaining the API reported, if any
+        """
+        if ids <= 0:
+            return
+        with self._lock:
+            self.items_per_id = self._smooth(self.items_per_id, items / ids)
+            self.bytes_per_id = self._smooth(self.bytes_per_id, response_bytes / ids)
+            self.seconds_per_id = self._smooth(self.seconds_per_id, seconds / ids)
+            if quota_remaining is not None:
+                self.quota_remaining = quota_remaining
+
+    def _smooth(self, average: Optional[float], value: float) -> float:
+        if average is None:
+            return value
+        return average + self.smoothing * (value - average)
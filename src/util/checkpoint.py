@@ -0,0 +1,177 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Any, Optional
+import json
+import os
+
+
+class Watermark:
+    def __init__(self, value: Optional[int] = None, ids=None):
+        """
+        High-water mark for one source.
+        
+        covers() always answers against the mark the run started from, while
+        observe() advances a separate next mark, so items arriving out of
+        order within a run are never skipped.
+        
+        :param value: Last successful last_activity_date (or page version time) as epoch seconds
+        :param ids: Ids already written whose value equals the watermark
+        """
+        self.value = value
+        self.ids = frozenset(ids or [])
+        self.next_value = value
+        self.next_ids = set(self.ids)
+
+    def covers(self, item_id, value) -> bool:
+        """
+        Check whether an item was already written by an earlier run.
+        
+        :param item_id: Id of the item
+        :param value: The item's activity/version time as epoch seconds
+        :return: True if the item is at or behind the watermark and was written
+        """
+        if self.value is None or value is None:
+            return False
+        return value < self.value or (value == self.value and item_id in self.ids)
+
+    def observe(self, item_id, value) -> None:
+        """
+        Advance the next mark past a written item.
+        
+        :param item_id: Id of the written item
+        :param value: The item's activity/version time as epoch seconds
+        """
+        if value is None:
+            return
+        if self.next_value is None or value > self.next_value:
+            self.next_value = value
+            self.next_ids = {item_id}
+        elif value == self.next_value:
+            self.next_ids.add(item_id)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"value": self.next_value, "ids": sorted(self.next_ids, key=str)}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Watermark":
+        return cls(value=data.get("value"), ids=data.get("ids", []))
+
+
+class CheckpointStore(ABC):
+    @abstractmethod
+    def _load(self) -> Dict[str, Any]:
+        pass
+
+    @abstractmethod
+    def _save(self, data: Dict[str, Any]) -> None:
+        pass
+
+    def get_state(self, name: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a raw state document stored next to the watermarks.
+        
+        :param name: State name, e.g. "confluence:pages"
+        :return: The stored dict, or None if nothing was stored yet
+        """
+        return self._load().get(name)
+
+    def set_state(self, name: str, state: Dict[str, Any]) -> None:
+        """
+        Persist a raw state document next to the watermarks.
+        
+        :param name: State name, e.g. "confluence:pages"
+        :param state: JSON-serializable dict to store
+        """
+        data = self._load()
+        data[name] = state
+        self._save(data)
+
+    def get(self, source: str) -> Optional[Watermark]:
+        """
+        Get the stored watermark for a source.
+        
+        :param source: Source name, e.g. "so:questions" or "confluence:892986628"
+        :return: The Watermark, or None if the source has never completed
+        """
+        data = self.get_state(source)
+        return Watermark.from_dict(data) if data else None
+
+    def set(self, source: str, watermark: Watermark) -> None:
+        """
+        Persist the watermark for a source. Call only after the source completed.
+        
+        :param source: Source name, e.g. "so:questions" or "confluence:892986628"
+        :param watermark: The Watermark to store
+        """
+        self.set_state(source, watermark.to_dict())
+
+
+class JsonFileCheckpointStore(CheckpointStore):
+    def __init__(self, path: str):
+        """
+        Checkpoint store backed by a local JSON file.
+        
+        :param path: Path to the JSON file
+        """
+        self.path = path
+
+    def _load(self) -> Dict[str, Any]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save(self, data: Dict[str, Any]) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=4)
+        # atomic swap so an interrupted write never corrupts the checkpoint
+        os.replace(tmp_path, self.path)
+
+
+class S3CheckpointStore(CheckpointStore):
+    def __init__(self, bucket: str, key: str, aws_client):
+        """
+        Checkpoint store backed by a JSON object in S3.
+        
+        :param bucket: S3 bucket name
+        :param key: Object key of the checkpoint document
+        :param aws_client: AWS helper used to create the S3 client
+        """
+        self.bucket = bucket
+        self.key = key
+        self.s3 = aws_client.get_s3_client()
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            response = self.s3.get_object(Bucket=self.bucket, Key=self.key)
+        except self.s3.exceptions.NoSuchKey:
+            return {}
+        return json.loads(response["Body"].read())
+
+    def _save(self, data: Dict[str, Any]) -> None:
+        self.s3.put_object(Bucket=self.bucket, Key=self.key,
+                           Body=json.dumps(data, indent=4).encode("utf-8"),
+                           ContentType="application/json")
+
+
+def checkpoint_store_from_uri(uri: str, aws_client=None, partition: Optional[str] = None) -> CheckpointStore:
+    """
+    Build a checkpoint store from a location string.
+    
+    :param uri: ``s3://bucket/key`` for S3, anything else is a local file path
+    :param aws_client: AWS helper, required for S3 locations
+    :param partition: Optional name; the state lives in its own document next to uri
+        (``checkpoints.json`` becomes ``checkpoints.{partition}.json``), so workers
+        running at the same time never overwrite each other's state
+    :return: A CheckpointStore
+    """
+    if partition:
+        base, extension = os.path.splitext(uri)
+        uri = f"{base}.{partition}{extension or '.json'}"
+    if uri.startswith("s3://"):
+        bucket, _, key = uri[len("s3://"):].partition("/")
+        return S3CheckpointStore(bucket, key, aws_client)
+    return JsonFileCheckpointStore(uri)
@@ -0,0 +1,253 @@
+from array import array
+from typing import Any, Callable, Dict, List, Optional
+import base64
+import os
+import re
+import threading
+import zlib
+from util.metrics import metrics
+
+_WORD = re.compile(r"\w+")
+_MASK64 = (1 << 64) - 1
+# Fibonacci hashing spreads crc32's linear bits over the whole word
+_GOLDEN = 0x9E3779B97F4A7C15
+
+
+def minhash_signature(text: str, num_perm: int = 64, shingle_words: int = 5) -> Optional[array]:
+    """
+    MinHash signature of a text's word shingles using one-permutation hashing.
+
+    Each shingle is hashed once and lands in one of num_perm buckets, keeping the
+    minimum per bucket; empty buckets borrow from the next filled one (rotation
+    densification). The cost is linear in the text, not in num_perm times the text.
+
+    :param text: Markdown or plain text
+    :param num_perm: Signature length
+    :param shingle_words: Words per shingle
+    :return: array of num_perm uint32 values, or None if the text has no words
+    """
+    words = _WORD.findall(text.lower())
+    if not words:
+        return None
+    shift = 64 - max(1, (num_perm - 1).bit_length())
+    mins = [None] * num_perm
+    for i in range(max(1, len(words) - shingle_words + 1)):
+        shingle = " ".join(words[i:i + shingle_words]).encode("utf-8")
+        h = (zlib.crc32(shingle) * _GOLDEN) & _MASK64
+        bucket = (h >> shift) % num_perm
+        value = h & 0xFFFFFFFF
+        if mins[bucket] is None or value < mins[bucket]:
+            mins[bucket] = value
+    signature = array("I", bytes(4 * num_perm))
+    # walk right to left from a filled bucket, so each empty one borrows from the nearest filled one on its right
+    start = next(i for i, value in enumerate(mins) if value is not None)
+    carry, distance = mins[start], 0
+    for offset in range(num_perm):
+        i = (start - offset) % num_perm
+        if mins[i] is not None:
+            carry, distance = mins[i], 0
+            signature[i] = carry
+        else:
+            # salted with the distance so borrowed values differ from the bucket they came from
+            distance += 1
+            signature[i] = (carry + distance * 0x9E3779B1) & 0xFFFFFFFF
+    return signature
+
+
+def lsh_bands(num_perm: int, threshold: float):
+    """
+    Pick bands x rows for an LSH index whose similarity cut-off is close to threshold.
+
+    A pair sharing one whole band becomes a candidate, which happens around
+    (1/bands) ** (1/rows); the cut-off is kept at or under the threshold so
+    matches are not missed, and the signature comparison does the rest.
+
+    :return: Tuple of (bands, rows)
+    """
+    options = [(num_perm // rows, rows) for rows in range(1, num_perm + 1) if num_perm % rows == 0]
+    below = [option for option in options if (1 / option[0]) ** (1 / option[1]) <= threshold]
+    return max(below or options[:1], key=lambda option: (1 / option[0]) ** (1 / option[1]))
+
+
+def record_text(data: Dict[str, Any]) -> str:
+    """
+    Text of a parsed StackOverflow record that near-duplicates are judged on.
+
+    :param data: Output of QuestionParser / ArticleParser to_clean_json
+    :return: Body Markdown of the record and its answers
+    """
+    parts = [data.get("body_markdown") or ""]
+    parts.extend(answer.get("body_markdown") or "" for answer in data.get("answers") or [])
+    return "\n".join(parts)
+
+
+class Candidate:
+    __slots__ = ("key", "stream", "record_id", "signature", "score", "modified", "losers")
+
+    def __init__(self, key, stream, record_id, signature, score, modified, losers):
+        self.key = key
+        self.stream = stream
+        self.record_id = record_id
+        self.signature = signature
+        self.score = score
+        self.modified = modified
+        self.losers = losers
+
+
+class Deduplicator:
+    POLICIES = ("score", "recent", "first")
+
+    def __init__(self, threshold: float = 0.8, policy: str = "score", num_perm: int = 64,
+                 max_candidates: int = 32, docs: Optional[Dict[str, List[Any]]] = None):
+        """
+        Streaming near-duplicate filter backed by a MinHash LSH index.
+
+        Items are checked before they are written; a near-duplicate of an indexed
+        item is dropped unless the policy prefers it, in which case the indexed
+        copies are handed to on_superseded once the new one is written.
+
+        :param threshold: Estimated Jaccard similarity at which two items are duplicates
+        :param policy: Which copy wins: "score" (highest score), "recent" (latest activity)
+            or "first" (the one indexed first); ties keep the indexed copy
+        :param num_perm: Signature length
+        :param max_candidates: Most LSH candidates compared per item, keeping the per-item cost bounded
+        :param docs: Indexed items from to_dict(), by key
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown dedupe policy: {policy}")
+        self.threshold = threshold
+        self.policy = policy
+        self.num_perm = num_perm
+        self.max_candidates = max_candidates
+        self.bands, self.rows = lsh_bands(num_perm, threshold)
+        # optional callable(stream, record_id, location) removing a superseded copy's output
+        self.on_superseded: Optional[Callable[[str, Any, Optional[str]], None]] = None
+        self._docs: Dict[str, List[Any]] = {}
+        self._buckets = [dict() for _ in range(self.bands)]
+        self._lock = threading.Lock()
+        for key, doc in (docs or {}).items():
+            doc = list(doc)
+            doc[0] = array("I", base64.b64decode(doc[0]))
+            if len(doc[0]) == num_perm:
+                self._index(key, doc)
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def _index(self, key, doc):
+        self._docs[key] = doc
+        for band, band_key in self._band_keys(doc[0]):
+            self._buckets[band].setdefault(band_key, set()).add(key)
+
+    def _unindex(self, key):
+        doc = self._docs.pop(key, None)
+        if doc is None:
+            return None
+        for band, band_key in self._band_keys(doc[0]):
+            bucket = self._buckets[band].get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band][band_key]
+        return doc
+
+    def _beats(self, score, modified, doc) -> bool:
+        if self.policy == "score":
+            return (score if score is not None else float("-inf")) > (doc[1] if doc[1] is not None else float("-inf"))
+        if self.policy == "recent":
+            return (modified or 0) > (doc[2] or 0)
+        return False
+
+    def check(self, stream: str, record_id, text: str, score=None, modified=None) -> Optional[Candidate]:
+        """
+        Decide whether an item should be written.
+
+        :param stream: Sink stream, e.g. "questions" or a Confluence classifier
+        :param record_id: Id of the item within its stream
+        :param text: Markdown the similarity is judged on
+        :param score: Item score, for the "score" policy
+        :param modified: Last activity as epoch seconds, for the "recent" policy
+        :return: Candidate to pass to add() after writing, or None if the item is a duplicate to drop
+        """
+        key = f"{stream}:{record_id}"
+        with metrics.timer("dedupe.check_ms"):
+            signature = minhash_signature(text, self.num_perm)
+        if signature is None:
+            return Candidate(key, stream, record_id, None, score, modified, [])
+        with self._lock:
+            seen = set()
+            matches = []
+            for band, band_key in self._band_keys(signature):
+                for other in self._buckets[band].get(band_key, ()):
+                    if other == key or other in seen:
+                        continue
+                    seen.add(other)
+                    other_signature = self._docs[other][0]
+                    same = sum(1 for a, b in zip(signature, other_signature) if a == b)
+                    if same >= self.threshold * self.num_perm:
+                        matches.append(other)
+                    if len(seen) >= self.max_candidates:
+                        break
+                if len(seen) >= self.max_candidates:
+                    break
+            if any(not self._beats(score, modified, self._docs[other]) for other in matches):
+                metrics.incr("dedupe.dropped")
+                # an earlier version of this item that is now a duplicate goes too
+                previous = self._unindex(key)
+                if previous is not None and self.on_superseded is not None:
+                    self.on_superseded(stream, record_id, previous[5])
+                return None
+        return Candidate(key, stream, record_id, signature, score, modified, matches)
+
+    def add(self, candidate: Candidate, location: Optional[str] = None) -> None:
+        """
+        Index a written item and remove the copies it superseded.
+
+        :param candidate: Result of check()
+        :param location: Where the item was written
+        """
+        if candidate.signature is None:
+            return
+        with self._lock:
+            superseded = [(loser, self._unindex(loser)) for loser in candidate.losers]
+            self._unindex(candidate.key)
+            self._index(candidate.key, [candidate.signature, candidate.score, candidate.modified,
+                                        candidate.stream, candidate.record_id, location])
+        for loser, doc in superseded:
+            if doc is None:
+                continue
+            metrics.incr("dedupe.superseded")
+            if self.on_superseded is not None:
+                self.on_superseded(doc[3], doc[4], doc[5])
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            docs = {key: [base64.b64encode(doc[0].tobytes()).decode("ascii")] + doc[1:]
+                    for key, doc in self._docs.items()}
+        return {"num_perm": self.num_perm, "docs": docs}
+
+
+def dedupe_from_env(load_state: Callable[[], Optional[Dict[str, Any]]]) -> Optional[Deduplicator]:
+    """
+    Build the Deduplicator selected by DEDUPE / DEDUPE_THRESHOLD / DEDUPE_POLICY / DEDUPE_NUM_PERM.
+
+    :param load_state: Returns the index an earlier run persisted via to_dict(), or None;
+        only called when dedupe is enabled
+    :return: A Deduplicator, or None when DEDUPE is not "true"
+    """
+    if os.environ.get("DEDUPE", "false").lower() != "true":
+        return None
+    num_perm = int(os.environ.get("DEDUPE_NUM_PERM", "64"))
+    state = load_state() or {}
+    # signatures of another length can't be compared, so the index starts over
+    docs = state.get("docs") if state.get("num_perm") == num_perm else None
+    return Deduplicator(
+        threshold=float(os.environ.get("DEDUPE_THRESHOLD", "0.8")),
+        policy=os.environ.get("DEDUPE_POLICY", "score"),
+        num_perm=num_perm,
+        docs=docs,
+    )
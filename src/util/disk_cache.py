@@ -0,0 +1,95 @@
+import os
+import tempfile
+import threading
+
+
+class DiskCache:
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024):
+        """
+        Size-bounded on-disk key/value cache with least-recently-used eviction.
+        
+        Each entry is one file named by its key. A hit bumps the file's mtime,
+        and eviction removes the oldest mtimes first, so the cache can be
+        shared by several processes pointing at the same directory.
+        
+        :param directory: Directory holding the cache entries
+        :param max_bytes: Total size the cache is trimmed back under
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in self._entries())
+
+    def _entries(self):
+        for shard in os.scandir(self.directory):
+            if shard.is_dir():
+                for entry in os.scandir(shard.path):
+                    if entry.is_file() and not entry.name.endswith(".tmp"):
+                        yield entry
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key: str):
+        """
+        Read an entry and mark it as recently used.
+        
+        :param key: Hex key of the entry
+        :return: The cached bytes, or None on a miss
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key: str, value: bytes) -> None:
+        """
+        Store an entry, evicting the least recently used ones if over max_bytes.
+        
+        :param key: Hex key of the entry
+        :param value: Bytes to store
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(value)
+        try:
+            # an overwritten entry's bytes leave the cache with it
+            replaced = os.path.getsize(path)
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._size += len(value) - replaced
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # trim to 90% so eviction scans are amortized over many puts
+        target = int(self.max_bytes * 0.9)
+        entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime)
+        size = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if size <= target:
+                break
+            try:
+                size -= entry.stat().st_size
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        self._size = size
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "bytes": self._size}
@@ -1,15 +1,173 @@
+import fnmatch
+import re
+from util.metrics import metrics
+
+GLOB_CHARS = set("*?[")
+
+
+class TagMatcher:
+    def __init__(self, patterns, ignore_case=False):
+        """
+        A set of tag patterns compiled into one hashed lookup plus one regex.
+        
+        :param patterns: Exact tags and glob patterns such as ``gitlab-*``
+        :param ignore_case: Match tags case-insensitively
+        """
+        self.ignore_case = ignore_case
+        exact = set()
+        globs = []
+        for pattern in patterns or []:
+            if ignore_case:
+                pattern = pattern.lower()
+            if GLOB_CHARS.intersection(pattern):
+                globs.append(pattern)
+            else:
+                exact.add(pattern)
+        self.exact = frozenset(exact)
+        self.globs = tuple(globs)
+        self.regex = re.compile("|".join(fnmatch.translate(glob) for glob in globs)) if globs else None
+
+    def __bool__(self):
+        return bool(self.exact or self.globs)
+
+    def normalize(self, tags):
+        return [tag.lower() for tag in tags] if self.ignore_case else tags
+
+    def matches_any(self, tags) -> bool:
+        if not self.exact.isdisjoint(tags):
+            return True
+        return self.regex is not None and any(self.regex.match(tag) for tag in tags)
+
+    def matches_all(self, tags) -> bool:
+        if not self.exact.issubset(tags):
+            return False
+        return all(any(fnmatch.fnmatchcase(tag, glob) for tag in tags) for glob in self.globs)
+
+
 class Filter:
-    def __init__(self, key, values, id_field):
+    def __init__(self, key, values, id_field, all_of=None, none_of=None, ignore_case=False,
+                 min_score=None, since=None, until=None, date_field="creation_date",
+                 is_answered=None, has_accepted_answer=None):
         """
         Initialize the Filter class.
         
+        Rules are compiled once into set lookups and a single regex per tag group,
+        then evaluated cheapest first. A filter without any rule matches nothing.
+        
         :param key: The key field to filter on
-        :param values: A list of strings to match against the key's value
+        :param values: Tags or glob patterns, at least one of which must match the key's value
         :param id_field: The field whose value should be appended to the filtered list
+        :param all_of: Tags or glob patterns that must all match
+        :param none_of: Tags or glob patterns none of which may match
+        :param ignore_case: Match tags case-insensitively
+        :param min_score: Minimum ``score``
+        :param since: Minimum date_field value as epoch seconds
+        :param until: Exclusive maximum date_field value as epoch seconds
+        :param date_field: Item field the date thresholds apply to
+        :param is_answered: Required ``is_answered`` value
+        :param has_accepted_answer: Require the presence (True) or absence (False) of an accepted answer
         """
         self.key = key
         self.values = values
         self.id_field = id_field
+        self.any_of = TagMatcher(values, ignore_case)
+        self.all_of = TagMatcher(all_of, ignore_case)
+        self.none_of = TagMatcher(none_of, ignore_case)
+        self.ignore_case = ignore_case
+        self.min_score = min_score
+        self.since = since
+        self.until = until
+        self.date_field = date_field
+        self.is_answered = is_answered
+        self.has_accepted_answer = has_accepted_answer
+        self._scalar_checks = self._compile_scalar_checks()
+        self._matcher = self._compile()
+
+    def _compile_scalar_checks(self):
+        checks = []
+        if self.min_score is not None:
+            min_score = self.min_score
+            checks.append(lambda item: item.get("score", 0) >= min_score)
+        if self.since is not None or self.until is not None:
+            date_field, since, until = self.date_field, self.since, self.until
+            checks.append(lambda item: item.get(date_field) is not None
+                          and (since is None or item[date_field] >= since)
+                          and (until is None or item[date_field] < until))
+        if self.is_answered is not None:
+            is_answered = self.is_answered
+            checks.append(lambda item: bool(item.get("is_answered")) == is_answered)
+        if self.has_accepted_answer is not None:
+            has_accepted = self.has_accepted_answer
+            checks.append(lambda item: ("accepted_answer_id" in item) == has_accepted)
+        return checks
+
+    def _compile(self):
+        key = self.key
+        if self.is_empty():
+            # an empty any-of rule has never let anything through
+            return lambda item: False
+        if self.is_any_of_only():
+            # the common case gets a single set lookup per item
+            exact = self.any_of.exact
+            return lambda item: isinstance(item, dict) and isinstance(item.get(key), list) \
+                and not exact.isdisjoint(item[key])
+
+        checks = list(self._scalar_checks)
+        tag_checks = []
+        if self.any_of:
+            tag_checks.append(self.any_of.matches_any)
+        if self.all_of:
+            tag_checks.append(self.all_of.matches_all)
+        if self.none_of:
+            none_of = self.none_of
+            tag_checks.append(lambda tags: not none_of.matches_any(tags))
+        normalize = self.any_of.normalize if self.ignore_case else None
+
+        def matcher(item):
+            if not isinstance(item, dict):
+                return False
+            for check in checks:
+                if not check(item):
+                    return False
+            if not tag_checks:
+                return True
+            tags = item.get(key)
+            if not isinstance(tags, list):
+                return False
+            if normalize is not None:
+                tags = normalize(tags)
+            for check in tag_checks:
+                if not check(tags):
+                    return False
+            return True
+        return matcher
+
+    def pushdown_values(self):
+        """
+        The exact any-of values an API can filter on, if the any-of rule is made of exact tags only.
+        
+        :return: List of values in the given order, or None if the rule has globs or is empty
+        """
+        if not self.values or self.any_of.globs:
+            return None
+        return list(self.values)
+
+    def is_empty(self) -> bool:
+        """
+        Check whether the filter has no rules at all, and so matches nothing.
+        
+        :return: True if no item can pass
+        """
+        return not (self.any_of or self.all_of or self.none_of or self._scalar_checks)
+
+    def is_any_of_only(self) -> bool:
+        """
+        Check whether the filter is nothing more than a case-sensitive any-of tag rule.
+        
+        :return: True if server-side tag filtering alone reproduces it
+        """
+        return (bool(self.any_of) and not self.any_of.globs and not self.all_of and not self.none_of
+                and not self.ignore_case and not self._scalar_checks)
 
     def do_filter(self, items):
         """
@@ -18,13 +176,33 @@ class Filter:
         :param items: A list of dictionaries to filter
         :return: A filtered list containing only the id_field values
         """
-        filtered_items = []
+        with metrics.timer("filter_ms"):
+            ids = list(self.iter_filter(items))
+        metrics.incr("filter.matched", len(ids))
+        return ids
 
+    def iter_filter(self, items, index=None):
+        """
+        Stream the id_field values of matching items.
+        
+        :param items: An iterable of dictionaries to filter, consumed lazily
+        :param index: Optional dict filled in the same pass with tag -> list of matching ids
+        :return: Generator of id_field values
+        """
+        matcher = self._matcher
         for item in items:
-            if isinstance(item, dict) and self.key in item:
-                # Check if item[self.key] is a list and has at least one value in self.values
-                if isinstance(item[self.key], list) and any(value in self.values for value in item[self.key]):
-                    if self.id_field in item:
-                        filtered_items.append(item[self.id_field])
+            if matcher(item) and self.id_field in item:
+                item_id = item[self.id_field]
+                if index is not None:
+                    for tag in item.get(self.key) or []:
+                        index.setdefault(tag, []).append(item_id)
+                yield item_id
 
-        return filtered_items
\ No newline at end of file
+    def matches(self, item):
+        """
+        Check whether a single item passes the filter.
+        
+        :param item: A dictionary to check
+        :return: True if the item passes every rule
+        """
+        return self._matcher(item)
@@ -0,0 +1,168 @@
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import hashlib
+import json
+import os
+import time
+import requests
+from util.disk_cache import DiskCache
+from util.metrics import metrics
+
+
+class CachedResponse:
+    def __init__(self, status_code: int, headers: Dict[str, str], content: bytes, url: str = ""):
+        """
+        A recorded response, answering the parts of requests.Response the API clients use.
+
+        :param status_code: HTTP status
+        :param headers: Response headers that were kept
+        :param content: Response body
+        :param url: Request URL, for error messages
+        """
+        self.status_code = status_code
+        self.headers = requests.structures.CaseInsensitiveDict(headers)
+        self.content = content
+        self.url = url
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8")
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+    def raise_for_status(self) -> None:
+        if not self.ok:
+            raise requests.HTTPError(f"{self.status_code} Error from the HTTP cache for url: {self.url}",
+                                     response=self)
+
+
+class HttpCache:
+    MODES = ("record", "replay")
+    # query parameters carrying credentials; they never become part of a key or a recorded entry
+    SECRET_PARAMS = frozenset({"key", "access_token", "api_key", "token"})
+    # the only response headers the clients read
+    KEPT_HEADERS = ("ETag", "Content-Type")
+
+    def __init__(self, directory: str, mode: str = "record", ttl_seconds: float = 24 * 3600,
+                 max_bytes: int = 1024 * 1024 * 1024):
+        """
+        Disk-backed record/replay cache for API GET requests.
+
+        ``record`` answers from entries younger than ttl_seconds and records
+        every other successful response; ``replay`` never touches the network,
+        answering a miss with 504 like an ``only-if-cached`` HTTP cache would.
+
+        :param directory: Directory holding the recorded responses
+        :param mode: "record" or "replay"
+        :param ttl_seconds: Age after which record mode fetches an entry again; replay ignores it
+        :param max_bytes: Total size the cache is trimmed back under, least recently used first
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown HTTP cache mode: {mode}")
+        self.mode = mode
+        self.ttl_seconds = ttl_seconds
+        self.store = DiskCache(directory, max_bytes)
+
+    @classmethod
+    def key(cls, url: str, params: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Key of a request: the URL with its query merged with params, secrets dropped and sorted.
+
+        :param url: Request URL, possibly carrying a query string
+        :param params: Query parameters sent alongside
+        :return: Hex key
+        """
+        parts = urlsplit(url)
+        query = parse_qsl(parts.query, keep_blank_values=True)
+        query.extend((name, str(value)) for name, value in (params or {}).items() if value is not None)
+        query = sorted((name, value) for name, value in query if name not in cls.SECRET_PARAMS)
+        normalized = urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, urlencode(query), ""))
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = self.store.get(key)
+        if raw is None:
+            return None
+        header, _, content = raw.partition(b"\n")
+        entry = json.loads(header)
+        entry["content"] = content
+        return entry
+
+    def _save(self, key: str, status: int, headers: Dict[str, str], content: bytes) -> None:
+        headers = {name: headers[name] for name in self.KEPT_HEADERS if name in headers}
+        header = json.dumps({"status": status, "headers": headers, "recorded_at": time.time()})
+        self.store.put(key, header.encode("utf-8") + b"\n" + content)
+
+    def get(self, session: requests.Session, url: str, params: Optional[Dict[str, Any]] = None,
+            headers: Optional[Dict[str, str]] = None, timeout: float = 30):
+        """
+        Send a GET through the cache.
+
+        An ``If-None-Match`` matching the recorded ETag is answered with 304. In
+        record mode a stale entry is revalidated with its own ETag; without any
+        entry the conditional header is dropped so the full body gets recorded.
+
+        :param session: requests.Session used on a miss
+        :param url: Request URL
+        :param params: Query parameters
+        :param headers: Request headers
+        :param timeout: Request timeout in seconds
+        :return: A requests.Response or CachedResponse
+        """
+        key = self.key(url, params)
+        entry = self._load(key)
+        etag = (headers or {}).get("If-None-Match")
+        if entry is not None and (self.mode == "replay" or time.time() - entry["recorded_at"] < self.ttl_seconds):
+            metrics.incr("http_cache.hits")
+            cached = CachedResponse(entry["status"], entry["headers"], entry["content"], url)
+            if etag and etag == cached.headers.get("ETag"):
+                return CachedResponse(304, {"ETag": etag}, b"", url)
+            return cached
+        metrics.incr("http_cache.misses")
+        if self.mode == "replay":
+            return CachedResponse(504, {"Content-Type": "application/json"},
+                                  json.dumps({"error": "not recorded in the HTTP cache"}).encode("utf-8"), url)
+
+        request_headers = {name: value for name, value in (headers or {}).items() if name != "If-None-Match"}
+        recorded_etag = entry["headers"].get("ETag") if entry is not None else None
+        if recorded_etag:
+            request_headers["If-None-Match"] = recorded_etag
+        response = session.get(url, params=params, headers=request_headers or None, timeout=timeout)
+        if response.status_code == 304 and entry is not None:
+            # still current: keep the recorded body and restart its TTL
+            metrics.incr("http_cache.revalidated")
+            self._save(key, entry["status"], entry["headers"], entry["content"])
+            if etag and etag == recorded_etag:
+                return CachedResponse(304, {"ETag": etag}, b"", url)
+            return CachedResponse(entry["status"], entry["headers"], entry["content"], url)
+        if response.status_code == 200:
+            self._save(key, response.status_code, response.headers, response.content)
+        return response
+
+
+_http_cache = None
+
+
+def get_http_cache() -> Optional[HttpCache]:
+    """
+    Shared HTTP cache configured from HTTP_CACHE_MODE / HTTP_CACHE_DIR / HTTP_CACHE_TTL_SECONDS / HTTP_CACHE_MAX_MB.
+
+    :return: The HttpCache, or None when HTTP_CACHE_MODE is "off"
+    """
+    global _http_cache
+    mode = os.environ.get("HTTP_CACHE_MODE", "off")
+    if mode == "off":
+        return None
+    if _http_cache is None or _http_cache.mode != mode:
+        _http_cache = HttpCache(
+            os.environ.get("HTTP_CACHE_DIR", "/tmp/http_cache"),
+            mode,
+            ttl_seconds=float(os.environ.get("HTTP_CACHE_TTL_SECONDS", str(24 * 3600))),
+            max_bytes=int(os.environ.get("HTTP_CACHE_MAX_MB", "1024")) * 1024 * 1024,
+        )
+    return _http_cache
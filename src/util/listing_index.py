@@ -0,0 +1,128 @@
+from array import array
+from typing import Any, Dict, Iterator, Optional, Tuple
+import sys
+
+
+class ListingIndex:
+    __slots__ = ("id_field", "ids", "activity", "tags", "_tag_sets")
+
+    def __init__(self, id_field: str):
+        """
+        Compact store for discovered listing items: parallel arrays of ids and activity times.
+
+        Ids and timestamps take 8 bytes each instead of a dict per item, and tag
+        lists are kept as interned tuples shared by every item with the same tags.
+
+        :param id_field: The field holding each item's id, e.g. "question_id"
+        """
+        self.id_field = id_field
+        self.ids = array("q")
+        # last_activity_date per id, 0 when the listing left it out
+        self.activity = array("q")
+        self.tags = []
+        self._tag_sets: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+    def add(self, item: Dict[str, Any]) -> None:
+        """
+        Record one listing item; every field but the id, tags and last_activity_date is dropped.
+
+        :param item: Listing item dict
+        """
+        self.ids.append(item[self.id_field])
+        self.activity.append(item.get("last_activity_date") or 0)
+        tags = tuple(sys.intern(tag) for tag in item.get("tags") or ())
+        self.tags.append(self._tag_sets.setdefault(tags, tags))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.ids)
+
+    def records(self) -> Iterator[Tuple[int, Tuple[str, ...], Optional[int]]]:
+        """
+        :return: Generator of (id, tags, last_activity_date) in listing order
+        """
+        for item_id, tags, activity in zip(self.ids, self.tags, self.activity):
+            yield item_id, tags, activity or None
+
+
+_EMPTY = -(1 << 63)
+_MASK64 = (1 << 64) - 1
+# Fibonacci hashing spreads runs of consecutive ids over the whole table
+_GOLDEN = 0x9E3779B97F4A7C15
+
+
+class IdSet:
+    __slots__ = ("_table", "_bits", "_size", "_other")
+
+    def __init__(self, bits: int = 10):
+        """
+        Set of int64 ids kept in one open-addressed array, 16 to 32 bytes per id instead of a set of boxed ints.
+
+        Ids that are not 64-bit ints go to an ordinary set.
+
+        :param bits: log2 of the initial table size
+        """
+        self._bits = bits
+        self._table = array("q", [_EMPTY]) * (1 << bits)
+        self._size = 0
+        self._other = set()
+
+    def add(self, item_id) -> bool:
+        """
+        :param item_id: Id to add
+        :return: True if the id was not in the set yet
+        """
+        if type(item_id) is not int or not _EMPTY < item_id < (1 << 63):
+            if item_id in self._other:
+                return False
+            self._other.add(item_id)
+            return True
+        if not self._insert(item_id):
+            return False
+        self._size += 1
+        if self._size * 2 > len(self._table):
+            self._grow()
+        return True
+
+    def _slot(self, item_id: int) -> int:
+        return ((item_id * _GOLDEN) & _MASK64) >> (64 - self._bits)
+
+    def _insert(self, item_id: int) -> bool:
+        table = self._table
+        mask = len(table) - 1
+        slot = self._slot(item_id)
+        while True:
+            current = table[slot]
+            if current == item_id:
+                return False
+            if current == _EMPTY:
+                table[slot] = item_id
+                return True
+            slot = (slot + 1) & mask
+
+    def _grow(self) -> None:
+        old = self._table
+        self._bits += 1
+        self._table = array("q", [_EMPTY]) * (1 << self._bits)
+        for item_id in old:
+            if item_id != _EMPTY:
+                self._insert(item_id)
+
+    def __contains__(self, item_id) -> bool:
+        if type(item_id) is not int or not _EMPTY < item_id < (1 << 63):
+            return item_id in self._other
+        table = self._table
+        mask = len(table) - 1
+        slot = self._slot(item_id)
+        while True:
+            current = table[slot]
+            if current == item_id:
+                return True
+            if current == _EMPTY:
+                return False
+            slot = (slot + 1) & mask
+
+    def __len__(self) -> int:
+        return self._size + len(self._other)
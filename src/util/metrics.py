@@ -0,0 +1,157 @@
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+import json
+import math
+import os
+import threading
+import time
+
+
+class Histogram:
+    # buckets are sqrt(2) apart, which keeps a latency histogram well under EMF's 100 distinct values
+    STEPS_PER_DOUBLING = 2
+
+    def __init__(self):
+        self.buckets: Dict[float, int] = {}
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if value > 0:
+            bucket = 2 ** (round(math.log2(value) * self.STEPS_PER_DOUBLING) / self.STEPS_PER_DOUBLING)
+        else:
+            bucket = 0.0
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, fraction: float) -> float:
+        target = fraction * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= target:
+                return min(max(bucket, self.min), self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {"count": self.count, "sum": round(self.sum, 3), "min": round(self.min, 3),
+                "max": round(self.max, 3), "p50": round(self.percentile(0.5), 3),
+                "p90": round(self.percentile(0.9), 3), "p99": round(self.percentile(0.99), 3)}
+
+    def emf_value(self) -> Dict[str, Any]:
+        buckets = sorted(self.buckets)
+        return {"Values": [round(bucket, 6) for bucket in buckets], "Counts": [self.buckets[b] for b in buckets],
+                "Min": self.min, "Max": self.max, "Count": self.count, "Sum": self.sum}
+
+
+class Metrics:
+    def __init__(self):
+        """
+        Process-wide counters, gauges and histograms for one invocation.
+
+        Everything is kept in memory and written out once by emit(), so hot paths
+        only pay for a dict update under a lock.
+        """
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counters: Dict[str, float] = {}
+            self.gauges: Dict[str, float] = {}
+            self.histograms: Dict[str, Histogram] = {}
+            self.units: Dict[str, str] = {}
+
+    def incr(self, name: str, value: float = 1, unit: str = "Count") -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            self.units[name] = unit
+
+    def gauge(self, name: str, value: float, unit: str = "None") -> None:
+        with self.lock:
+            self.gauges[name] = value
+            self.units[name] = unit
+
+    def observe(self, name: str, value: float, unit: str = "Milliseconds") -> None:
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(value)
+            self.units[name] = unit
+
+    @contextmanager
+    def timer(self, name: str):
+        """
+        Time a block into the ``name`` histogram, in milliseconds.
+
+        :param name: Histogram name, e.g. "so.request_ms"
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000)
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Plain summary of everything recorded, with derived rates.
+
+        :return: Dict of counters, gauges and histogram summaries
+        """
+        with self.lock:
+            data: Dict[str, Any] = dict(self.counters)
+            data.update(self.gauges)
+            for name, histogram in self.histograms.items():
+                data[name] = histogram.summary()
+        return data
+
+    def emf(self, namespace: str, dimensions: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """
+        Build a CloudWatch Embedded Metric Format document.
+
+        :param namespace: CloudWatch namespace
+        :param dimensions: Dimension names and values, e.g. {"Function": "ingestion"}
+        :return: The EMF document
+        """
+        dimensions = dimensions or {}
+        document: Dict[str, Any] = dict(dimensions)
+        definitions = []
+        with self.lock:
+            for name, value in list(self.counters.items()) + list(self.gauges.items()):
+                document[name] = value
+                definitions.append({"Name": name, "Unit": self.units.get(name, "None")})
+            for name, histogram in self.histograms.items():
+                document[name] = histogram.emf_value()
+                definitions.append({"Name": name, "Unit": self.units.get(name, "None")})
+        document["_aws"] = {
+            "Timestamp": int(time.time() * 1000),
+            # EMF allows at most 100 metrics per directive
+            "CloudWatchMetrics": [{"Namespace": namespace, "Dimensions": [list(dimensions)],
+                                   "Metrics": definitions[i:i + 100]} for i in range(0, len(definitions), 100)],
+        }
+        return document
+
+    def emit(self, namespace: str = "StackOverflowIngestion", dimensions: Optional[Dict[str, str]] = None) -> None:
+        """
+        Print the EMF document as one log line, which CloudWatch turns into metrics.
+        """
+        print(json.dumps(self.emf(namespace, dimensions)))
+
+
+metrics = Metrics()
+
+
+def log_item(message: str) -> None:
+    """
+    Per-item log line, only printed when LOG_ITEMS is true.
+
+    :param message: The line to print
+    """
+    if os.environ.get("LOG_ITEMS", "false").lower() == "true":
+        print(message)
@@ -0,0 +1,96 @@
+from typing import Dict, Any, List, Optional, Tuple
+
+
+class PageManifest:
+    def __init__(self, pages: Optional[Dict[str, Dict[str, Any]]] = None):
+        """
+        What was written for every Confluence page on earlier runs.
+
+        Each entry holds the page's version number, last-modified time, ETag, the
+        starting page and classifier it was saved under and where the output went.
+        Pages seen during a run are tracked so the ones that disappeared from a
+        starting page's subtree can be pruned afterwards.
+
+        :param pages: Entries by page id, as produced by to_dict
+        """
+        self.pages = dict(pages or {})
+        self.seen = set()
+        # entries per output location, so is_referenced needs no scan of every page
+        self._locations: Dict[str, int] = {}
+        for entry in self.pages.values():
+            self._reference(entry.get("location"), 1)
+
+    def _reference(self, location: Optional[str], delta: int) -> None:
+        if location is None:
+            return
+        count = self._locations.get(location, 0) + delta
+        if count > 0:
+            self._locations[location] = count
+        else:
+            self._locations.pop(location, None)
+
+    def has_root(self, root: str) -> bool:
+        return any(entry.get("root") == root for entry in self.pages.values())
+
+    def is_current(self, page_id: str, version: Optional[int], classifier: str) -> bool:
+        """
+        Check whether the saved output of a page is still up to date.
+
+        :param page_id: Id of the page
+        :param version: The page's current version number
+        :param classifier: Classifier the page is being saved under now
+        :return: True if the page was saved at this version under this classifier
+        """
+        entry = self.pages.get(page_id)
+        return (entry is not None and version is not None and entry.get("version") == version
+                and entry.get("classifier") == classifier)
+
+    def etag(self, page_id: str) -> Optional[str]:
+        return self.pages.get(page_id, {}).get("etag")
+
+    def mark_seen(self, page_id: str) -> None:
+        self.seen.add(page_id)
+
+    def record(self, page_id: str, version: Optional[int], modified: Optional[int], root: str, classifier: str,
+               location: str, etag: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Store the entry of a page that was just saved.
+
+        :return: The previous entry if the page was saved somewhere else before, so its output can be removed
+        """
+        previous = self.pages.get(page_id)
+        if previous is not None:
+            self._reference(previous.get("location"), -1)
+        self._reference(location, 1)
+        self.pages[page_id] = {"version": version, "modified": modified, "root": root,
+                               "classifier": classifier, "location": location, "etag": etag}
+        self.seen.add(page_id)
+        if previous is not None and previous.get("location") != location:
+            return previous
+        return None
+
+    def stale(self, roots) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Entries under the given starting pages that were not seen during this run.
+
+        :param roots: Ids of the starting pages whose subtrees were listed completely
+        :return: List of (page_id, entry) for deleted or moved-away pages
+        """
+        roots = set(roots)
+        return [(page_id, entry) for page_id, entry in self.pages.items()
+                if entry.get("root") in roots and page_id not in self.seen]
+
+    def forget(self, page_id: str) -> None:
+        entry = self.pages.pop(page_id, None)
+        if entry is not None:
+            self._reference(entry.get("location"), -1)
+
+    def is_referenced(self, location: str) -> bool:
+        return location in self._locations
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"pages": self.pages}
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "PageManifest":
+        return cls((data or {}).get("pages"))
@@ -0,0 +1,154 @@
+from util.listing_index import IdSet, ListingIndex
+from util.metrics import metrics
+
+
+class ListingCursor:
+    def __init__(self, query: int = 0, page: int = 1, stop=None):
+        """
+        Position in a QueryPlan's listings, so a stopped listing can resume where it left off.
+
+        The page only moves past a listing page once every item on it was handed
+        to the consumer, so a consumer that drains everything it was given can
+        save the cursor and resume without gaps.
+
+        :param query: Index of the plan query being listed
+        :param page: Next page of that query to fetch
+        :param stop: Optional callable; when it returns True no further page is fetched
+        """
+        self.query = query
+        self.page = page
+        self.stop = stop
+        self.stopped = False
+
+    def should_stop(self) -> bool:
+        if self.stop is not None and self.stop():
+            self.stopped = True
+        return self.stopped
+
+    def to_dict(self):
+        return {"query": self.query, "page": self.page}
+
+    @classmethod
+    def from_dict(cls, data, stop=None) -> "ListingCursor":
+        data = data or {}
+        return cls(query=data.get("query", 0), page=data.get("page", 1), stop=stop)
+
+
+class QueryPlan:
+    def __init__(self, queries, id_field, residual_filter=None):
+        """
+        A set of listing queries whose results are unioned into one id list.
+        
+        :param queries: List of extra query parameter dicts, one listing call each
+        :param id_field: The field holding each item's id
+        :param residual_filter: Filter applied client-side for predicates the API can't express
+        """
+        self.queries = queries
+        self.id_field = id_field
+        self.residual_filter = residual_filter
+
+    def fetch_ids(self, list_fn, extra_params=None):
+        """
+        Run every query and union the matching ids, dropping duplicates.
+        
+        :param list_fn: Listing method accepting a ``params`` dict, e.g. StackOverflow.iter_questions
+        :param extra_params: Parameters added to every query, e.g. an activity window
+        :return: List of ids in first-seen order
+        """
+        return list(self.iter_ids(list_fn, extra_params))
+
+    def discover(self, list_fn, extra_params=None, cursor=None) -> ListingIndex:
+        """
+        Collect the union of matching ids into a compact ListingIndex.
+        
+        :param list_fn: Listing method accepting a ``params`` dict, ideally a stub listing
+            such as StackOverflow.iter_question_stubs
+        :param extra_params: Parameters added to every query, e.g. an activity window
+        :param cursor: Optional ListingCursor to resume from and advance
+        :return: ListingIndex of the matching items in first-seen order
+        """
+        index = ListingIndex(self.id_field)
+        for item in self.iter_items(list_fn, extra_params, cursor):
+            index.add(item)
+        return index
+
+    def iter_ids(self, list_fn, extra_params=None, cursor=None):
+        """
+        Stream the union of matching ids as each listing page arrives.
+        
+        :param list_fn: Listing method accepting a ``params`` dict, e.g. StackOverflow.iter_questions
+        :param extra_params: Parameters added to every query, e.g. an activity window
+        :param cursor: Optional ListingCursor to resume from and advance
+        :return: Generator of ids in first-seen order
+        """
+        for item in self.iter_items(list_fn, extra_params, cursor):
+            yield item[self.id_field]
+
+    def iter_items(self, list_fn, extra_params=None, cursor=None):
+        """
+        Stream the union of matching listing items, dropping duplicate ids.
+        
+        With a cursor, listing starts at the cursor's query and page and stops
+        once the cursor says so; list_fn must then accept a ``cursor`` argument.
+        Duplicates are only dropped within one run, not across a resume.
+        
+        :param list_fn: Listing method accepting a ``params`` dict, e.g. StackOverflow.iter_questions
+        :param extra_params: Parameters added to every query, e.g. an activity window
+        :param cursor: Optional ListingCursor to resume from and advance
+        :return: Generator of items in first-seen order
+        """
+        seen = IdSet()
+        for index, query in enumerate(self.queries):
+            params = dict(query, **(extra_params or {}))
+            if cursor is None:
+                listing = list_fn(params=params)
+            elif index < cursor.query:
+                continue
+            else:
+                if index > cursor.query:
+                    cursor.query, cursor.page = index, 1
+                listing = list_fn(params=params, cursor=cursor)
+            for item in listing:
+                if self.id_field not in item:
+                    continue
+                if self.residual_filter is not None and not self.residual_filter.matches(item):
+                    metrics.incr("filter.rejected")
+                    continue
+                if seen.add(item[self.id_field]):
+                    yield item
+            if cursor is not None and cursor.stopped:
+                return
+
+
+class QueryPlanner:
+    # item fields the API can filter on server side, mapped to their query parameter
+    PUSHDOWN_PARAMS = {"tags": "tagged"}
+
+    def plan(self, item_filter):
+        """
+        Turn a Filter into API-side listing queries.
+        
+        The API ANDs the tags inside one ``tagged=`` value, so "any of" tag
+        filters become one query per tag. Glob patterns can't be pushed down and
+        fall back to a full listing filtered client-side; any other rules stay
+        behind as a residual filter on the narrowed listings.
+        
+        :param item_filter: The Filter to push down
+        :return: A QueryPlan
+        """
+        if item_filter.is_empty():
+            # nothing can match, so nothing is listed
+            return QueryPlan([], item_filter.id_field, residual_filter=item_filter)
+        param = self.PUSHDOWN_PARAMS.get(item_filter.key)
+        values = item_filter.pushdown_values()
+        if param is None or not values:
+            return QueryPlan([{}], item_filter.id_field, residual_filter=item_filter)
+
+        queries = []
+        seen = set()
+        for value in values:
+            if value not in seen:
+                seen.add(value)
+                queries.append({param: value})
+        residual_filter = None if item_filter.is_any_of_only() else item_filter
+        return QueryPlan(queries, item_filter.id_field, residual_filter=residual_filter)
@@ -0,0 +1,142 @@
+from typing import Any, Callable, Dict, Optional
+import os
+import random
+import threading
+import time
+from util.metrics import metrics
+
+
+class RequestScheduler:
+    def __init__(self, rate: float = 25.0, burst: int = 5, low_quota: int = 1000, min_rate_fraction: float = 0.1,
+                 max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        """
+        Token bucket every StackOverflow request waits on, shared across threads.
+
+        At most burst + rate requests go out in any one second; StackExchange bans
+        an IP sending more than 30, so the defaults stay just under that. A method
+        answering with ``backoff`` is not called again until it has passed, and a
+        throttle violation pauses every method. Once quota_remaining drops under
+        low_quota, the rate shrinks with it, down to min_rate_fraction of rate.
+
+        :param rate: Requests per second
+        :param burst: Requests that may go out at once after an idle spell
+        :param low_quota: quota_remaining under which the rate is scaled down
+        :param min_rate_fraction: Smallest share of rate kept however low the quota gets
+        :param max_retries: Retries of a throttled, rate-limited or failed request
+        :param base_delay: First retry delay in seconds, doubled on every further retry
+        :param max_delay: Longest retry delay
+        :param clock: Monotonic clock, replaceable for tests
+        :param sleep: Sleep function, replaceable for tests
+        """
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.low_quota = low_quota
+        self.min_rate_fraction = min_rate_fraction
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.sleep = sleep
+        self.quota_remaining: Optional[int] = None
+        self._tokens = float(self.burst)
+        self._updated = clock()
+        # per method: clock time before which it must not be called, from the backoff field
+        self._backoff: Dict[str, float] = {}
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "RequestScheduler":
+        """
+        Scheduler configured from STACKOVERFLOW_RATE_LIMIT / STACKOVERFLOW_BURST /
+        STACKOVERFLOW_MAX_RETRIES / STACKOVERFLOW_LOW_QUOTA.
+        """
+        return cls(
+            rate=float(os.environ.get("STACKOVERFLOW_RATE_LIMIT", "25")),
+            burst=int(os.environ.get("STACKOVERFLOW_BURST", "5")),
+            max_retries=int(os.environ.get("STACKOVERFLOW_MAX_RETRIES", "5")),
+            low_quota=int(os.environ.get("STACKOVERFLOW_LOW_QUOTA", "1000")),
+        )
+
+    def current_rate(self) -> float:
+        if self.quota_remaining is None or self.quota_remaining >= self.low_quota:
+            return self.rate
+        return self.rate * max(self.min_rate_fraction, self.quota_remaining / max(1, self.low_quota))
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.current_rate())
+        self._updated = now
+
+    def acquire(self, method: str) -> None:
+        """
+        Block until a request to method may go out.
+
+        :param method: API method, e.g. "questions/{ids}/answers"
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._refill(now)
+                wait = max(self._paused_until, self._backoff.get(method, 0.0)) - now
+                if wait <= 0:
+                    # refills land a rounding error short of a whole token; waiting that out never ends on a coarse clock
+                    if self._tokens >= 1 - 1e-9:
+                        self._tokens -= 1
+                        break
+                    wait = (1 - self._tokens) / self.current_rate()
+            self.sleep(wait)
+            waited += wait
+        if waited:
+            metrics.incr("so.scheduler_wait_seconds", waited, unit="Seconds")
+
+    def observe(self, method: str, data: Dict[str, Any]) -> None:
+        """
+        Take in the backoff and quota fields of a response wrapper.
+
+        :param method: API method the response came from
+        :param data: Decoded response
+        """
+        with self._lock:
+            if data.get("backoff"):
+                metrics.incr("so.backoffs")
+                self._backoff[method] = max(self._backoff.get(method, 0.0), self.clock() + float(data["backoff"]))
+            if "quota_remaining" in data:
+                self.quota_remaining = data["quota_remaining"]
+
+    def pause(self, seconds: float) -> None:
+        """
+        Hold every method back, after the API said too many requests were sent.
+
+        :param seconds: How long to hold off
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, self.clock() + seconds)
+            self._tokens = 0.0
+
+    def retry_delay(self, attempt: int, minimum: float = 0.0) -> float:
+        """
+        Jittered exponential delay before a retry.
+
+        :param attempt: 0 for the first retry
+        :param minimum: Delay the API asked for, if any
+        :return: Seconds to wait
+        """
+        ceiling = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return max(minimum, random.uniform(ceiling / 2, ceiling))
+
+
+_scheduler = None
+
+
+def get_request_scheduler() -> RequestScheduler:
+    """
+    The process-wide scheduler, so every StackOverflow client and thread shares one rate limit.
+
+    :return: The RequestScheduler
+    """
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = RequestScheduler.from_env()
+    return _scheduler
@@ -0,0 +1,229 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+import hashlib
+import json
+from util.metrics import metrics
+from util.sink import ShardedJsonlSink, _Shard
+
+# S3 rejects parts under 5 MiB, except the last one
+MIN_PART_BYTES = 5 * 1024 * 1024
+
+
+class _MultipartUpload:
+    def __init__(self, s3, bucket: str, key: str, upload_id: str, executor: ThreadPoolExecutor,
+                 part_bytes: int, max_concurrency: int, parts: Optional[List[Dict[str, Any]]] = None):
+        """
+        File-like writer buffering bytes in memory and sending them as multipart upload parts.
+
+        At most max_concurrency parts are in flight; a write that would exceed that
+        waits for the oldest one, so memory stays under (max_concurrency + 1) parts.
+
+        :param parts: Parts an interrupted invocation already uploaded, when resuming
+        """
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.upload_id = upload_id
+        self.executor = executor
+        self.part_bytes = max(MIN_PART_BYTES, part_bytes)
+        self.max_concurrency = max(1, max_concurrency)
+        self.parts = list(parts or [])
+        self.position = sum(part["Size"] for part in self.parts)
+        self.buffer = bytearray()
+        self.pending = deque()
+        # called with each part's marker once it and every part before it are uploaded
+        self.on_durable: Optional[Callable[[Any], None]] = None
+
+    def write(self, data: bytes) -> None:
+        self.buffer += data
+        self.position += len(data)
+        if self.pending:
+            # record progress as soon as parts finish, not only when the next one is sent
+            self._harvest()
+
+    def tell(self) -> int:
+        return self.position
+
+    def full(self) -> bool:
+        return len(self.buffer) >= self.part_bytes
+
+    def _upload_part(self, part_number: int, body: bytes) -> Dict[str, Any]:
+        with metrics.timer("s3.upload_part_ms"):
+            response = self.s3.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                           PartNumber=part_number, Body=body)
+        metrics.incr("s3.bytes_uploaded", len(body), unit="Bytes")
+        return {"PartNumber": part_number, "ETag": response["ETag"], "Size": len(body),
+                "sha256": hashlib.sha256(body).hexdigest()}
+
+    def flush_part(self, marker: Any = None) -> None:
+        """
+        Send the buffered bytes as the next part.
+
+        :param marker: Handed to on_durable once this part is uploaded
+        """
+        part_number = len(self.parts) + len(self.pending) + 1
+        body = bytes(self.buffer)
+        self.buffer = bytearray()
+        self.pending.append((self.executor.submit(self._upload_part, part_number, body), marker))
+        self._harvest(wait=len(self.pending) >= self.max_concurrency)
+
+    def _harvest(self, wait: bool = False) -> None:
+        # only the oldest parts are taken, so the uploaded parts are always a contiguous prefix
+        durable = None
+        while self.pending and (wait or self.pending[0][0].done()):
+            future, marker = self.pending.popleft()
+            self.parts.append(future.result())
+            durable = marker if marker is not None else durable
+            wait = len(self.pending) >= self.max_concurrency
+        if durable is not None and self.on_durable is not None:
+            self.on_durable(durable)
+
+    def close(self) -> None:
+        if self.buffer or not (self.parts or self.pending):
+            self.flush_part()
+        while self.pending:
+            self._harvest(wait=True)
+        self.s3.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+            MultipartUpload={"Parts": [{"PartNumber": part["PartNumber"], "ETag": part["ETag"]}
+                                       for part in self.parts]})
+
+
+class _S3Shard(_Shard):
+    def __init__(self, path: str, compression: Optional[str], block_bytes: int, upload: _MultipartUpload,
+                 save_state: Callable[[Dict[str, Any]], None], state: Optional[Dict[str, Any]] = None):
+        """
+        A JSONL shard streamed into a multipart upload.
+
+        Whenever a prefix of parts is uploaded, the records and blocks they hold are
+        saved through save_state, so an interrupted invocation can be resumed from
+        them. A resumed shard has no whole-object sha256, only per-part ones.
+
+        :param state: State saved by an interrupted invocation, when resuming
+        """
+        self.upload = upload
+        self.save_state = save_state
+        super().__init__(path, compression, block_bytes)
+        self.resumed = state is not None
+        if state is not None:
+            self.records = state["records"]
+            self.blocks = state["blocks"]
+            self.offset = self.block_offset = state["offset"]
+        upload.on_durable = self._durable
+
+    def _open(self):
+        return self.upload
+
+    def _commit(self) -> None:
+        pass
+
+    def _write(self, data: bytes) -> None:
+        super()._write(data)
+        if self.upload.full():
+            # whole lines / blocks are written at once, so parts always end on a record boundary
+            self.upload.flush_part((len(self.records), len(self.blocks), self.offset))
+
+    def _durable(self, marker) -> None:
+        records, blocks, offset = marker
+        self.save_state({
+            # records handed to the shard so far, durable or not, so a resume can tell how many it lost
+            "accepted": len(self.records),
+            "upload_id": self.upload.upload_id,
+            "path": self.path,
+            "compression": self.compression,
+            "parts": self.upload.parts,
+            "offset": offset,
+            "records": self.records[:records],
+            "blocks": self.blocks[:blocks],
+        })
+
+    def close(self) -> Dict[str, Any]:
+        manifest = super().close()
+        manifest["parts"] = [{"size": part["Size"], "sha256": part["sha256"]} for part in self.upload.parts]
+        if self.resumed:
+            manifest["sha256"] = None
+        return manifest
+
+
+class S3JsonlSink(ShardedJsonlSink):
+    def __init__(self, bucket: str, prefix: str, aws_client, compression: Optional[str] = None,
+                 max_bytes: int = 128 * 1024 * 1024, max_records: int = 0, block_bytes: int = 1024 * 1024,
+                 part_bytes: int = 8 * 1024 * 1024, max_concurrency: int = 4, writer: str = "default"):
+        """
+        JSONL shards streamed straight into S3: ``s3://{bucket}/{prefix}/{stream}/part-{run}-{seq}.jsonl[.gz|.zst]``.
+
+        Nothing is staged on local disk. Each shard is one multipart upload and
+        gets a ``.manifest.json`` object like ShardedJsonlSink writes. Progress of
+        each open upload is kept in ``{prefix}/_uploads/{writer}/{stream}.json``; a
+        sink with the same prefix and writer picks an interrupted upload back up
+        instead of starting over. Configure an AbortIncompleteMultipartUpload
+        lifecycle rule for uploads that are never resumed.
+
+        :param bucket: S3 bucket name
+        :param prefix: Key prefix everything is written under
+        :param aws_client: AWS helper used to create the S3 client
+        :param part_bytes: Bytes buffered per part, at least 5 MiB
+        :param max_concurrency: Parts uploaded at once per shard
+        :param writer: Name scoping the resumable state, so concurrent writers never share an upload
+        """
+        super().__init__(f"s3://{bucket}/{prefix}".rstrip("/"), compression, max_bytes, max_records, block_bytes)
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.s3 = aws_client.get_s3_client()
+        self.part_bytes = part_bytes
+        self.max_concurrency = max_concurrency
+        self.writer = writer
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency))
+
+    def _key(self, *parts: str) -> str:
+        return "/".join(part for part in (self.prefix,) + parts if part)
+
+    def _state_key(self, stream: str) -> str:
+        return self._key("_uploads", self.writer, f"{stream}.json")
+
+    def _load_state(self, stream: str) -> Optional[Dict[str, Any]]:
+        try:
+            response = self.s3.get_object(Bucket=self.bucket, Key=self._state_key(stream))
+        except self.s3.exceptions.NoSuchKey:
+            return None
+        state = json.loads(response["Body"].read())
+        if state.get("compression") != self.compression:
+            return None
+        key = state["path"][len(f"s3://{self.bucket}/"):]
+        try:
+            self.s3.list_parts(Bucket=self.bucket, Key=key, UploadId=state["upload_id"], MaxParts=1)
+        except self.s3.exceptions.NoSuchUpload:
+            return None
+        return state
+
+    def _open_shard(self, stream: str) -> _Shard:
+        def save_state(state):
+            self.s3.put_object(Bucket=self.bucket, Key=self._state_key(stream),
+                               Body=json.dumps(state).encode("utf-8"), ContentType="application/json")
+
+        state = self._load_state(stream)
+        if state is not None:
+            metrics.incr("s3.uploads_resumed")
+            path = state["path"]
+            key = path[len(f"s3://{self.bucket}/"):]
+            upload_id = state["upload_id"]
+            # records accepted after the last uploaded part were only ever in the killed invocation's memory
+            dropped = state.get("accepted", len(state["records"])) - len(state["records"])
+            metrics.incr("s3.records_dropped_on_resume", dropped)
+            print(f"Resuming upload of {path} after {len(state['records'])} records, "
+                  f"dropping at least {dropped} records accepted after its last uploaded part")
+        else:
+            key = self._key(stream, self._shard_name())
+            path = f"s3://{self.bucket}/{key}"
+            upload_id = self.s3.create_multipart_upload(Bucket=self.bucket, Key=key)["UploadId"]
+        upload = _MultipartUpload(self.s3, self.bucket, key, upload_id, self.executor, self.part_bytes,
+                                  self.max_concurrency, parts=state["parts"] if state else None)
+        return _S3Shard(path, self.compression, self.block_bytes, upload, save_state, state)
+
+    def _write_manifest(self, shard: _Shard, manifest: Dict[str, Any]) -> None:
+        key = shard.path[len(f"s3://{self.bucket}/"):]
+        self.s3.put_object(Bucket=self.bucket, Key=f"{key}.manifest.json",
+                           Body=json.dumps(manifest).encode("utf-8"), ContentType="application/json")
+        stream = key[len(self._key()):].strip("/").split("/")[0]
+        self.s3.delete_object(Bucket=self.bucket, Key=self._state_key(stream))
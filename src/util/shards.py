@@ -0,0 +1,134 @@
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import json
+import time
+
+
+class Deadline:
+    def __init__(self, context, reserve_seconds: float = 60):
+        """
+        Tells a worker when to stop taking on work so it can finish before Lambda kills it.
+
+        :param context: The Lambda context; None never expires
+        :param reserve_seconds: Time kept back to drain in-flight items, close the sink and save state
+        """
+        self.context = context
+        self.reserve_ms = reserve_seconds * 1000
+
+    def remaining_ms(self) -> Optional[float]:
+        if self.context is None:
+            return None
+        return self.context.get_remaining_time_in_millis()
+
+    def expired(self) -> bool:
+        remaining = self.remaining_ms()
+        return remaining is not None and remaining < self.reserve_ms
+
+
+class LocalContext:
+    def __init__(self, timeout_seconds: float = 900, function_name: str = "local"):
+        """
+        Stand-in for the Lambda context when shards run in-process.
+
+        :param timeout_seconds: Simulated function timeout, counted from creation
+        :param function_name: Reported as the metrics dimension
+        """
+        self.function_name = function_name
+        self.deadline = time.monotonic() + timeout_seconds
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(0, int((self.deadline - time.monotonic()) * 1000))
+
+
+class WorkQueue(ABC):
+    @abstractmethod
+    def put_many(self, events: List[Dict[str, Any]]) -> None:
+        """
+        Enqueue events, each invoking the handler once.
+
+        :param events: JSON-serializable event dicts
+        """
+        pass
+
+    def put(self, event: Dict[str, Any]) -> None:
+        self.put_many([event])
+
+
+class LocalWorkQueue(WorkQueue):
+    def __init__(self):
+        """
+        In-process queue, drained by calling the handler for each event in turn.
+        """
+        self.events = deque()
+
+    def put_many(self, events: List[Dict[str, Any]]) -> None:
+        # round-trip through JSON so local runs see exactly what SQS would deliver
+        self.events.extend(json.loads(json.dumps(event)) for event in events)
+
+    def drain(self, handler: Callable, context_factory: Callable = LocalContext) -> List[Any]:
+        """
+        Run the handler on every queued event, including events enqueued while draining.
+
+        :param handler: The Lambda handler
+        :param context_factory: Builds a fresh context for each event
+        :return: The handler's responses, in order
+        """
+        responses = []
+        while self.events:
+            responses.append(handler(self.events.popleft(), context_factory()))
+        return responses
+
+
+class SqsWorkQueue(WorkQueue):
+    # send_message_batch accepts at most 10 messages
+    BATCH_SIZE = 10
+
+    def __init__(self, queue_url: str, aws_client):
+        """
+        Queue backed by SQS; the handler is subscribed to it as an event source.
+
+        :param queue_url: URL of the SQS queue
+        :param aws_client: AWS helper used to create the SQS client
+        """
+        self.queue_url = queue_url
+        self.sqs = aws_client.get_sqs_client()
+
+    def put_many(self, events: List[Dict[str, Any]]) -> None:
+        for i in range(0, len(events), self.BATCH_SIZE):
+            entries = [{"Id": str(n), "MessageBody": json.dumps(event)}
+                       for n, event in enumerate(events[i:i + self.BATCH_SIZE])]
+            response = self.sqs.send_message_batch(QueueUrl=self.queue_url, Entries=entries)
+            if response.get("Failed"):
+                raise RuntimeError(f"Failed to enqueue {len(response['Failed'])} shard events: {response['Failed']}")
+
+
+def work_queue_from_uri(uri: Optional[str], aws_client=None) -> WorkQueue:
+    """
+    Build a work queue from a location string.
+
+    :param uri: An SQS queue URL, or empty for an in-process queue
+    :param aws_client: AWS helper, required for SQS
+    :return: A WorkQueue
+    """
+    if uri:
+        return SqsWorkQueue(uri, aws_client)
+    return LocalWorkQueue()
+
+
+def split_windows(since: int, until: int, step: int) -> List[Tuple[int, int]]:
+    """
+    Split [since, until) into consecutive windows of at most step seconds.
+
+    :param since: Epoch seconds, inclusive
+    :param until: Epoch seconds, exclusive
+    :param step: Window length in seconds
+    :return: List of (since, until) pairs
+    """
+    step = max(1, step)
+    return [(start, min(start + step, until)) for start in range(since, until, step)]
+
+
+def chunks(items: List[Any], size: int) -> Iterable[List[Any]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
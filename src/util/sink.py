@@ -0,0 +1,310 @@
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+import gzip
+import hashlib
+import itertools
+import json
+import os
+
+
+class OutputSink(ABC):
+    # True when writing an item again supersedes every earlier write of it to the same stream,
+    # wherever that went; False when an earlier write at another location stays until deleted
+    rewrites_supersede = False
+    # True when read_record can return records written by earlier runs
+    reads_records = False
+
+    @abstractmethod
+    def write_record(self, stream: str, record_id, data: Dict[str, Any]) -> str:
+        """
+        Write one parsed item.
+
+        :param stream: Output stream, e.g. "questions"
+        :param record_id: Id of the item
+        :param data: Output of a parser's to_clean_json
+        :return: Where the record was written, for logging
+        """
+        pass
+
+    @abstractmethod
+    def write_document(self, stream: str, record_id, title: str, markdown: str) -> str:
+        """
+        Write one Markdown document, e.g. a Confluence page.
+
+        :param stream: Output stream, e.g. the page classifier
+        :param record_id: Id of the document
+        :param title: Document title
+        :param markdown: Document body as Markdown
+        :return: Where the document was written, for logging
+        """
+        pass
+
+    @abstractmethod
+    def delete(self, stream: str, record_id, location: str) -> None:
+        """
+        Remove an item that no longer exists upstream.
+
+        :param stream: Output stream the item was written to
+        :param record_id: Id of the item
+        :param location: Location returned when the item was written
+        """
+        pass
+
+    def close(self) -> None:
+        """
+        Make everything written so far durable. The sink stays usable afterwards.
+        """
+        pass
+
+    def read_record(self, stream: str, record_id) -> Optional[Dict[str, Any]]:
+        """
+        Read back a record written by an earlier run, so it can be updated in place.
+
+        :param stream: Output stream, e.g. "questions"
+        :param record_id: Id of the item
+        :return: The record, or None if it can't be found; sinks that can't look records up always return None
+        """
+        return None
+
+
+class FileSink(OutputSink):
+    reads_records = True
+
+    def __init__(self, directory: str):
+        """
+        One file per item: ``{directory}/{stream}/{id}.json`` and ``{directory}/{stream}/{title}.md``.
+
+        :param directory: Root output directory
+        """
+        self.directory = directory
+
+    def _stream_dir(self, stream: str) -> str:
+        path = os.path.join(self.directory, stream)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def write_record(self, stream: str, record_id, data: Dict[str, Any]) -> str:
+        outfile = os.path.join(self._stream_dir(stream), f"{record_id}.json")
+        with open(outfile, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+        return outfile
+
+    def read_record(self, stream: str, record_id) -> Optional[Dict[str, Any]]:
+        path = os.path.join(self.directory, stream, f"{record_id}.json")
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def write_document(self, stream: str, record_id, title: str, markdown: str) -> str:
+        filename = title.replace(" ", "_").replace("/", "and") + ".md"
+        outfile = os.path.join(self._stream_dir(stream), filename)
+        with open(outfile, "w", encoding="utf-8") as f:
+            f.write(f"# {title}\n\n")
+            f.write(markdown)
+        return outfile
+
+    def delete(self, stream: str, record_id, location: str) -> None:
+        if os.path.exists(location):
+            os.remove(location)
+
+
+class _Shard:
+    def __init__(self, path: str, compression: Optional[str], block_bytes: int):
+        """
+        A JSONL shard being written, plus the manifest entries for it.
+
+        Compressed shards are a series of independent gzip members / zstd frames of
+        about block_bytes each, so a reader can seek to one block and decompress only it.
+        """
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.compression = compression
+        self.block_bytes = block_bytes
+        self.file = self._open()
+        self.sha256 = hashlib.sha256()
+        self.records: List[Dict[str, Any]] = []
+        self.blocks: List[Dict[str, int]] = []
+        self.offset = 0  # uncompressed bytes written
+        self.block = bytearray()
+        self.block_offset = 0  # uncompressed offset where the current block starts
+
+    def _open(self):
+        return open(self.tmp_path, "wb")
+
+    def _commit(self) -> None:
+        os.replace(self.tmp_path, self.path)
+
+    def append(self, record_id, line: bytes) -> int:
+        entry = {"id": record_id, "offset": self.offset, "length": len(line),
+                 "sha256": hashlib.sha256(line).hexdigest()}
+        self.records.append(entry)
+        self.offset += len(line)
+        if self.compression:
+            entry["block"] = len(self.blocks)
+            self.block += line
+            if len(self.block) >= self.block_bytes:
+                self._flush_block()
+        else:
+            self._write(line)
+        return entry["offset"]
+
+    def _write(self, data: bytes) -> None:
+        self.file.write(data)
+        self.sha256.update(data)
+
+    def _flush_block(self) -> None:
+        if not self.block:
+            return
+        if self.compression == "gzip":
+            data = gzip.compress(bytes(self.block), mtime=0)
+        else:
+            import zstandard
+            data = zstandard.ZstdCompressor().compress(bytes(self.block))
+        self.blocks.append({"offset": self.file.tell(), "length": len(data),
+                            "uncompressed_offset": self.block_offset, "uncompressed_length": len(self.block)})
+        self._write(data)
+        self.block_offset = self.offset
+        self.block = bytearray()
+
+    def close(self) -> Dict[str, Any]:
+        if self.compression:
+            self._flush_block()
+        size = self.file.tell()
+        self.file.close()
+        self._commit()
+        manifest = {
+            "shard": os.path.basename(self.path),
+            "compression": self.compression,
+            "count": len(self.records),
+            "bytes": size,
+            "uncompressed_bytes": self.offset,
+            "sha256": self.sha256.hexdigest(),
+            "records": self.records,
+        }
+        if self.compression:
+            manifest["blocks"] = self.blocks
+        return manifest
+
+
+class ShardedJsonlSink(OutputSink):
+    EXTENSIONS = {None: ".jsonl", "gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+    # readers keep the last record per id in a stream, so a rewrite needs no tombstone for the old one
+    rewrites_supersede = True
+    # shared by every sink in the process, so sinks opened within the same second never reuse a name
+    _sequence = itertools.count()
+
+    def __init__(self, directory: str, compression: Optional[str] = None, max_bytes: int = 128 * 1024 * 1024,
+                 max_records: int = 0, block_bytes: int = 1024 * 1024):
+        """
+        JSONL shards per stream: ``{directory}/{stream}/part-{run}-{seq}.jsonl[.gz|.zst]``.
+
+        Every shard gets a ``.manifest.json`` next to it listing each record's id,
+        uncompressed byte offset, length and sha256, plus the shard checksum. Shards
+        are written under a temporary name and renamed into place when closed.
+
+        :param directory: Root output directory
+        :param compression: None, "gzip" or "zstd" (needs the zstandard package)
+        :param max_bytes: Roll over to a new shard after this many uncompressed bytes
+        :param max_records: Roll over to a new shard after this many records, 0 for no limit
+        :param block_bytes: Uncompressed size of each independently compressed block
+        """
+        if compression not in self.EXTENSIONS:
+            raise ValueError(f"Unsupported output compression: {compression}")
+        if compression == "zstd":
+            import zstandard  # noqa: F401 - fail at startup rather than on the first block
+        self.directory = directory
+        self.compression = compression
+        self.max_bytes = max_bytes
+        self.max_records = max_records
+        self.block_bytes = block_bytes
+        self.run_id = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{os.getpid()}"
+        self._shards: Dict[str, _Shard] = {}
+
+    def _shard(self, stream: str) -> _Shard:
+        shard = self._shards.get(stream)
+        if shard is None:
+            shard = self._shards[stream] = self._open_shard(stream)
+        return shard
+
+    def _shard_name(self) -> str:
+        return f"part-{self.run_id}-{next(self._sequence):05d}{self.EXTENSIONS[self.compression]}"
+
+    def _open_shard(self, stream: str) -> _Shard:
+        stream_dir = os.path.join(self.directory, stream)
+        os.makedirs(stream_dir, exist_ok=True)
+        return _Shard(os.path.join(stream_dir, self._shard_name()), self.compression, self.block_bytes)
+
+    def _append(self, stream: str, record_id, data: Dict[str, Any]) -> str:
+        line = (json.dumps(data, ensure_ascii=False) + "\n").encode("utf-8")
+        shard = self._shard(stream)
+        offset = shard.append(record_id, line)
+        location = f"{shard.path}@{offset}"
+        if shard.offset >= self.max_bytes or (self.max_records and len(shard.records) >= self.max_records):
+            self._close_shard(stream)
+        return location
+
+    def _close_shard(self, stream: str) -> None:
+        shard = self._shards.pop(stream)
+        self._write_manifest(shard, shard.close())
+
+    def _write_manifest(self, shard: _Shard, manifest: Dict[str, Any]) -> None:
+        manifest_path = f"{shard.path}.manifest.json"
+        tmp_path = f"{manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, manifest_path)
+
+    def write_record(self, stream: str, record_id, data: Dict[str, Any]) -> str:
+        return self._append(stream, record_id, data)
+
+    def write_document(self, stream: str, record_id, title: str, markdown: str) -> str:
+        return self._append(stream, record_id, {"id": record_id, "title": title, "markdown": markdown})
+
+    def delete(self, stream: str, record_id, location: str) -> None:
+        # shards are immutable, so deletions are tombstone records readers apply in order
+        self._append(stream, record_id, {"id": record_id, "deleted": True})
+
+    def close(self) -> None:
+        for stream in list(self._shards):
+            self._close_shard(stream)
+
+
+def output_sink_from_env(directory: str, aws_client=None, writer: Optional[str] = None) -> OutputSink:
+    """
+    Build the output sink selected by OUTPUT_SINK ("files" or "jsonl").
+
+    An ``s3://bucket/prefix`` directory always gets JSONL shards streamed
+    straight into S3 multipart uploads.
+
+    :param directory: Root output directory, or an S3 location
+    :param aws_client: AWS helper, required for S3 locations
+    :param writer: Name of whoever writes here, S3 only: an interrupted upload is
+        resumed by the next sink with the same location and writer
+    :return: An OutputSink
+    """
+    if directory.startswith("s3://"):
+        from util.s3_sink import S3JsonlSink
+        bucket, _, prefix = directory[len("s3://"):].partition("/")
+        return S3JsonlSink(
+            bucket, prefix, aws_client,
+            compression=os.environ.get("OUTPUT_COMPRESSION") or None,
+            max_bytes=int(os.environ.get("OUTPUT_SHARD_MAX_MB", "128")) * 1024 * 1024,
+            max_records=int(os.environ.get("OUTPUT_SHARD_MAX_RECORDS", "0")),
+            part_bytes=int(os.environ.get("OUTPUT_S3_PART_MB", "8")) * 1024 * 1024,
+            max_concurrency=int(os.environ.get("OUTPUT_S3_CONCURRENCY", "4")),
+            writer=writer or "default",
+        )
+    kind = os.environ.get("OUTPUT_SINK", "files")
+    if kind == "files":
+        return FileSink(directory)
+    if kind == "jsonl":
+        return ShardedJsonlSink(
+            directory,
+            compression=os.environ.get("OUTPUT_COMPRESSION") or None,
+            max_bytes=int(os.environ.get("OUTPUT_SHARD_MAX_MB", "128")) * 1024 * 1024,
+            max_records=int(os.environ.get("OUTPUT_SHARD_MAX_RECORDS", "0")),
+        )
+    raise ValueError(f"Unknown OUTPUT_SINK: {kind}")